@@ -1,21 +1,33 @@
 import json
-import os
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select, update, desc, func, tuple_
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 
 from database import get_db
 from models import Student, Grade, SecurityAlert, Title as TitleModel, Teacher, Group
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 # ИМПОРТЫ ЛОГИКИ (Убедитесь, что файлы созданы в папке logic!)
 from logic.elo_system import calculate_academic_change
-from logic.ai_service import get_ai_analysis
-
-# --- НАСТРОЙКА МОСТА С C++ ---
-EXCHANGE_PATH = "C:/Users/alexl/PycharmProjects/SPECTRUM/exchange/data_in.json"
-os.makedirs(os.path.dirname(EXCHANGE_PATH), exist_ok=True)
+from logic.ai_service import get_ai_analysis, stream_ai_analysis, AiStreamError, load_student_context, ai_metrics
+from logic.ai_cache import ai_response_cache
+from logic.llm_scheduler import llm_scheduler
+from logic.ai_summaries import at_risk_statement, summary_worker
+from logic.cpp_bridge import exchange_writer
+from logic.grade_rollups import apply_grade_rollups
+from logic.grade_ingest import resolve_task_type, MIN_GRADE, MAX_GRADE
+from logic.cache_invalidation import grades_written, alerts_written
+from logic.achievements_logic import check_achievements, publish_unlocks, GRADES, ELO
+from logic.dashboard_stats import dashboard_snapshot
+from logic.teachers_load import get_teachers_load as load_teachers_load
+from logic.leaderboard import student_leaderboard
+from logic.social_graph import social_graph, LOD_NODE_THRESHOLD
+from utils.common import clean_student_name
+from utils.pagination import encode_cursor, decode_cursor
 
 router = APIRouter()
 
@@ -56,19 +68,7 @@ async def ask_ai_endpoint(request: AiChatRequest, db: AsyncSession = Depends(get
     """
     context = None
     if request.student_id:
-        # Если есть ID, ищем студента
-        res = await db.execute(select(Student).where(Student.id == request.student_id))
-        student = res.scalar_one_or_none()
-        if student:
-            # Формируем контекст для ИИ
-            context = {
-                "id": student.id,
-                "name": student.full_name,
-                "group": student.group_name,  # Предполагается, что это поле есть
-                "elo": student.elo_rating,
-                "gpa": student.gpa,  # Это поле должно быть в модели Student
-                "risk": student.risk_score
-            }
+        context = await load_student_context(db, request.student_id)
 
     # Отправляем запрос в AI-сервис
     response_text = await get_ai_analysis(request.message, context)
@@ -76,11 +76,55 @@ async def ask_ai_endpoint(request: AiChatRequest, db: AsyncSession = Depends(get
     return {"response": response_text}
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/ask-ai/stream")
+async def ask_ai_stream(request: AiChatRequest, db: AsyncSession = Depends(get_db)):
+    """
+    То же, что /ask-ai, но ответ идет по мере генерации (Server-Sent Events):
+    event: token {"text"} ... event: done | event: error {"text"}.
+    Закрытие соединения клиентом отменяет генерацию в llama.cpp.
+    Переполненная очередь к LLM — 503 до начала стрима.
+    """
+    llm_scheduler.check_admission()
+    context = await load_student_context(db, request.student_id) if request.student_id else None
+
+    async def events():
+        try:
+            async for piece in stream_ai_analysis(request.message, context):
+                yield _sse("token", {"text": piece})
+            yield _sse("done", {})
+        except AiStreamError as e:
+            yield _sse("error", {"text": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/ai/metrics")
+async def get_ai_metrics():
+    """
+    Тайминги запросов к LLM: connect (только новые соединения), TTFB, total;
+    hit rate кэша ответов; очередь планировщика (глубина, ожидание по приоритетам); фоновые сводки.
+    """
+    return {
+        **ai_metrics.summary(),
+        "cache": await ai_response_cache.summary(),
+        "scheduler": llm_scheduler.summary(),
+        "summaries": summary_worker.summary(),
+    }
+
+
 # Схема для выставления оценки (с ELO)
 class GradeCreate(BaseModel):
     student_id: int
     subject: str
-    grade: int  # 2, 3, 4, 5
+    grade: int = Field(ge=MIN_GRADE, le=MAX_GRADE)  # 2, 3, 4, 5
     task_type: str = "EXAM"  # EXAM, TEST, HOMEWORK
 
 
@@ -91,20 +135,29 @@ async def get_at_risk_students(limit: int = 10, db: AsyncSession = Depends(get_d
     """
     Возвращает топ студентов риска и сбрасывает данные в C++ для "анализа".
     """
-    query = select(Student).order_by(desc(Student.risk_score)).limit(limit)
+    query = at_risk_statement(limit)
     result = await db.execute(query)
     students = result.scalars().all()
 
+    # Оценки всех выбранных студентов одним запросом, группируем в Python
+    grades_by_student = {student.id: [] for student in students}
+    res_g = await db.execute(
+        select(Grade.student_id, Grade.score)
+        .where(Grade.student_id.in_(grades_by_student))
+        .order_by(Grade.student_id, Grade.id)
+    )
+    for student_id, score in res_g.all():
+        grades_by_student[student_id].append(score)
+
     risk_profiles = []
     cpp_export_data = {"students": []}
 
     for student in students:
-        res_g = await db.execute(select(Grade).where(Grade.student_id == student.id))
-        grades = res_g.scalars().all()
-        grades_list = [g.score for g in grades] if grades else []
+        grades_list = grades_by_student[student.id]
 
         factors = []
-        avg_score = sum(grades_list) / len(grades_list) if grades_list else 0
+        # Средний балл из роллапа (без пересчета по grades)
+        avg_score = student.grades_sum / student.grades_count if student.grades_count else 0
 
         if avg_score < 60: factors.append("Low academic performance")
         if student.stat_int < 50: factors.append("Potential burnout detected")
@@ -131,11 +184,8 @@ async def get_at_risk_students(limit: int = 10, db: AsyncSession = Depends(get_d
             "attendance": float(student.stat_sta)
         })
 
-    try:
-        with open(EXCHANGE_PATH, "w") as f:
-            json.dump(cpp_export_data, f)
-    except Exception as e:
-        print(f"⚠ C++ Bridge Error: {e}")
+    # Запись для C++ — в фоне, не блокируя event loop (параллельные запросы схлопываются)
+    exchange_writer.submit(cpp_export_data)
 
     return risk_profiles
 
@@ -146,67 +196,53 @@ async def get_all_titles(db: AsyncSession = Depends(get_db)):
     return res.scalars().all()
 
 @router.get("/social-graph")
-async def get_social_graph(db: AsyncSession = Depends(get_db)):
-    q = (
-        select(
-            Student.id,
-            Student.full_name,
-            Group.name.label("group_name")
-        )
-        .join(Group, Group.id == Student.group_id)
-        .limit(300)
-    )
-    rows = (await db.execute(q)).all()
-    return [
-        {
-            "id": r.id,
-            "full_name": r.full_name,
-            "group_name": r.group_name,
-        }
-        for r in rows
-    ]
-
-
-@router.get("/dashboard-stats")
-async def get_dashboard_stats(db: AsyncSession = Depends(get_db)):
-    # Всего студентов
-    res = await db.execute(select(func.count(Student.id)))
-    total_students = res.scalar() or 0
-
-    # Активные алерты
-    res_alerts = await db.execute(select(func.count(SecurityAlert.id)).where(SecurityAlert.is_resolved == False))
-    active_alerts = res_alerts.scalar() or 0
+async def get_social_graph(
+        response: Response,
+        offset: int = Query(0, ge=0),
+        limit: int = Query(300, ge=1, le=5000),
+        lod: str = Query("auto", pattern="^(auto|node|group)$"),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Граф студентов: узлы [offset, offset + limit) по id, у каждого — связи (links).
+    lod=group сворачивает группы в супер-узлы; auto — если студентов больше LOD_NODE_THRESHOLD.
+    Всего узлов и следующая страница — в заголовках X-Total-Nodes / X-Next-Offset.
+    """
+    graph = await social_graph.get(db)
+    if lod == "auto":
+        lod = "group" if len(graph) > LOD_NODE_THRESHOLD else "node"
 
-    # Integrity: 100% минус 5% за каждый активный алерт
-    integrity = max(0, 100 - (active_alerts * 5))
+    if lod == "group":
+        total = graph.group_order.size
+        nodes = social_graph.group_nodes(graph, offset, limit)
+    else:
+        total = len(graph)
+        nodes = social_graph.nodes_page(graph, offset, limit)
 
-    # Средний балл
-    res_grades = await db.execute(select(func.avg(Grade.score)))
-    avg_grade = res_grades.scalar() or 0
-    gpa = round(avg_grade / 20, 2)
+    response.headers["X-Graph-Lod"] = lod
+    response.headers["X-Total-Nodes"] = str(total)
+    if offset + limit < total:
+        response.headers["X-Next-Offset"] = str(offset + limit)
+    return nodes
 
-    # Neural Load (среднее число студентов на группу)
-    # Просто для дашборда
-    neural_load = 0
-    if total_students > 0:
-        neural_load = round(total_students / 100, 1) # условный коэффициент
 
-    return {
-        "total_students": total_students,
-        "active_courses": 8, # заглушка или count(groups)
-        "avg_attendance_rate": integrity, # Используем integrity как показатель здоровья
-        "system_health_index": integrity,
-        "avg_gpa": gpa,
-        "users_connected": total_students,
-        "neural_load": neural_load,
-        "active_nodes": 16 # заглушка или count(teachers)
-    }
+@router.get("/dashboard-stats")
+async def get_dashboard_stats():
+    # Снимок из кэша: один SELECT на всех опрашивающих (см. logic/dashboard_stats.py)
+    return await dashboard_snapshot.get()
 
 
 @router.get("/alerts")
-async def get_active_alerts(db: AsyncSession = Depends(get_db)):
+async def get_active_alerts(
+        response: Response,
+        limit: int = Query(50, ge=1, le=500),
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_db),
+):
     """
-    Возвращает нерешённые алерты с информацией о студенте и группе.
+    Возвращает нерешённые алерты с информацией о студенте и группе (новые сверху).
+    Keyset-пагинация по (created_at, id) через частичный индекс нерешенных:
+    следующая страница — ?cursor=<X-Next-Cursor>.
     """
     query = (
         select(
@@ -222,11 +258,17 @@ async def get_active_alerts(db: AsyncSession = Depends(get_db)):
         .join(Student, Student.id == SecurityAlert.student_id, isouter=True)
         .join(Group, Group.id == Student.group_id, isouter=True)
         .where(SecurityAlert.is_resolved == False)
-        .order_by(SecurityAlert.created_at.desc())
-        .limit(50)
+        .order_by(SecurityAlert.created_at.desc(), SecurityAlert.id.desc())
+        .limit(limit + 1)
     )
+    if cursor:
+        before_at, before_id = decode_cursor(cursor)
+        query = query.where(tuple_(SecurityAlert.created_at, SecurityAlert.id) < tuple_(before_at, before_id))
 
     rows = (await db.execute(query)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
 
     return [
         {
@@ -243,62 +285,62 @@ async def get_active_alerts(db: AsyncSession = Depends(get_db)):
     ]
 
 
+class AlertBulkUpdate(BaseModel):
+    alert_ids: List[int] = []
+    student_id: Optional[int] = None  # все алерты студента
+
+
+async def _set_alerts_resolved(data: AlertBulkUpdate, resolved: bool, db: AsyncSession) -> dict:
+    if not data.alert_ids and data.student_id is None:
+        raise HTTPException(status_code=400, detail="Provide alert_ids or student_id")
+    if len(data.alert_ids) > 10_000:
+        raise HTTPException(status_code=413, detail="Too many alert ids (max 10000)")
+
+    stmt = update(SecurityAlert).where(SecurityAlert.is_resolved == (not resolved))
+    if data.alert_ids:
+        stmt = stmt.where(SecurityAlert.id.in_(data.alert_ids))
+    if data.student_id is not None:
+        stmt = stmt.where(SecurityAlert.student_id == data.student_id)
+    try:
+        res = await db.execute(
+            stmt.values(is_resolved=resolved)
+            .returning(SecurityAlert.id)
+            .execution_options(synchronize_session=False)
+        )
+    except IntegrityError:
+        # uq_security_alerts_open_cpp_student: у студента уже есть открытый алерт C++ анализатора
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Student already has an open C++ analyzer alert")
+    updated = res.scalars().all()
+    await db.commit()
+    if updated:
+        alerts_written()
+    return {"status": "success", "updated": len(updated), "alert_ids": updated}
+
+
+@router.post("/alerts/resolve")
+async def resolve_alerts(data: AlertBulkUpdate, db: AsyncSession = Depends(get_db)):
+    """Закрыть пачку алертов (по id и/или все алерты студента) одним UPDATE."""
+    return await _set_alerts_resolved(data, True, db)
+
+
+@router.post("/alerts/unresolve")
+async def unresolve_alerts(data: AlertBulkUpdate, db: AsyncSession = Depends(get_db)):
+    """Вернуть алерты в ленту."""
+    return await _set_alerts_resolved(data, False, db)
+
+
 @router.get("/teachers-load")
-async def get_teachers_load(db: AsyncSession = Depends(get_db)):
+async def get_teachers_load(response: Response, db: AsyncSession = Depends(get_db)):
     """
     Neural Load Nodes: реальная нагрузка (Student -> Group -> Teacher).
+    Откуда и насколько свежие данные — в заголовках X-Load-*.
     """
-    res_t = await db.execute(select(Teacher))
-    teachers = res_t.scalars().all()
-
-    if not teachers:
-        return []
-
-    # Считаем группы
-    res_g = await db.execute(
-        select(Group.curator_id, func.count(Group.id))
-        .where(Group.curator_id.isnot(None))
-        .group_by(Group.curator_id)
-    )
-    groups_map = {r[0]: r[1] for r in res_g.all()}
-
-    # Считаем студентов
-    res_s = await db.execute(
-        select(Group.curator_id, func.count(Student.id))
-        .join(Student, Student.group_id == Group.id)
-        .where(Group.curator_id.isnot(None))
-        .group_by(Group.curator_id)
-    )
-    students_map = {r[0]: r[1] for r in res_s.all()}
-
-    result = []
-    NODE_CAPACITY = 80
-
-    for t in teachers:
-        g_cnt = groups_map.get(t.id, 0)
-        s_cnt = students_map.get(t.id, 0)
-
-        load_val = round((s_cnt / NODE_CAPACITY) * 100) if NODE_CAPACITY else 0
-
-        if load_val > 110:
-            status = "OVERLOAD"
-        elif load_val > 85:
-            status = "HIGH"
-        elif load_val < 30:
-            status = "IDLE"
-        else:
-            status = "OPTIMAL"
-
-        result.append({
-            "id": t.id,
-            "name": t.full_name,
-            "students": s_cnt,
-            "groups": g_cnt,
-            "load": load_val,
-            "status": status
-        })
-
-    result.sort(key=lambda x: x['load'], reverse=True)
+    result, meta = await load_teachers_load(db)
+    response.headers["X-Load-Source"] = meta["source"]
+    if meta["refreshed_at"] is not None:
+        response.headers["X-Load-Refreshed-At"] = meta["refreshed_at"].isoformat()
+        response.headers["X-Load-Refresh-Ms"] = str(meta["refresh_ms"])
     return result
 
 
@@ -307,10 +349,17 @@ async def get_top_best_students(limit: int = 10, db: AsyncSession = Depends(get_
     """
     Топ студентов по ELO рейтингу.
     """
-    # Сортируем по elo_rating по убыванию
-    query = select(Student).order_by(Student.elo_rating.desc()).limit(limit)
-    res = await db.execute(query)
-    students = res.scalars().all()
+    if student_leaderboard.ready:
+        # Порядок — из in-memory таблицы лидеров, из БД только строки топа по PK (ради risk_score)
+        ids = [entry["id"] for entry in student_leaderboard.top(limit)]
+        res = await db.execute(select(Student).where(Student.id.in_(ids)))
+        by_id = {s.id: s for s in res.scalars().all()}
+        students = [by_id[i] for i in ids if i in by_id]
+    else:
+        # Сортируем по elo_rating по убыванию
+        query = select(Student).order_by(Student.elo_rating.desc()).limit(limit)
+        res = await db.execute(query)
+        students = res.scalars().all()
 
     output = []
     for s in students:
@@ -325,6 +374,36 @@ async def get_top_best_students(limit: int = 10, db: AsyncSession = Depends(get_
 
     return output
 
+
+# --- ТАБЛИЦА ЛИДЕРОВ (in-memory, без запросов к БД) ---
+
+def _require_leaderboard():
+    if not student_leaderboard.ready:
+        raise HTTPException(status_code=503, detail="Leaderboard is loading, try again shortly")
+
+
+@router.get("/leaderboard")
+async def get_leaderboard(limit: int = Query(10, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """Места offset+1 .. offset+limit по ELO."""
+    _require_leaderboard()
+    return student_leaderboard.top(limit, offset)
+
+
+@router.get("/leaderboard/student/{student_id}")
+async def get_student_rank(student_id: int, around: int = Query(5, ge=0, le=100)):
+    """Место студента и `around` соседей выше и ниже."""
+    _require_leaderboard()
+    result = student_leaderboard.around(student_id, around)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return result
+
+
+@router.get("/leaderboard/group/{group_id}")
+async def get_group_leaderboard(group_id: int, limit: int = Query(50, ge=1, le=500)):
+    _require_leaderboard()
+    return student_leaderboard.group_top(group_id, limit)
+
 # --- НОВЫЕ ЭНДПОИНТЫ: ELO & AI ---
 
 @router.post("/grades/add")
@@ -332,8 +411,13 @@ async def add_grade_with_elo(data: GradeCreate, db: AsyncSession = Depends(get_d
     """
     Выставление оценки с пересчетом ELO.
     """
-    # 1. Ищем студента
-    res = await db.execute(select(Student).where(Student.id == data.student_id))
+    try:
+        task_type = resolve_task_type(data.task_type, True)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    # 1. Ищем студента (FOR UPDATE: рейтинг пишется абсолютным значением, как в ingest_grades)
+    res = await db.execute(select(Student).where(Student.id == data.student_id).with_for_update())
     student = res.scalar_one_or_none()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -341,8 +425,12 @@ async def add_grade_with_elo(data: GradeCreate, db: AsyncSession = Depends(get_d
     # 2. Добавляем оценку в БД
     # Конвертируем 5-балльную в 100-балльную для системы (примерно)
     score_100 = data.grade * 20
-    new_grade = Grade(student_id=student.id, subject_name=data.subject, score=score_100)
+    new_grade = Grade(
+        student_id=student.id, subject_name=data.subject, score=score_100, date=datetime.utcnow(),
+        is_exam=task_type == "EXAM", task_type=task_type,
+    )
     db.add(new_grade)
+    await apply_grade_rollups(db, [(student.id, data.subject, score_100, new_grade.date)])
 
     # 3. ELO MAGIC
     current_elo = getattr(student, 'elo_rating', 1000)
@@ -351,17 +439,23 @@ async def add_grade_with_elo(data: GradeCreate, db: AsyncSession = Depends(get_d
     delta = calculate_academic_change(
         current_rating=current_elo,
         grade=data.grade,
-        task_type=data.task_type
+        task_type=task_type
     )
 
     # Применяем изменение
     new_elo = current_elo + delta
     student.elo_rating = new_elo
 
+    # 4. Ачивки: только правила по оценкам и ELO, по роллапам этого студента
+    unlocked = await check_achievements(db, [student.id], GRADES, ELO)
+
     await db.commit()
+    grades_written(student.id)
+    publish_unlocks(unlocked)
 
     return {
         "status": "success",
+        "achievements_unlocked": [code for _, code in unlocked],
         "message": f"Grade added. ELO change: {delta:+d} (New Rating: {new_elo})"
     }
 
@@ -369,16 +463,17 @@ async def add_grade_with_elo(data: GradeCreate, db: AsyncSession = Depends(get_d
 @router.get("/top-by-gpa")
 async def get_top_by_gpa(limit: int = 10, db: AsyncSession = Depends(get_db)):
     """Топ студентов по среднему баллу (GPA)"""
+    # Средний балл из роллапа: сканируем students, а не всю таблицу grades
+    avg_score = Student.grades_sum / Student.grades_count
     stmt = (
         select(
             Student.id,
             Student.full_name,
             Student.group_id,
-            func.avg(Grade.score).label("avg_score")
+            avg_score.label("avg_score")
         )
-        .join(Grade, Student.id == Grade.student_id)
-        .group_by(Student.id, Student.full_name, Student.group_id)
-        .order_by(func.avg(Grade.score).desc())
+        .where(Student.grades_count > 0)
+        .order_by(avg_score.desc())
         .limit(limit)
     )
     result = await db.execute(stmt)
@@ -387,9 +482,9 @@ async def get_top_by_gpa(limit: int = 10, db: AsyncSession = Depends(get_db)):
     return [
         {
             "id": r.id,
-            "full_name": r.full_name.replace("тов. ", "").replace("г-н ", ""),
+            "full_name": clean_student_name(r.full_name),
             "group_name": f"Group {r.group_id}",
-            "gpa": round(r.avg_score / 20, 2)  # Преобразуем 100-балльную в 5-балльную
+            "gpa": round(float(r.avg_score) / 20, 2)  # Преобразуем 100-балльную в 5-балльную
         }
         for r in rows
     ]
@@ -399,25 +494,13 @@ async def chat_with_spectrum(request: AiChatRequest, db: AsyncSession = Depends(
     """
     Чат с ИИ (Saiga) о студенте.
     """
-    # Получаем контекст студента
-    res = await db.execute(select(Student).where(Student.id == request.student_id))
-    student = res.scalar_one_or_none()
+    # Контекст студента + последние оценки
+    context = await load_student_context(db, request.student_id, recent_grades=5) if request.student_id else None
 
-    if not student:
+    if not context:
         return {"response": "Error: Student identity not found in database."}
 
-    # Получаем последние оценки для контекста
-    res_g = await db.execute(select(Grade).where(Grade.student_id == student.id).order_by(desc(Grade.date)).limit(5))
-    grades = res_g.scalars().all()
-    recent_grades = [g.score for g in grades]
-
-    elo = getattr(student, 'elo_rating', 1000)
-
     # Запрос к ИИ сервису
-    ai_response = await get_ai_analysis(
-        student_name=student.full_name,
-        elo=elo,
-        recent_grades=recent_grades
-    )
+    ai_response = await get_ai_analysis(request.message, context)
 
     return {"response": ai_response}
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Бенчмарк клиента LLM: новый httpx.AsyncClient на каждый запрос vs общий пул с keep-alive.
+
+Поднимает заглушку llama.cpp (benchmarks/llm_stub_server.py) на свободном порту
+и печатает connect / TTFB / total по тем же trace-метрикам, что и ai_service.
+
+Запуск из папки backend:
+    python -m benchmarks.ai_client_bench
+    python -m benchmarks.ai_client_bench --requests 500 --concurrency 4 --delay 0.01
+"""
+import argparse
+import asyncio
+import socket
+import sys
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from logic import ai_service
+from logic.ai_service import AiMetrics, RequestTiming, post_chat_completion
+from benchmarks.llm_stub_server import create_app
+
+PAYLOAD = {
+    "model": ai_service.MODEL_NAME,
+    "messages": [{"role": "user", "content": "Статус студента #1"}],
+    "max_tokens": 125,
+}
+
+
+def start_stub(delay: float) -> tuple[uvicorn.Server, str]:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(delay), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+async def fresh_client_request(url: str, metrics: AiMetrics):
+    """Как было раньше: клиент (и TCP соединение) на каждый запрос."""
+    timing = RequestTiming()
+    async with httpx.AsyncClient(timeout=140.0) as client:
+        response = await client.post(url, json=PAYLOAD, extensions={"trace": timing.trace})
+    metrics.record(timing.finish(), response.is_success)
+
+
+async def pooled_request(url: str, metrics: AiMetrics):
+    response, _ = await post_chat_completion(PAYLOAD)
+    response.raise_for_status()
+
+
+async def run_case(request, url: str, metrics: AiMetrics, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await request(url, metrics)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return time.perf_counter() - started
+
+
+def _fmt(stats: dict | None) -> str:
+    return "-" if not stats else f"avg {stats['avg']:>7.2f}  p95 {stats['p95']:>7.2f}"
+
+
+async def run(total: int, concurrency: int, delay: float):
+    server, url = start_stub(delay)
+    ai_service.AI_API_URL = url
+    try:
+        # post_chat_completion пишет в ai_service.ai_metrics — окно на весь прогон
+        ai_service.ai_metrics = AiMetrics(window=total)
+        cases = {
+            "fresh client": (fresh_client_request, AiMetrics(window=total)),
+            "pooled client": (pooled_request, ai_service.ai_metrics),
+        }
+        for name, (request, metrics) in cases.items():
+            elapsed = await run_case(request, url, metrics, total, concurrency)
+            summary = metrics.summary()
+            print(f"{name:<14} {total / elapsed:>8.0f} req/s   reused {summary['reused_connections']:>5}/{summary['requests']}")
+            for key in ("connect_ms", "ttfb_ms", "total_ms"):
+                print(f"    {key:<11} {_fmt(summary[key])}")
+    finally:
+        await ai_service.close_ai_client()
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM HTTP client benchmark")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--delay", type=float, default=0.0, help="задержка заглушки, секунды")
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(run(args.requests, args.concurrency, args.delay))
@@ -0,0 +1,97 @@
+"""
+Бенчмарк загрузки ответа C++ модуля: синтетический data_out на 1M аномалий.
+
+Меряет чтение JSON vs бинарного формата и запись в базу (UPDATE risk_score + INSERT алертов).
+По умолчанию транзакция откатывается, база не меняется.
+
+Запуск из папки backend:
+    python -m benchmarks.anomaly_ingest_bench
+    python -m benchmarks.anomaly_ingest_bench --size 100000 --commit
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import Student
+from logic.anomaly_ingest import ingest_anomalies
+from logic.exchange_format import open_anomalies, write_anomalies_binary
+
+DETAILS = (
+    "Detected negative academic trend correlation",
+    "Attendance drop below cohort baseline",
+    "Irregular submission timing",
+)
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def make_files(directory: str, student_ids: np.ndarray, size: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    ids = student_ids[rng.integers(0, student_ids.size, size)]
+    scores = np.round(rng.uniform(0, 100, size), 2)
+    details = [DETAILS[i] for i in rng.integers(0, len(DETAILS), size)]
+
+    json_path = os.path.join(directory, "data_out.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"anomalies": [
+            {"details": d, "risk_score": float(s), "student_id": int(i)} for i, s, d in zip(ids, scores, details)
+        ]}, f)
+    bin_path = os.path.join(directory, "data_out.bin")
+    write_anomalies_binary(bin_path, ids, scores, details)
+    return json_path, bin_path
+
+
+async def run(size: int, commit: bool):
+    async with AsyncSessionLocal() as session:
+        student_ids = np.array((await session.execute(select(Student.id))).scalars().all(), dtype=np.int32)
+    if student_ids.size == 0:
+        print("❌ No students in the database, run data_generator.py first")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        (json_path, bin_path), t_gen = _timed(lambda: make_files(directory, student_ids, size))
+        print(f"📦 {size:,} anomalies over {student_ids.size:,} students generated in {t_gen:.2f}s "
+              f"(json {os.path.getsize(json_path) / 1e6:.1f} MB, bin {os.path.getsize(bin_path) / 1e6:.1f} MB)")
+
+        from_json, t_json = _timed(lambda: open_anomalies(json_path))
+        from_bin, t_bin = _timed(lambda: open_anomalies(bin_path))
+        print(f"{'read json':<14}{t_json * 1000:>10.1f} ms")
+        print(f"{'read binary':<14}{t_bin * 1000:>10.1f} ms   (mmap, x{t_json / max(t_bin, 1e-9):,.0f})")
+        from_json.close()
+
+        async with AsyncSessionLocal() as session:
+            started = time.perf_counter()
+            stats = await ingest_anomalies(session, from_bin)
+            t_db = time.perf_counter() - started
+            if commit:
+                await session.commit()
+            else:
+                await session.rollback()
+        from_bin.close()
+
+        print(f"{'db upsert':<14}{t_db * 1000:>10.1f} ms   "
+              f"({stats['alerts']:,} new / {stats['alerts_updated']:,} updated alerts, {len(stats['student_ids']):,} students, "
+              f"{size / t_db:,.0f} anomalies/s, {'committed' if commit else 'rolled back'})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anomaly ingest benchmark")
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--commit", action="store_true", help="оставить алерты в базе")
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(run(args.size, args.commit))
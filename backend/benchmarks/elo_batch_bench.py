@@ -0,0 +1,70 @@
+"""
+Микробенчмарк ELO: скалярные функции vs batch API.
+
+Запуск из папки backend:
+    python -m benchmarks.elo_batch_bench
+    python -m benchmarks.elo_batch_bench --sizes 1000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from logic.elo_system import (
+    calculate_academic_change, calculate_academic_change_batch,
+    calculate_competition_change, calculate_competition_change_batch,
+    apply_kudos, apply_kudos_batch,
+)
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+TASK_TYPES = np.array(["EXAM", "TEST", "HOMEWORK"])
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def run(size: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    ratings = rng.integers(600, 2600, size)
+    grades = rng.integers(2, 6, size)
+    task_types = TASK_TYPES[rng.integers(0, 3, size)]
+    placements = rng.integers(1, 50, size)
+    bonuses = rng.integers(1, 60, size)
+
+    cases = {
+        "academic": (
+            lambda: [calculate_academic_change(r, g, t) for r, g, t in
+                     zip(ratings.tolist(), grades.tolist(), task_types.tolist())],
+            lambda: calculate_academic_change_batch(ratings, grades, task_types),
+        ),
+        "competition": (
+            lambda: [calculate_competition_change(r, p) for r, p in zip(ratings.tolist(), placements.tolist())],
+            lambda: calculate_competition_change_batch(ratings, placements),
+        ),
+        "kudos": (
+            lambda: [apply_kudos(r, b) for r, b in zip(ratings.tolist(), bonuses.tolist())],
+            lambda: apply_kudos_batch(ratings, bonuses),
+        ),
+    }
+
+    for name, (scalar_fn, batch_fn) in cases.items():
+        scalar, t_scalar = _timed(scalar_fn)
+        batch, t_batch = _timed(batch_fn)
+        identical = np.array_equal(np.asarray(scalar, dtype=np.int64), batch)
+        print(
+            f"{name:<12} n={size:>9,}  scalar {t_scalar * 1000:>9.1f} ms  "
+            f"batch {t_batch * 1000:>8.1f} ms  x{t_scalar / max(t_batch, 1e-9):>6.1f}  "
+            f"identical={identical}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ELO scalar vs batch benchmark")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(DEFAULT_SIZES))
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        run(n)
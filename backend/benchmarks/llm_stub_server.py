@@ -0,0 +1,116 @@
+"""
+Заглушка llama.cpp сервера: POST /v1/chat/completions в формате OpenAI.
+
+Нужна, чтобы гонять ai_service без модели: отвечает через --delay секунд
+(имитация генерации) фиксированным текстом с полями как у llama.cpp.
+С "stream": true отдает SSE-чанки по слову раз в --token-delay секунд;
+брошенные клиентом стримы считаются в GET /health (cancelled).
+
+Запуск из папки backend:
+    python -m benchmarks.llm_stub_server                # порт 8085, как AI_API_URL по умолчанию
+    python -m benchmarks.llm_stub_server --port 8090 --delay 0.5 --token-delay 0.05
+"""
+import argparse
+import asyncio
+import time
+
+import json
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+STUB_TEXT = (
+    "Риск: Умеренный — вектор ELO стабилен, но посещаемость проседает. "
+    "Паттерн: оценки колеблются без тренда. Действие: синхронизация с куратором на этой неделе."
+)
+
+
+def _stream_chunks(app: FastAPI, request_id: str, model: str, token_delay: float):
+    words = STUB_TEXT.split(" ")
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        body = {
+            "id": request_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+    async def generate():
+        try:
+            yield chunk({"role": "assistant"})
+            for i, word in enumerate(words):
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+                yield chunk({"content": word if i == 0 else " " + word})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+            app.state.completed += 1
+        except (asyncio.CancelledError, GeneratorExit):
+            # llama.cpp на разрыв соединения останавливает слот генерации
+            app.state.cancelled += 1
+            raise
+
+    return generate()
+
+
+def create_app(delay: float = 0.0, token_delay: float = 0.0) -> FastAPI:
+    app = FastAPI(title="llama.cpp stub")
+    app.state.requests = 0
+    app.state.completed = 0
+    app.state.cancelled = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        if delay:
+            await asyncio.sleep(delay)
+        if body.get("stream"):
+            return StreamingResponse(
+                _stream_chunks(app, f"chatcmpl-stub-{app.state.requests}", body.get("model", "stub"), token_delay),
+                media_type="text/event-stream",
+            )
+        app.state.completed += 1
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        completion_tokens = len(STUB_TEXT.split())
+        return {
+            "id": f"chatcmpl-stub-{app.state.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_TEXT},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.get("/health")
+    async def health():
+        return {
+            "status": "ok",
+            "requests": app.state.requests,
+            "completed": app.state.completed,
+            "cancelled": app.state.cancelled,
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="llama.cpp /v1/chat/completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--delay", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="пауза между токенами стрима, секунды")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.delay, args.token_delay), host=args.host, port=args.port, log_level="warning")
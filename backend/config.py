@@ -14,6 +14,49 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "super-secret-hackathon-key-change_me"
     BACKEND_CORS_ORIGINS: List[str] = ["http://localhost:5173", "http://localhost:3000"]
 
+    # Обмен с C++ модулем анализа: папка с data_in / data_out и формат
+    # "json" — data_in.json / data_out.json (как раньше)
+    # "binary" — data_in.bin / data_out.bin (колоночный формат, см. logic/exchange_format.py)
+    EXCHANGE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "exchange")
+    EXCHANGE_FORMAT: str = "json"
+    # Как часто фоновый наблюдатель проверяет data_out (секунды)
+    ANOMALY_POLL_INTERVAL: float = 2.0
+
+    # Нагрузка преподавателей из материализованного представления (иначе — агрегат на каждый запрос)
+    TEACHERS_LOAD_MATVIEW: bool = False
+    TEACHERS_LOAD_REFRESH_INTERVAL: float = 300.0
+
+    # Скан безопасности/достижений: инкрементальный проход по измененным студентам
+    # раз в SECURITY_SCAN_INTERVAL, полный — раз в SECURITY_FULL_SWEEP_INTERVAL (секунды)
+    SECURITY_SCAN_INTERVAL: float = 300.0
+    SECURITY_FULL_SWEEP_INTERVAL: float = 24 * 3600.0
+    # Декларативные правила достижений (logic/achievements_logic.py)
+    ACHIEVEMENT_RULES_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "achievement_rules.json")
+    # Порог "отличной" оценки (0-100) для метрики excellent_count. Считается при записи в роллапы
+    # (StudentSubjectStats), а не в правилах: после смены — python -m logic.grade_rollups backfill
+    EXCELLENT_SCORE: int = 95
+
+    # Локальная LLM (llama.cpp, OpenAI-совместимый /v1/chat/completions)
+    AI_API_URL: str = "http://localhost:8085/v1/chat/completions"
+    # Один клиент на все приложение: пул соединений с keep-alive
+    AI_MAX_CONNECTIONS: int = 8
+    AI_MAX_KEEPALIVE_CONNECTIONS: int = 4
+    AI_KEEPALIVE_EXPIRY: float = 60.0
+    AI_CONNECT_TIMEOUT: float = 5.0
+    AI_READ_TIMEOUT: float = 140.0
+    # Планировщик: сколько генераций одновременно пускаем в llama.cpp и сколько ждут в очереди
+    AI_MAX_CONCURRENCY: int = 2
+    AI_MAX_QUEUE: int = 16
+    AI_QUEUE_TIMEOUT: float = 60.0
+    # Фоновые сводки LLM по когорте риска (топ-N по risk_score), проход раз в интервал
+    AI_SUMMARIES_ENABLED: bool = True
+    AI_SUMMARY_COHORT: int = 50
+    AI_SUMMARY_INTERVAL: float = 120.0
+    # Кэш ответов LLM: LRU в памяти + опционально SQLite-файл (пустая строка — без диска)
+    AI_CACHE_MAX_SIZE: int = 2000
+    AI_CACHE_TTL: float = 6 * 3600.0
+    AI_CACHE_DB_PATH: str = ""
+
     class Config:
         # Указываем, что файл .env лежит на уровень выше или в текущей папке
         # Pydantic будет искать .env
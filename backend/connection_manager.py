@@ -0,0 +1,40 @@
+import asyncio
+
+from fastapi import WebSocket
+
+
+# --- WEBSOCKET MANAGER ---
+class ConnectionManager:
+    """Подключенные дашборды (/ws) и рассылка им событий."""
+
+    def __init__(self):
+        self.active_connections: list[WebSocket] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+
+    def disconnect(self, websocket: WebSocket):
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+
+    async def broadcast(self, message: dict):
+        # Копия списка: пока ждем send_json, клиенты подключаются и отключаются
+        for connection in list(self.active_connections):
+            try:
+                await connection.send_json(message)
+            except Exception:
+                # Мертвое соединение — больше не шлем
+                self.disconnect(connection)
+
+    def publish(self, message: dict):
+        """Рассылка без ожидания (из обработчиков запросов): медленный клиент не держит ответ."""
+        if not self.active_connections:
+            return
+        task = asyncio.create_task(self.broadcast(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+manager = ConnectionManager()
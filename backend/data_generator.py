@@ -3,6 +3,7 @@ import random
 import sys
 
 from faker import Faker
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
@@ -21,6 +22,8 @@ from models import (
 )
 
 from config import settings
+from logic.grade_rollups import backfill_rollups
+from logic.teachers_load import VIEW_NAME as TEACHERS_LOAD_VIEW
 
 DATABASE_URL = settings.DATABASE_URL
 fake = Faker("ru_RU")
@@ -56,6 +59,8 @@ async def generate_data():
 
     # Полное пересоздание схемы
     async with engine.begin() as conn:
+        # Матпредставление зависит от таблиц — удаляем его первым (создаст бэкенд при старте)
+        await conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {TEACHERS_LOAD_VIEW}"))
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
     print("✅ Tables created.")
@@ -151,31 +156,32 @@ async def generate_data():
                             subject_name=subj,
                             score=score,
                             is_exam=True,
+                            task_type="EXAM",
                             date=datetime.now()
                             - timedelta(days=random.randint(1, 30)),
                         )
                     )
 
-                # Базовые ачивки — храним только коды
+                # Базовые ачивки — храним только коды, каждый код у студента один раз
+                codes = set()
                 if iq > 80:
-                    session.add(
-                        StudentAchievement(
-                            student_id=student.id,
-                            achievement_code="HIGH_PERFORMER",
-                            earned_at=datetime.now(),
-                        )
-                    )
+                    codes.add("HIGH_PERFORMER")
                 if random.random() > 0.7:
+                    codes.add(random.choice(ACHIEVEMENTS_LIST))
+                for code in sorted(codes):
                     session.add(
                         StudentAchievement(
                             student_id=student.id,
-                            achievement_code=random.choice(ACHIEVEMENTS_LIST),
+                            achievement_code=code,
                             earned_at=datetime.now(),
                         )
                     )
 
         await session.commit()
 
+        # Роллапы оценок (grades_count/grades_sum и статистика по предметам)
+        await backfill_rollups(session)
+
     print("✅ Data generation complete! Database is ready.")
 
 
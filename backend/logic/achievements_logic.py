@@ -1,66 +1,259 @@
-from sqlalchemy import select, and_
+"""
+Движок достижений: декларативные правила из achievement_rules.json (ACHIEVEMENT_RULES_PATH).
+
+Правило — код ачивки и условия, которые должны выполниться все:
+    {"code": "CODE_NINJA", "all": [{"metric": "excellent_count",
+        "subjects": ["Криптография", "Базы Данных", "Алгоритмы"], "op": ">=", "value": 2}]}
+Без subjects метрика берется из строки студента (STUDENT_METRICS: роллапы и статы),
+с subjects — из StudentSubjectStats, сводится по перечисленным предметам (SUBJECT_METRICS)
+агрегатом в SQL: на студента одна строка, сколько бы предметов ни было.
+excellent_count — число оценок >= EXCELLENT_SCORE (settings): порог задается роллапом
+(grade_rollups), а не правилом; в правиле — только сколько таких оценок нужно.
+
+Правила компилируются в векторные предикаты pandas: пачка студентов — один DataFrame,
+на правило — одна маска, выдача — один INSERT ... ON CONFLICT DO NOTHING.
+Тот же код и у скана (security_monitor), и у проверки одного студента.
+
+Событийная проверка (check_achievements): запись оценок/ELO/XP перепроверяет только правила,
+чьи входы она изменила (Condition.input), и только для затронутых студентов — по роллапам,
+без чтения grades. Новые ачивки рассылаются на дашборды по WebSocket (publish_unlocks).
+"""
+import json
+import operator
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, any_, bindparam, literal, Integer, String, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import Student, Grade, Achievement, StudentAchievement
 
+from config import settings
+from connection_manager import manager
+from models import Student, Achievement, StudentAchievement, StudentSubjectStats
+from utils.sql import unnest_table
 
-async def get_achievement_by_code(code: str, db: AsyncSession) -> Achievement | None:
-    """Вспомогательная функция для получения ачивки по ее коду."""
-    res = await db.execute(select(Achievement).where(Achievement.code == code))
-    return res.scalar_one_or_none()
+# Метрика студента -> колонка (gpa — по 5-балльной шкале из роллапов)
+STUDENT_METRICS = {
+    "gpa": None,
+    "grades_count": Student.grades_count,
+    "elo_rating": Student.elo_rating,
+    "risk_score": Student.risk_score,
+    "debts_count": Student.debts_count,
+    "stat_int": Student.stat_int,
+    "stat_sta": Student.stat_sta,
+    "stat_soc": Student.stat_soc,
+}
+# Метрика по предметам -> как сводить несколько предметов
+SUBJECT_METRICS = {"excellent_count": "sum", "grades_count": "sum", "max_score": "max"}
+
+# Входы правил для событийной проверки: GRADES — роллапы оценок (gpa, grades_count,
+# все метрики по предметам), остальные метрики студента — по имени колонки
+GRADES = "grades"
+ELO = "elo_rating"
+XP = "stat_int"  # XP начисляется в интеллект
+
+OPERATORS = {
+    ">=": operator.ge, ">": operator.gt,
+    "<=": operator.le, "<": operator.lt,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+# Колонки, которые выборка студентов должна вернуть для student_frame
+METRIC_COLUMNS = (Student.id, Student.grades_sum, *(c for c in STUDENT_METRICS.values() if c is not None))
+
+
+# --- ПРАВИЛА ---
+
+class Condition:
+    __slots__ = ("metric", "subjects", "op", "value", "key", "input")
 
+    def __init__(self, spec: dict):
+        self.metric = spec["metric"]
+        self.subjects = tuple(spec.get("subjects") or ())
+        known = SUBJECT_METRICS if self.subjects else STUDENT_METRICS
+        if self.metric not in known:
+            raise ValueError(f"Unknown achievement metric {self.metric!r} (subjects={list(self.subjects)})")
+        if spec.get("op", ">=") not in OPERATORS:
+            raise ValueError(f"Unknown achievement operator {spec['op']!r}")
+        self.op = OPERATORS[spec.get("op", ">=")]
+        self.value = spec["value"]
+        # Колонка когорты: метрика студента или "metric@предмет,предмет"
+        self.key = f"{self.metric}@{','.join(sorted(self.subjects))}" if self.subjects else self.metric
+        # Какая запись может поменять результат условия
+        self.input = GRADES if self.subjects or self.metric in ("gpa", "grades_count") else self.metric
 
-async def grant_achievement(student_id: int, achievement_code: str, db: AsyncSession):
-    """Выдает ачивку, если у студента ее еще нет."""
-    # 1. Проверяем, есть ли уже такая ачивка
-    exists_stmt = select(StudentAchievement).where(
-        and_(
-            StudentAchievement.student_id == student_id,
-            StudentAchievement.achievement_id == select(Achievement.id).where(
-                Achievement.code == achievement_code).scalar_subquery()
+    def subject_aggregate(self):
+        """Агрегат по StudentSubjectStats для условия по предметам (sum/max с FILTER по предметам)."""
+        agg = func.sum if SUBJECT_METRICS[self.metric] == "sum" else func.max
+        return (
+            agg(getattr(StudentSubjectStats, self.metric))
+            .filter(StudentSubjectStats.subject_name.in_(self.subjects))
+            .label(self.key)
         )
-    )
-    existing_ach = (await db.execute(exists_stmt)).scalar_one_or_none()
 
-    if existing_ach:
-        return  # Уже есть, ничего не делаем
+    def mask(self, frame: pd.DataFrame) -> np.ndarray:
+        # Нет данных (NaN) — условие не выполнено; без notna "!=" с NaN дал бы True
+        column = frame[self.key]
+        return (self.op(column, self.value) & column.notna()).to_numpy(dtype=bool)
+
+
+class AchievementRule:
+    __slots__ = ("code", "description", "conditions", "inputs")
+
+    def __init__(self, spec: dict):
+        self.code = spec["code"]
+        self.description = spec.get("description", "")
+        self.conditions = [Condition(c) for c in spec["all"]]
+        if not self.conditions:
+            raise ValueError(f"Achievement rule {self.code!r} has no conditions")
+        self.inputs = frozenset(c.input for c in self.conditions)
+
+    def mask(self, frame: pd.DataFrame) -> np.ndarray:
+        result = np.ones(len(frame), dtype=bool)
+        for condition in self.conditions:
+            result &= condition.mask(frame)
+        return result
+
+
+def load_rules(path: str) -> list[AchievementRule]:
+    with open(path, "r", encoding="utf-8") as f:
+        rules = [AchievementRule(spec) for spec in json.load(f)]
+    codes = [r.code for r in rules]
+    if len(codes) != len(set(codes)):
+        raise ValueError(f"Duplicate achievement codes in {path}")
+    return rules
+
+
+ACHIEVEMENT_RULES = load_rules(settings.ACHIEVEMENT_RULES_PATH)
+RULES_BY_CODE = {r.code: r for r in ACHIEVEMENT_RULES}
+
+
+def rules_for(*changed: str, rules=ACHIEVEMENT_RULES) -> list[AchievementRule]:
+    """Правила, чьи входы затронуты записью (GRADES, ELO, XP или имя метрики студента)."""
+    return [r for r in rules if r.inputs.intersection(changed)]
+
+
+# --- КОГОРТА ---
+
+def student_frame(rows) -> pd.DataFrame:
+    """Строки выборки с METRIC_COLUMNS (можно и с другими) -> метрики студентов, index — id."""
+    names = [m for m in STUDENT_METRICS if m != "gpa"]
+    if not rows:
+        return pd.DataFrame(columns=[*names, "gpa"], index=pd.Index([], name="id"), dtype="float64")
+    frame = pd.DataFrame(rows, columns=list(rows[0]._fields)).set_index("id")
+    metrics = frame[names].astype("float64")
+    counts = frame["grades_count"].astype("float64")
+    metrics["gpa"] = (frame["grades_sum"] / counts / 20).where(counts > 0, 0.0)
+    return metrics
 
-    # 2. Ачивки нет - выдаем
-    achievement = await get_achievement_by_code(achievement_code, db)
-    if achievement:
-        new_grant = StudentAchievement(
-            student_id=student_id,
-            achievement_id=achievement.id
+
+async def add_subject_metrics(db: AsyncSession, frame: pd.DataFrame, rules=ACHIEVEMENT_RULES) -> pd.DataFrame:
+    """
+    Добавляет колонки условий по предметам: один GROUP BY по StudentSubjectStats на пачку,
+    по агрегату с FILTER на условие. Нет оценок по предметам — NaN (сумма — 0).
+    """
+    conditions = {c.key: c for r in rules for c in r.conditions if c.subjects}
+    if not conditions or frame.empty:
+        return frame
+    subjects = set().union(*(c.subjects for c in conditions.values()))
+    rows = (await db.execute(
+        select(StudentSubjectStats.student_id, *(c.subject_aggregate() for c in conditions.values()))
+        .where(StudentSubjectStats.student_id == any_(bindparam("ids", frame.index.tolist(), type_=ARRAY(Integer))))
+        .where(StudentSubjectStats.subject_name.in_(subjects))
+        .group_by(StudentSubjectStats.student_id)
+    )).all()
+    stats = pd.DataFrame(rows, columns=["id", *conditions]).set_index("id").astype("float64")
+    frame = frame.join(stats)
+    for key, condition in conditions.items():
+        if SUBJECT_METRICS[condition.metric] == "sum":
+            frame[key] = frame[key].fillna(0.0)
+    return frame
+
+
+def evaluate(frame: pd.DataFrame, rules=ACHIEVEMENT_RULES) -> list[tuple[int, str]]:
+    """Все правила по всей пачке: пары (student_id, code) выполненных правил."""
+    ids = frame.index.to_numpy()
+    return [(int(student_id), rule.code) for rule in rules for student_id in ids[rule.mask(frame)]]
+
+
+# --- ВЫДАЧА ---
+
+async def grant_achievements(db: AsyncSession, earned, now: datetime | None = None) -> list[tuple[int, str]]:
+    """
+    Выдает пачку (student_id, code) одним INSERT ... ON CONFLICT DO NOTHING.
+    Уже выданные пропускает база (уникальность student_id + code); возвращает только новые.
+    Commit — на вызывающем.
+    """
+    if not earned:
+        return []
+    e = unnest_table(
+        "e",
+        student_id=(Integer, [student_id for student_id, _ in earned]),
+        code=(String, [code for _, code in earned]),
+    )
+    stmt = (
+        pg_insert(StudentAchievement)
+        .from_select(
+            ["student_id", "achievement_code", "earned_at"],
+            select(e.c.student_id, e.c.code, literal(now or datetime.utcnow(), DateTime)),
         )
-        db.add(new_grant)
-        print(f"🏆 ACHIEVEMENT UNLOCKED for student #{student_id}: {achievement.title}")
+        .on_conflict_do_nothing(index_elements=["student_id", "achievement_code"])
+        .returning(StudentAchievement.student_id, StudentAchievement.achievement_code)
+    )
+    return [tuple(row) for row in (await db.execute(stmt)).all()]
+
+
+async def evaluate_students(db: AsyncSession, where, rules=ACHIEVEMENT_RULES) -> list[tuple[int, str]]:
+    """Проверяет правила для студентов по условию where и выдает новые ачивки. Commit — на вызывающем."""
+    rows = (await db.execute(select(*METRIC_COLUMNS).where(where))).all()
+    frame = await add_subject_metrics(db, student_frame(rows), rules)
+    return await grant_achievements(db, evaluate(frame, rules))
+
+
+async def check_achievements(db: AsyncSession, student_ids, *changed: str) -> list[tuple[int, str]]:
+    """
+    Событийная проверка после записи: только правила с затронутыми входами, только эти студенты.
+    Вызывать в транзакции записи до commit — ачивка фиксируется вместе с оценкой.
+    """
+    rules = rules_for(*changed)
+    ids = list(student_ids)
+    if not rules or not ids:
+        return []
+    where = Student.id == any_(bindparam("student_ids", ids, type_=ARRAY(Integer)))
+    return await evaluate_students(db, where, rules)
+
+
+def publish_unlocks(granted):
+    """После commit: новые ачивки — в лог и на дашборды (/ws, событие achievement_unlocked)."""
+    now = datetime.now().strftime("%H:%M:%S")
+    for student_id, code in granted:
+        print(f"🏆 ACHIEVEMENT UNLOCKED for student #{student_id}: {code}")
+        rule = RULES_BY_CODE.get(code)
+        manager.publish({
+            "type": "achievement_unlocked",
+            "payload": {
+                "student_id": student_id,
+                "code": code,
+                "message": f"Student #{student_id} unlocked {code}" + (f": {rule.description}" if rule else ""),
+                "time": now,
+            },
+        })
+
+
+async def get_achievement_by_code(code: str, db: AsyncSession) -> Achievement | None:
+    """Вспомогательная функция для получения ачивки по ее коду."""
+    res = await db.execute(select(Achievement).where(Achievement.code == code))
+    return res.scalar_one_or_none()
+
+
+async def grant_achievement(student_id: int, achievement_code: str, db: AsyncSession) -> bool:
+    """Выдает ачивку, если у студента ее еще нет. True — выдана сейчас (commit и publish_unlocks — на вызывающем)."""
+    return bool(await grant_achievements(db, [(student_id, achievement_code)]))
 
 
-async def check_all_achievements(student: Student, db: AsyncSession):
+async def check_all_achievements(student: Student, db: AsyncSession) -> list[tuple[int, str]]:
     """
-    Главная функция-анализатор. Проверяет все условия для студента.
+    Главная функция-анализатор. Проверяет все правила для студента, возвращает новые ачивки.
     """
-    # --- Проверка 1: High Performer (GPA > 4.5) ---
-    res_g = await db.execute(select(Grade).where(Grade.student_id == student.id))
-    grades = res_g.scalars().all()
-    if grades:
-        gpa = (sum(g.score for g in grades) / len(grades)) / 20
-        if gpa >= 4.5:
-            await grant_achievement(student.id, 'HIGH_PERFORMER', db)
-
-    # --- Проверка 2: Code Ninja (3+ оценок > 95 по тех. предметам) ---
-    tech_subjects = ["Криптография", "Базы Данных", "Алгоритмы"]
-    tech_grades_count = sum(1 for g in grades if g.subject_name in tech_subjects and g.score >= 95)
-    if tech_grades_count >= 2:  # Упростим до 2 для демо
-        await grant_achievement(student.id, 'CODE_NINJA', db)
-
-    # --- Проверка 3: Iron Will (Высокая посещаемость/выносливость) ---
-    # Используем stat_sta как прокси-метрику
-    if student.stat_sta >= 95:
-        await grant_achievement(student.id, 'IRON_WILL', db)
-
-    # --- Проверка 4: Cyber Ghost (Закрыл криптографию) ---
-    has_crypto = any(g.subject_name == "Криптография" and g.score >= 60 for g in grades)
-    if has_crypto:
-        await grant_achievement(student.id, 'CYBER_GHOST', db)
-
-    # Здесь можно добавить другие проверки...
+    return await evaluate_students(db, Student.id == student.id)
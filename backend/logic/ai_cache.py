@@ -0,0 +1,200 @@
+"""
+Кэш ответов LLM.
+
+Ключ — sha256 от (модель, системный промпт, нормализованный вопрос, контекст студента),
+так что тот же вопрос о том же состоянии студента не гоняет 7B модель повторно.
+Память — LRU с TTL; опционально второй уровень в SQLite (AI_CACHE_DB_PATH), переживает рестарт.
+Записи студента сбрасываются через cache_invalidation.students_changed (ELO, GPA, риск).
+SQLite не трогается из event loop: запись и сброс — в фоновом потоке-писателе (по очереди),
+чтение с диска — через asyncio.to_thread. На пути запроса синхронно только LRU в памяти.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import settings
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Регистр и пробелы не меняют смысл вопроса."""
+    return _WS_RE.sub(" ", message).strip().casefold()
+
+
+def cache_key(model: str, system_prompt: str, message: str, context: dict | None) -> str:
+    raw = json.dumps(
+        [model, system_prompt, normalize_message(message), context or {}],
+        ensure_ascii=False, sort_keys=True, default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """
+    SQLite-таблица (key, student_id, response, stored_at), вызовы под локом.
+    put/delete_students/prune только ставят задачу писателю; get и __len__ блокирующие — через to_thread.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_responses ("
+            "key TEXT PRIMARY KEY, student_id INTEGER, response TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_responses_student ON ai_responses (student_id)")
+        # student_id -> время сброса, который писатель еще не выполнил: строки не новее — уже недействительны
+        self._deleting: dict[int, float] = {}
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        threading.Thread(target=self._writer, name="ai-cache-writer", daemon=True).start()
+        self.prune()
+
+    def _writer(self):
+        while True:
+            fn, args = self._queue.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"⚠ AI cache disk write failed: {e}")
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def get(self, key: str) -> tuple[str, float, int | None] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, stored_at, student_id FROM ai_responses WHERE key = ? AND stored_at > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        if row is not None and row[2] is not None and row[1] <= self._deleting.get(row[2], float("-inf")):
+            return None  # сброс студента еще в очереди
+        return row
+
+    def put(self, key: str, student_id: int | None, response: str, stored_at: float):
+        self._queue.put((self._put, (key, student_id, response, stored_at)))
+
+    def _put(self, key: str, student_id: int | None, response: str, stored_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_responses (key, student_id, response, stored_at) VALUES (?, ?, ?, ?)",
+                (key, student_id, response, stored_at),
+            )
+
+    def delete_students(self, student_ids):
+        invalidated_at = time.time()
+        student_ids = list(student_ids)
+        for student_id in student_ids:
+            self._deleting[student_id] = invalidated_at
+        self._queue.put((self._delete_students, (student_ids, invalidated_at)))
+
+    def _delete_students(self, student_ids: list[int], invalidated_at: float):
+        with self._lock:
+            self._conn.executemany("DELETE FROM ai_responses WHERE student_id = ?", [(i,) for i in student_ids])
+        for student_id in student_ids:
+            # Более поздний сброс того же студента еще в очереди — его отметку не трогаем
+            if self._deleting.get(student_id) == invalidated_at:
+                self._deleting.pop(student_id, None)
+
+    def prune(self):
+        self._queue.put((self._prune, ()))
+
+    def _prune(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_responses WHERE stored_at <= ?", (time.time() - self.ttl,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM ai_responses").fetchone()[0]
+
+
+class AiResponseCache:
+    """LRU + TTL в памяти, SQLite — второй уровень. Время записи — wall clock (переживает рестарт)."""
+
+    def __init__(self, max_size: int, ttl: float, db_path: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, int | None, str]]" = OrderedDict()
+        self._by_student: dict[int, set[str]] = {}
+        self._disk = _DiskTier(db_path, ttl) if db_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, student_id, response = entry
+            if time.time() - stored_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return response
+            self._drop(key)
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key)
+            if row is not None:
+                response, stored_at, student_id = row
+                self.disk_hits += 1
+                self._remember(key, student_id, response, stored_at)
+                return response
+        self.misses += 1
+        return None
+
+    def put(self, key: str, response: str, student_id: int | None = None):
+        stored_at = time.time()
+        self._remember(key, student_id, response, stored_at)
+        if self._disk is not None:
+            self._disk.put(key, student_id, response, stored_at)
+
+    def _remember(self, key: str, student_id: int | None, response: str, stored_at: float):
+        self._drop(key)
+        self._entries[key] = (stored_at, student_id, response)
+        if student_id is not None:
+            self._by_student.setdefault(student_id, set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[1] is not None:
+            keys = self._by_student.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_student[entry[1]]
+
+    def invalidate_students(self, *student_ids: int):
+        for student_id in student_ids:
+            for key in self._by_student.pop(student_id, ()):
+                self._entries.pop(key, None)
+                self.invalidations += 1
+        if self._disk is not None and student_ids:
+            self._disk.delete_students(student_ids)
+
+    async def summary(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "disk_size": await asyncio.to_thread(len, self._disk) if self._disk is not None else None,
+            "disk_pending_writes": self._disk.pending() if self._disk is not None else None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "invalidations": self.invalidations,
+        }
+
+
+ai_response_cache = AiResponseCache(settings.AI_CACHE_MAX_SIZE, settings.AI_CACHE_TTL, settings.AI_CACHE_DB_PATH)
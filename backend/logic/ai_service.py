@@ -1,8 +1,22 @@
+import asyncio
+import json
+import time
+from collections import deque
+
 import httpx
 import logging
 
-# Настройки твоего локального сервера Llama.cpp
-AI_API_URL = "http://localhost:8085/v1/chat/completions"
+from sqlalchemy import select, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import Student, Grade, Group
+from utils.common import clean_student_name
+from logic.ai_cache import ai_response_cache, cache_key
+from logic.llm_scheduler import llm_scheduler, SchedulerBusy, INTERACTIVE
+
+# Настройки твоего локального сервера Llama.cpp (адрес и пул — в config)
+AI_API_URL = settings.AI_API_URL
 
 # ВАЖНО: имя модели — как в metadata: general.name
 MODEL_NAME = "ilyagusev_saiga_mistral_7b_merged"
@@ -29,11 +43,197 @@ SYSTEM_PROMPT = """
 """
 
 
-async def get_ai_analysis(message: str, context: dict | None = None) -> str:
+# --- HTTP КЛИЕНТ (один на приложение) ---
+
+_client: httpx.AsyncClient | None = None
+
+
+def _make_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.AI_READ_TIMEOUT, connect=settings.AI_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.AI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.AI_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+async def start_ai_client():
+    """Создается в lifespan: соединения с llama.cpp переиспользуются между запросами."""
+    global _client
+    if _client is None:
+        _client = _make_client()
+
+
+async def close_ai_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_ai_client() -> httpx.AsyncClient:
+    """Клиент приложения; вне lifespan (скрипты, бенчмарки) создается лениво."""
+    global _client
+    if _client is None:
+        _client = _make_client()
+    return _client
+
+
+# --- МЕТРИКИ ЗАПРОСОВ ---
+
+class RequestTiming:
     """
-    Отправляет запрос к локальной LLM, обогащая его контекстом из БД.
+    Тайминги одного запроса по trace-событиям httpcore.
+    connect_ms — None, если соединение взято из пула (keep-alive).
+    ttfb_ms — от отправки до заголовков ответа, total_ms — до конца тела.
+    first_token_ms — только для стриминга: до первого токена модели.
     """
 
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect_ms: float | None = None
+        self.ttfb_ms: float | None = None
+        self.total_ms: float | None = None
+        self.first_token_ms: float | None = None
+        self._connect_started: float | None = None
+
+    def _ms_since(self, moment: float) -> float:
+        return round((time.perf_counter() - moment) * 1000, 2)
+
+    async def trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.started":
+            self._connect_started = time.perf_counter()
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            if self._connect_started is not None:
+                self.connect_ms = self._ms_since(self._connect_started)
+        elif event_name.endswith("receive_response_headers.complete"):
+            self.ttfb_ms = self._ms_since(self.started)
+
+    def mark_first_token(self):
+        if self.first_token_ms is None:
+            self.first_token_ms = self._ms_since(self.started)
+
+    def finish(self) -> "RequestTiming":
+        self.total_ms = self._ms_since(self.started)
+        return self
+
+    def as_dict(self) -> dict:
+        return {
+            "connect_ms": self.connect_ms,
+            "ttfb_ms": self.ttfb_ms,
+            "total_ms": self.total_ms,
+            "first_token_ms": self.first_token_ms,
+            "reused_connection": self.connect_ms is None,
+        }
+
+
+class AiMetrics:
+    """Счетчики и последние тайминги запросов к LLM (для /ai/metrics)."""
+
+    def __init__(self, window: int = 200):
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0  # стримы, брошенные клиентом
+        self.reused = 0
+        self.recent: deque[RequestTiming] = deque(maxlen=window)
+
+    def record(self, timing: RequestTiming, ok: bool, cancelled: bool = False):
+        self.requests += 1
+        if cancelled:
+            self.cancelled += 1
+        elif not ok:
+            self.errors += 1
+        if timing.connect_ms is None:
+            self.reused += 1
+        self.recent.append(timing)
+
+    @staticmethod
+    def _percentiles(values: list[float]) -> dict | None:
+        if not values:
+            return None
+        values = sorted(values)
+        pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+        return {"avg": round(sum(values) / len(values), 2), "p50": pick(0.5), "p95": pick(0.95), "max": values[-1]}
+
+    def summary(self) -> dict:
+        recent = list(self.recent)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "reused_connections": self.reused,
+            "window": len(recent),
+            "connect_ms": self._percentiles([t.connect_ms for t in recent if t.connect_ms is not None]),
+            "ttfb_ms": self._percentiles([t.ttfb_ms for t in recent if t.ttfb_ms is not None]),
+            "total_ms": self._percentiles([t.total_ms for t in recent if t.total_ms is not None]),
+            "first_token_ms": self._percentiles([t.first_token_ms for t in recent if t.first_token_ms is not None]),
+            "last": recent[-1].as_dict() if recent else None,
+        }
+
+
+ai_metrics = AiMetrics()
+
+
+async def post_chat_completion(payload: dict) -> tuple[httpx.Response, RequestTiming]:
+    """POST в llama.cpp через общий пул; тайминги пишутся в ai_metrics."""
+    timing = RequestTiming()
+    ok = False
+    try:
+        response = await get_ai_client().post(AI_API_URL, json=payload, extensions={"trace": timing.trace})
+        ok = response.is_success
+        return response, timing
+    finally:
+        ai_metrics.record(timing.finish(), ok)
+
+
+# --- ЗАПРОС К МОДЕЛИ ---
+
+CONNECT_ERROR_TEXT = "⚠ ОШИБКА СВЯЗИ: Локальное нейроядро (Port 8085) недоступно. Запустите сервер Llama.cpp."
+FAILURE_TEXT = "⚠ КРИТИЧЕСКИЙ СБОЙ: Канал связи с нейроядром нарушен. Анализ невозможен."
+BUSY_TEXT = "⚠ ПЕРЕГРУЗКА: Нейроядро обрабатывает другие запросы. Повторите позже."
+
+
+async def load_student_contexts(db: AsyncSession, student_ids) -> dict[int, dict]:
+    """
+    Контексты студентов для промпта (и ключа кэша ответов) одним запросом:
+    имя, группа, ELO, GPA, риск.
+    """
+    res = await db.execute(
+        select(Student, Group.name)
+        .outerjoin(Group, Group.id == Student.group_id)
+        .where(Student.id.in_(list(student_ids)))
+    )
+    return {
+        student.id: {
+            "id": student.id,
+            "name": clean_student_name(student.full_name),
+            "group": group_name or "N/A",
+            "elo": student.elo_rating,
+            "gpa": student.gpa,  # из роллапа оценок
+            "risk": student.risk_score
+        }
+        for student, group_name in res.all()
+    }
+
+
+async def load_student_context(db: AsyncSession, student_id: int, recent_grades: int = 0) -> dict | None:
+    """Контекст одного студента; recent_grades > 0 — добавить последние оценки."""
+    context = (await load_student_contexts(db, [student_id])).get(student_id)
+    if context is None:
+        return None
+    if recent_grades:
+        res_g = await db.execute(
+            select(Grade.score).where(Grade.student_id == student_id)
+            .order_by(desc(Grade.date), desc(Grade.id)).limit(recent_grades)
+        )
+        context["recent_grades"] = res_g.scalars().all()
+    return context
+
+
+def build_payload(message: str, context: dict | None = None) -> dict:
+    """Промпт для llama.cpp: системная роль + контекст студента + вопрос оператора."""
     context_str = "[Общий запрос по системе]"
     if context:
         context_str = f"""
@@ -45,10 +245,12 @@ async def get_ai_analysis(message: str, context: dict | None = None) -> str:
 - GPA: {context.get('gpa', 'N/A')} (Академическая успеваемость)
 - Коэффициент риска: {context.get('risk', 'N/A')}% (Вероятность отчисления/выгорания)
 """
+        if context.get("recent_grades"):
+            context_str += f"- Последние оценки (0-100): {', '.join(map(str, context['recent_grades']))}\n"
 
     final_user_message = f"{context_str}\n\n[ЗАПРОС ОПЕРАТОРА]\n{message}"
 
-    payload = {
+    return {
         "model": MODEL_NAME,
         "messages": [
             {"role": "system", "content": SYSTEM_PROMPT},
@@ -58,38 +260,167 @@ async def get_ai_analysis(message: str, context: dict | None = None) -> str:
         "max_tokens": 125
     }
 
+
+async def _complete(payload: dict) -> tuple[str, bool]:
+    """Ответ модели и признак успеха (сообщения об ошибках не кэшируются)."""
     try:
-        async with httpx.AsyncClient(timeout=140.0) as client:
-            response = await client.post(AI_API_URL, json=payload)
-            # Логируем raw-ответ для дебага
-            logging.error(f"AI RAW RESPONSE: {response.text}")
-            response.raise_for_status()
+        response, timing = await post_chat_completion(payload)
+        # Логируем raw-ответ и тайминги для дебага
+        logging.debug(f"AI RAW RESPONSE: {response.text}")
+        logging.info(f"AI timing: {timing.as_dict()}")
+        response.raise_for_status()
 
-            data = response.json()
+        data = response.json()
 
-            # Универсальный разбор
-            choices = data.get("choices", [])
-            if not choices:
-                return "⚠ Нейроядро вернуло пустой ответ (нет choices)."
+        # Универсальный разбор
+        choices = data.get("choices", [])
+        if not choices:
+            return "⚠ Нейроядро вернуло пустой ответ (нет choices).", False
 
-            choice0 = choices[0] or {}
+        choice0 = choices[0] or {}
 
-            # Формат OpenAI: message.content
-            msg = choice0.get("message") or {}
-            content = msg.get("content")
+        # Формат OpenAI: message.content
+        msg = choice0.get("message") or {}
+        content = msg.get("content")
 
-            # Некоторые сборки llama.cpp могут класть текст в .text
-            if not content:
-                content = choice0.get("text")
+        # Некоторые сборки llama.cpp могут класть текст в .text
+        if not content:
+            content = choice0.get("text")
 
-            if not content or not str(content).strip():
-                return "⚠ Нейроядро вернуло пустой ответ (нет content/text)."
+        if not content or not str(content).strip():
+            return "⚠ Нейроядро вернуло пустой ответ (нет content/text).", False
 
-            return str(content).strip()
+        return str(content).strip(), True
 
     except httpx.ConnectError:
         logging.error("AI Service: Connection to Llama.cpp server failed.")
-        return "⚠ ОШИБКА СВЯЗИ: Локальное нейроядро (Port 8085) недоступно. Запустите сервер Llama.cpp."
+        return CONNECT_ERROR_TEXT, False
     except Exception as e:
         logging.error(f"AI Service Exception: {e}")
-        return "⚠ КРИТИЧЕСКИЙ СБОЙ: Канал связи с нейроядром нарушен. Анализ невозможен."
+        return FAILURE_TEXT, False
+
+
+def prompt_fingerprint(message: str, context: dict | None = None) -> str:
+    """Отпечаток промпта (он же ключ кэша ответов): модель, системная роль, вопрос, контекст."""
+    return cache_key(MODEL_NAME, SYSTEM_PROMPT, message, context)
+
+
+async def analyze(
+        message: str, context: dict | None = None, use_cache: bool = True, priority: int = INTERACTIVE,
+) -> tuple[str, bool]:
+    """get_ai_analysis + признак успеха (False — текст ошибки для оператора)."""
+    key = prompt_fingerprint(message, context)
+    if use_cache:
+        cached = await ai_response_cache.get(key)
+        if cached is not None:
+            return cached, True
+
+    payload = build_payload(message, context)
+    text, ok = await llm_scheduler.submit(key, lambda: _complete(payload), priority)
+    if ok:
+        ai_response_cache.put(key, text, (context or {}).get("id"))
+    return text, ok
+
+
+async def get_ai_analysis(
+        message: str, context: dict | None = None, use_cache: bool = True, priority: int = INTERACTIVE,
+) -> str:
+    """
+    Отправляет запрос к локальной LLM, обогащая его контекстом из БД.
+    Одинаковый вопрос о неизменившемся студенте отдается из ai_response_cache;
+    запрос идет через llm_scheduler (очередь, приоритет, объединение одинаковых промптов).
+    При переполненной очереди — SchedulerBusy (main.py отвечает 503).
+    """
+    text, _ = await analyze(message, context, use_cache, priority)
+    return text
+
+
+# --- СТРИМИНГ ---
+
+class AiStreamError(Exception):
+    """Ошибка стрима; str(e) — текст для оператора."""
+
+
+_STREAM_DONE = object()
+
+
+def _parse_stream_line(line: str):
+    """
+    Строка SSE от llama.cpp -> кусок текста, None (пропустить) или _STREAM_DONE.
+    OpenAI-формат: choices[0].delta.content; нативный /completion: content + stop.
+    """
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return _STREAM_DONE
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return None
+    choices = chunk.get("choices")
+    if choices:
+        choice0 = choices[0] or {}
+        return (choice0.get("delta") or {}).get("content") or choice0.get("text")
+    if chunk.get("stop"):
+        return chunk.get("content") or _STREAM_DONE
+    return chunk.get("content")
+
+
+async def stream_ai_analysis(
+        message: str, context: dict | None = None, use_cache: bool = True, priority: int = INTERACTIVE,
+):
+    """
+    Async-генератор кусков ответа (stream: true у llama.cpp), генерация — в слоте llm_scheduler.
+    Если клиент ушел, генератор закрывают: ответ upstream закрывается вместе с соединением,
+    и llama.cpp прекращает генерацию. В кэш попадает только полностью полученный ответ.
+    """
+    key = prompt_fingerprint(message, context)
+    if use_cache:
+        cached = await ai_response_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    payload = {**build_payload(message, context), "stream": True}
+    try:
+        async with llm_scheduler.slot(priority):
+            async for piece in _stream_completion(key, payload, context):
+                yield piece
+    except SchedulerBusy:
+        raise AiStreamError(BUSY_TEXT)
+
+
+async def _stream_completion(key: str, payload: dict, context: dict | None):
+    timing = RequestTiming()
+    ok = cancelled = False
+    parts: list[str] = []
+    try:
+        async with get_ai_client().stream(
+            "POST", AI_API_URL, json=payload, extensions={"trace": timing.trace}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                piece = _parse_stream_line(line)
+                if piece is _STREAM_DONE:
+                    break
+                if piece:
+                    timing.mark_first_token()
+                    parts.append(piece)
+                    yield piece
+        ok = True
+    except (asyncio.CancelledError, GeneratorExit):
+        cancelled = True
+        raise
+    except httpx.ConnectError:
+        logging.error("AI Service: Connection to Llama.cpp server failed.")
+        raise AiStreamError(CONNECT_ERROR_TEXT)
+    except httpx.HTTPError as e:
+        logging.error(f"AI Stream Exception: {e}")
+        raise AiStreamError(FAILURE_TEXT)
+    finally:
+        ai_metrics.record(timing.finish(), ok, cancelled)
+
+    text = "".join(parts).strip()
+    if text:
+        ai_response_cache.put(key, text, (context or {}).get("id"))
@@ -0,0 +1,160 @@
+"""
+Фоновые сводки LLM по студентам группы риска.
+
+Операторы открывают /at-risk и по очереди жмут "спросить ИИ". Фоновая задача заранее
+проходит ту же когорту (топ по risk_score) и, пока llama.cpp простаивает, генерирует
+сводку с приоритетом BACKGROUND. Сводка хранится в ai_summaries вместе с отпечатком
+промпта. Если ELO, GPA, риск или группа поменялись, меняется и отпечаток: сводка
+устарела и будет перегенерирована.
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from sqlalchemy import select, desc
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Student, AiSummary
+from logic.ai_service import MODEL_NAME, analyze, load_student_contexts, prompt_fingerprint
+from logic.llm_scheduler import llm_scheduler, SchedulerBusy, INTERACTIVE, BACKGROUND
+from logic.cache_invalidation import summaries_written
+
+SUMMARY_PROMPT = "Сводка по студенту: вердикт риска, ключевые паттерны и действия куратора."
+# Пауза между проверками "свободна ли модель"
+IDLE_POLL_INTERVAL = 1.0
+
+
+def at_risk_statement(limit: int):
+    """Когорта риска — та же выборка, что у /analytics/at-risk."""
+    return select(Student).order_by(desc(Student.risk_score)).limit(limit)
+
+
+async def load_summaries(db: AsyncSession, student_ids) -> dict[int, AiSummary]:
+    res = await db.execute(select(AiSummary).where(AiSummary.student_id.in_(list(student_ids))))
+    return {s.student_id: s for s in res.scalars().all()}
+
+
+async def store_summary(db: AsyncSession, student_id: int, fingerprint: str, text: str, elapsed_ms: int) -> dict:
+    values = {
+        "student_id": student_id,
+        "fingerprint": fingerprint,
+        "summary": text,
+        "model": MODEL_NAME,
+        "generated_at": datetime.utcnow(),
+        "generation_ms": elapsed_ms,
+    }
+    stmt = insert(AiSummary).values(**values)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[AiSummary.student_id],
+        set_={k: stmt.excluded[k] for k in values if k != "student_id"},
+    ))
+    await db.commit()
+    summaries_written(student_id)
+    return values
+
+
+async def generate_summary(
+        db: AsyncSession, student_id: int, context: dict, priority: int = INTERACTIVE,
+) -> dict | None:
+    """Генерирует и сохраняет сводку; None — модель недоступна (ошибку не храним)."""
+    started = time.perf_counter()
+    text, ok = await analyze(SUMMARY_PROMPT, context, priority=priority)
+    if not ok:
+        return None
+    elapsed_ms = round((time.perf_counter() - started) * 1000)
+    return await store_summary(db, student_id, prompt_fingerprint(SUMMARY_PROMPT, context), text, elapsed_ms)
+
+
+# --- ФОНОВАЯ ЗАДАЧА ---
+
+class SummaryWorker:
+    """Проход по когорте риска раз в AI_SUMMARY_INTERVAL; request() — внеочередной студент."""
+
+    def __init__(self):
+        self._requested: set[int] = set()
+        self._wake = asyncio.Event()
+        self.generated = 0
+        self.skipped_fresh = 0
+        self.failed = 0
+        self.last_pass_at: datetime | None = None
+        self.last_pass_ms: float | None = None
+
+    def request(self, student_id: int):
+        """Сводка студента устарела (заметил эндпоинт профиля) — перегенерировать в фоне."""
+        self._requested.add(student_id)
+        self._wake.set()
+
+    async def _wait_idle(self):
+        while not llm_scheduler.is_idle():
+            await asyncio.sleep(IDLE_POLL_INTERVAL)
+
+    async def run_pass(self) -> int:
+        """Один проход; возвращает число сгенерированных сводок."""
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as session:
+            cohort = (await session.execute(
+                at_risk_statement(settings.AI_SUMMARY_COHORT).with_only_columns(Student.id)
+            )).scalars().all()
+            # Запрошенные профилем — первыми
+            requested, self._requested = self._requested, set()
+            order = list(requested) + [i for i in cohort if i not in requested]
+
+            contexts = await load_student_contexts(session, order)
+            fingerprints = {i: s.fingerprint for i, s in (await load_summaries(session, order)).items()}
+
+        generated = 0
+        for student_id in order:
+            context = contexts.get(student_id)
+            if context is None:
+                continue
+            if fingerprints.get(student_id) == prompt_fingerprint(SUMMARY_PROMPT, context):
+                self.skipped_fresh += 1
+                continue
+            await self._wait_idle()
+            try:
+                # Сессия — только на запись: пока модель думает, соединение с БД не занято
+                async with AsyncSessionLocal() as session:
+                    result = await generate_summary(session, student_id, context, priority=BACKGROUND)
+            except SchedulerBusy:
+                # Вытеснены интерактивным запросом — вернемся к студенту в следующем проходе
+                self._requested.add(student_id)
+                break
+            if result is None:
+                self.failed += 1
+                break  # модель недоступна, не долбим ее по каждому студенту
+            generated += 1
+
+        self.generated += generated
+        self.last_pass_at = datetime.utcnow()
+        self.last_pass_ms = round((time.perf_counter() - started) * 1000, 1)
+        return generated
+
+    def summary(self) -> dict:
+        return {
+            "generated": self.generated,
+            "skipped_fresh": self.skipped_fresh,
+            "failed": self.failed,
+            "pending": len(self._requested),
+            "last_pass_at": self.last_pass_at.isoformat() if self.last_pass_at else None,
+            "last_pass_ms": self.last_pass_ms,
+        }
+
+    async def run_forever(self):
+        """Фоновая задача (lifespan)."""
+        while True:
+            self._wake.clear()
+            try:
+                if await self.run_pass():
+                    print(f"🧠 AI summaries: {self.summary()}")
+            except Exception as e:
+                print(f"⚠ AI Summary Worker Error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.AI_SUMMARY_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+summary_worker = SummaryWorker()
@@ -0,0 +1,208 @@
+"""
+Загрузка ответов C++ модуля (exchange/data_out.*) в базу.
+
+Фоновый наблюдатель раз в ANOMALY_POLL_INTERVAL секунд смотрит на файл ответа.
+Новый файл узнаем по (inode, mtime, size). Если переписан тот же inode (дозапись),
+берем только аномалии после high-water mark — числа уже загруженных записей.
+Состояние хранится рядом с файлами обмена, так что рестарт не дублирует алерты.
+
+На каждый файл — одна транзакция и один запрос:
+WITH upd AS (UPDATE students SET risk_score ... FROM unnest RETURNING id)
+INSERT INTO security_alerts SELECT ... FROM unnest JOIN upd ON CONFLICT DO UPDATE.
+Открытый алерт анализатора у студента один (частичный уникальный индекс
+uq_security_alerts_open_cpp_student): повторный прогон обновляет его, а не плодит дубли.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select, update, literal, literal_column, case, func, and_, Integer, Float, Numeric, String, Boolean, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Student, SecurityAlert
+from logic.cpp_bridge import anomalies_path
+from logic.exchange_format import Anomalies, atomic_write, open_anomalies
+from logic.cache_invalidation import students_changed, alerts_written
+from utils.sql import unnest_table
+
+ALERT_SOURCE = "CPP_ANALYZER"
+CRITICAL_RISK = 80  # как в security_monitor: выше — CRITICAL
+
+
+def _state_path() -> str:
+    return os.path.join(settings.EXCHANGE_DIR, ".data_out.ingest.json")
+
+
+def load_state() -> dict:
+    try:
+        with open(_state_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict):
+    atomic_write(_state_path(), lambda f: json.dump(state, f), mode="w")
+
+
+def _signature(path: str, st: os.stat_result) -> list:
+    return [path, st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def start_offset(state: dict, path: str, st: os.stat_result) -> int | None:
+    """
+    Откуда читать: None — файл уже загружен, 0 — новый файл,
+    high-water mark — тот же inode переписан/дописан.
+    """
+    signature = _signature(path, st)
+    if state.get("signature") == signature:
+        return None
+    if state.get("signature", [None, None])[:2] == [path, st.st_ino]:
+        return state.get("high_water_mark", 0)
+    return 0
+
+
+def _latest_per_student(student_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Если студент встречается несколько раз — берем последнюю запись: (id, индекс записи)."""
+    unique_ids, first_from_end = np.unique(student_ids[::-1], return_index=True)
+    return unique_ids, student_ids.size - 1 - first_from_end
+
+
+def _ingest_params(anomalies: Anomalies, start: int) -> dict:
+    """Списки параметров для unnest (по одной записи на студента). CPU-работа — зовется через to_thread."""
+    ids = anomalies.student_ids[start:]
+    unique_ids, last = _latest_per_student(ids)
+    risk = anomalies.risk_scores[start:][last]
+    details = anomalies.details_from(start)
+    return {
+        "ids": unique_ids.tolist(),
+        # risk_score у студента целый 0..100
+        "risk_score": np.clip(np.rint(risk), 0, 100).astype(np.int64).tolist(),
+        "risk": risk.tolist(),
+        "details": [details[i] for i in last.tolist()],
+    }
+
+
+async def ingest_anomalies(db: AsyncSession, anomalies: Anomalies, start: int = 0) -> dict:
+    """
+    Записывает аномалии [start:] одним запросом. Commit — на вызывающем.
+    Студенты, которых нет в базе, пропускаются (и для risk_score, и для алертов).
+    На студента — последняя запись файла: она задает risk_score и текст открытого алерта.
+    """
+    count = len(anomalies) - start
+    if count <= 0:
+        return {"anomalies": 0, "student_ids": [], "alerts": 0, "alerts_updated": 0}
+
+    params = await asyncio.to_thread(_ingest_params, anomalies, start)
+    u = unnest_table(
+        "u",
+        id=(Integer, params["ids"]),
+        risk_score=(Integer, params["risk_score"]),
+        risk=(Float, params["risk"]),
+        details=(String, params["details"]),
+    )
+    upd = (
+        update(Student)
+        .where(Student.id == u.c.id)
+        .values(risk_score=u.c.risk_score)
+        .returning(Student.id)
+        .cte("upd")
+    )
+    alert = pg_insert(SecurityAlert).from_select(
+        ["student_id", "level", "message", "source", "is_resolved", "created_at"],
+        select(
+            u.c.id,
+            case((u.c.risk > CRITICAL_RISK, "CRITICAL"), else_="WARNING"),
+            func.concat(
+                "C++ anomaly for student #", u.c.id, ": ", u.c.details,
+                " (risk ", func.round(u.c.risk.cast(Numeric), 2), ")",
+            ),
+            literal(ALERT_SOURCE, String),
+            literal(False, Boolean),
+            literal(datetime.utcnow(), DateTime),
+        ).select_from(u.join(upd, upd.c.id == u.c.id)),
+    )
+    ins = (
+        alert.on_conflict_do_update(
+            index_elements=["student_id"],
+            index_where=and_(SecurityAlert.is_resolved == False, SecurityAlert.source == ALERT_SOURCE),
+            set_={"level": alert.excluded.level, "message": alert.excluded.message},
+            # Тот же текст — строку не трогаем
+            where=SecurityAlert.message.is_distinct_from(alert.excluded.message),
+        )
+        # xmax = 0 — строка вставлена, иначе обновлен открытый алерт
+        .returning(literal_column("xmax = 0", Boolean).label("inserted"))
+        .cte("ins")
+    )
+    row = (await db.execute(
+        select(
+            select(func.array_agg(upd.c.id)).scalar_subquery(),
+            select(func.count()).select_from(ins).where(ins.c.inserted).scalar_subquery(),
+            select(func.count()).select_from(ins).where(~ins.c.inserted).scalar_subquery(),
+        )
+    )).one()
+    return {"anomalies": count, "student_ids": row[0] or [], "alerts": row[1], "alerts_updated": row[2]}
+
+
+async def ingest_latest_output(state: dict | None = None) -> dict | None:
+    """
+    Одна итерация наблюдателя: если файл ответа новый или дописан — загружает новые аномалии.
+    Возвращает статистику или None, если загружать нечего.
+    """
+    path = anomalies_path()
+    if path is None:
+        return None
+    st = os.stat(path)
+    state = load_state() if state is None else state
+    start = start_offset(state, path, st)
+    if start is None:
+        return None
+
+    started = time.perf_counter()
+    # Парсинг JSON / mmap бинарника — вне event loop
+    anomalies = await asyncio.to_thread(open_anomalies, path)
+    try:
+        if _signature(path, os.stat(path)) != _signature(path, st):
+            return None  # C++ подменил файл, пока мы читали — возьмем на следующем тике
+        total = len(anomalies)
+        if start > total:  # файл переписали короче — читаем заново
+            start = 0
+        async with AsyncSessionLocal() as session:
+            stats = await ingest_anomalies(session, anomalies, start)
+            await session.commit()
+    finally:
+        anomalies.close()
+
+    state.clear()
+    state.update({"signature": _signature(path, st), "high_water_mark": total})
+    await asyncio.to_thread(save_state, state)
+
+    students_changed(*stats["student_ids"])
+    if stats["alerts"] or stats["alerts_updated"]:
+        alerts_written()
+    stats["student_ids"] = len(stats["student_ids"])
+    stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return stats
+
+
+async def watch_anomalies():
+    """Фоновый цикл (запускается из lifespan)."""
+    state = load_state()
+    while True:
+        try:
+            stats = await ingest_latest_output(state)
+            if stats and stats["anomalies"]:
+                print(
+                    f"🧪 C++ anomalies ingested: {stats['anomalies']} records, "
+                    f"{stats['student_ids']} students, {stats['alerts']} new / {stats['alerts_updated']} updated alerts "
+                    f"in {stats['elapsed_ms']} ms"
+                )
+        except Exception as e:
+            print(f"⚠ Anomaly Ingest Error: {e}")
+        await asyncio.sleep(settings.ANOMALY_POLL_INTERVAL)
@@ -0,0 +1,31 @@
+"""
+Единая точка инвалидации in-process кэшей после записи (вызывать после commit).
+Пишущий код сообщает, ЧТО изменилось, а не какие кэши сбрасывать.
+"""
+from logic.student_profile import invalidate_profile
+from logic.dashboard_stats import dashboard_snapshot
+from logic.social_graph import social_graph
+from logic.ai_cache import ai_response_cache
+
+
+def students_changed(*student_ids: int):
+    """Поля студента (ELO, XP, титулы, risk_score и т.п.): профили и ответы LLM о студенте."""
+    invalidate_profile(*student_ids)
+    ai_response_cache.invalidate_students(*student_ids)
+
+
+def grades_written(*student_ids: int):
+    """Новые оценки: профили (GPA, статистика), средний балл на дашборде, сходство в соц. графе."""
+    students_changed(*student_ids)
+    dashboard_snapshot.invalidate()
+    social_graph.grades_changed(*student_ids)
+
+
+def summaries_written(*student_ids: int):
+    """Новые сводки LLM: профили (сводка входит в профиль)."""
+    invalidate_profile(*student_ids)
+
+
+def alerts_written():
+    """Новые или закрытые алерты безопасности."""
+    dashboard_snapshot.invalidate()
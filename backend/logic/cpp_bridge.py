@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+
+from config import settings
+from logic.exchange_format import (
+    atomic_write,
+    write_students_binary,
+    open_anomalies,
+    Anomalies,
+)
+
+# --- НАСТРОЙКА МОСТА С C++ ---
+# Папка и формат задаются в config.Settings (EXCHANGE_DIR, EXCHANGE_FORMAT)
+EXCHANGE_FORMATS = ("json", "binary")
+_EXTENSIONS = {"json": "json", "binary": "bin"}
+
+
+def exchange_format() -> str:
+    fmt = settings.EXCHANGE_FORMAT.lower()
+    if fmt not in EXCHANGE_FORMATS:
+        print(f"⚠ Unknown EXCHANGE_FORMAT '{settings.EXCHANGE_FORMAT}', falling back to json")
+        return "json"
+    return fmt
+
+
+def exchange_path(name: str, fmt: str | None = None) -> str:
+    """exchange_path("data_in") -> <EXCHANGE_DIR>/data_in.json или data_in.bin."""
+    return os.path.join(settings.EXCHANGE_DIR, f"{name}.{_EXTENSIONS[fmt or exchange_format()]}")
+
+
+def write_json_atomic(path: str, payload: dict):
+    atomic_write(path, lambda f: json.dump(payload, f), mode="w")
+
+
+def write_exchange(payload: dict, fmt: str | None = None) -> str:
+    """Пишет data_in в выбранном формате. payload: {"students": [{"id", "grades", "attendance"}]}."""
+    fmt = fmt or exchange_format()
+    path = exchange_path("data_in", fmt)
+    if fmt == "binary":
+        students = payload["students"]
+        write_students_binary(
+            path,
+            [s["id"] for s in students],
+            [s["grades"] for s in students],
+            [s["attendance"] for s in students],
+        )
+    else:
+        write_json_atomic(path, payload)
+    return path
+
+
+def read_anomalies(fmt: str | None = None) -> Anomalies | None:
+    """
+    Читает data_out. Бинарный файл отображается в память без парсинга;
+    если его нет (C++ еще пишет JSON), используется data_out.json.
+    Возвращает None, если ответа от C++ еще нет. Вызывающий закрывает результат.
+    """
+    path = anomalies_path(fmt)
+    return open_anomalies(path) if path else None
+
+
+def anomalies_path(fmt: str | None = None) -> str | None:
+    """Актуальный файл ответа: data_out.bin в бинарном режиме (если есть), иначе data_out.json."""
+    candidates = [exchange_path("data_out", "json")]
+    if (fmt or exchange_format()) == "binary":
+        candidates.insert(0, exchange_path("data_out", "binary"))
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class ExchangeWriter:
+    """
+    Фоновая запись файла обмена с C++.
+    Запись идет в отдельном потоке; если за время записи пришло несколько новых
+    выгрузок, на диск попадет только последняя (коалесинг).
+    """
+
+    def __init__(self):
+        self._latest: dict | None = None
+        self._task: asyncio.Task | None = None
+        self.writes = 0
+        self.coalesced = 0
+
+    def submit(self, payload: dict):
+        if self._latest is not None:
+            self.coalesced += 1
+        self._latest = payload
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._latest is not None:
+            payload, self._latest = self._latest, None
+            try:
+                await asyncio.to_thread(write_exchange, payload)
+                self.writes += 1
+            except Exception as e:
+                print(f"⚠ C++ Bridge Error: {e}")
+
+    async def flush(self):
+        """Дождаться записи последней выгрузки (для shutdown)."""
+        if self._task is not None:
+            await self._task
+
+
+exchange_writer = ExchangeWriter()
@@ -0,0 +1,57 @@
+from sqlalchemy import select, func
+
+from database import AsyncSessionLocal
+from models import Student, SecurityAlert
+from utils.snapshot_cache import SnapshotCache
+
+# Дашборд опрашивают все открытые браузеры; снимок живет несколько секунд
+# и сбрасывается явно при записи оценок и алертов.
+DASHBOARD_CACHE_TTL = 10.0
+
+
+def _dashboard_statement():
+    """Один SELECT: студенты и средний балл из роллапов + число нерешенных алертов."""
+    active_alerts = (
+        select(func.count(SecurityAlert.id))
+        .where(SecurityAlert.is_resolved == False)
+        .scalar_subquery()
+    )
+    return select(
+        func.count(Student.id).label("total_students"),
+        (func.sum(Student.grades_sum) / func.nullif(func.sum(Student.grades_count), 0)).label("avg_score"),
+        active_alerts.label("active_alerts"),
+    )
+
+
+async def _load_dashboard_stats() -> dict:
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(_dashboard_statement())).one()
+
+    total_students = row.total_students or 0
+    active_alerts = row.active_alerts or 0
+
+    # Integrity: 100% минус 5% за каждый активный алерт
+    integrity = max(0, 100 - (active_alerts * 5))
+
+    # Средний балл
+    gpa = round(float(row.avg_score or 0) / 20, 2)
+
+    # Neural Load (среднее число студентов на группу)
+    # Просто для дашборда
+    neural_load = 0
+    if total_students > 0:
+        neural_load = round(total_students / 100, 1) # условный коэффициент
+
+    return {
+        "total_students": total_students,
+        "active_courses": 8, # заглушка или count(groups)
+        "avg_attendance_rate": integrity, # Используем integrity как показатель здоровья
+        "system_health_index": integrity,
+        "avg_gpa": gpa,
+        "users_connected": total_students,
+        "neural_load": neural_load,
+        "active_nodes": 16 # заглушка или count(teachers)
+    }
+
+
+dashboard_snapshot = SnapshotCache(_load_dashboard_stats, DASHBOARD_CACHE_TTL)
@@ -0,0 +1,274 @@
+"""
+Полный пересчет ELO из таблицы grades.
+
+Оценки читаются потоково (server-side cursor, упорядочено по студенту и дате),
+режутся на шарды по студентам и прогоняются через ELO в пуле процессов.
+Ручные корректировки (записи EloHistory не от оценок — modify_elo и т.п.) не теряются:
+они встают в ленту студента по времени и проигрываются той же дельтой.
+Результат пишется пачками: история ELO студентов шарда пересоздается,
+рейтинги проставляются одним UPDATE на шард.
+
+Запуск — лучше в окно обслуживания (параллельные оценки во время пересчета будут перезаписаны):
+    POST /api/admin/elo-replay                  # в процессе сервера, статус — GET того же пути
+    python -m logic.elo_replay --workers 8      # из папки backend
+После коммита шарда сбрасываются кэши студентов (профили, ответы LLM) и обновляется таблица
+лидеров — но только в том процессе, где идет пересчет. Запущенный из CLI пересчет кэши
+работающего сервера не видит: после него сервер нужно перезапустить.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import select, delete, insert, update, exists, func
+
+from database import AsyncSessionLocal
+from models import Student, Grade, EloHistory
+from logic.elo_system import replay_academic_sequences, FIXED_DELTA
+from logic.elo_writes import bulk_set_elo
+from logic.grade_ingest import resolve_task_type
+from logic.leaderboard import student_leaderboard
+from logic.cache_invalidation import students_changed
+from utils.commit_hooks import on_commit
+
+INITIAL_RATING = 1000
+SHARD_SIZE = 2_000      # студентов в одном шарде
+STREAM_CHUNK = 10_000   # строк за один fetch из курсора
+HISTORY_CHUNK = 20_000  # строк истории на один INSERT
+
+# Записи истории от оценок (reason "Grade: ..." — routers/students.py, grade_ingest); остальное — ручные
+GRADE_REASON_PATTERN = "Grade:%"
+IS_MANUAL = ~func.coalesce(EloHistory.reason, "").like(GRADE_REASON_PATTERN)
+
+
+def score_to_grade(score: int | None) -> int:
+    """100-балльная шкала -> 5-балльная (обратное к score * 20 в роутерах)."""
+    if score is None:
+        return 2
+    return max(2, min(5, round(score / 20)))
+
+
+def _replay_shard(shard: list, initial_rating: int):
+    """
+    Чистая функция для процесса-воркера (без БД).
+    shard: [(student_id, [(score, is_exam, task_type, date), ...], [(change, reason, date), ...]), ...]
+    Оценки и ручные корректировки сливаются по времени (при равенстве — оценка раньше).
+    Возвращает ({student_id: рейтинг}, [строки истории]).
+    """
+    sequences = {}
+    events = {}
+    for student_id, grades, manual in shard:
+        timeline = sorted(
+            [(date, 0, ("grade", score, is_exam, task_type)) for score, is_exam, task_type, date in grades]
+            + [(date, 1, ("manual", change, reason)) for change, reason, date in manual],
+            key=lambda e: (e[0] or datetime.min, e[1]),
+        )
+        steps = []
+        for _, _, event in timeline:
+            if event[0] == "grade":
+                # Тип задачи — как при живой записи (TEST не превращается в HOMEWORK)
+                steps.append((score_to_grade(event[1]), resolve_task_type(event[3], event[2])))
+            else:
+                steps.append((event[1], FIXED_DELTA))
+        sequences[student_id] = steps
+        events[student_id] = timeline
+
+    ratings = {student_id: initial_rating for student_id in sequences}
+    changes = replay_academic_sequences(ratings, sequences)
+
+    history = []
+    for student_id, steps in changes.items():
+        for (grade, task_type), (date, _, event), (prev, new, delta) in zip(
+                sequences[student_id], events[student_id], steps):
+            history.append({
+                "student_id": student_id,
+                "prev_rating": prev,
+                "new_rating": new,
+                "change_amount": delta,
+                "reason": event[2] if task_type == FIXED_DELTA else f"Grade: {grade} ({task_type})",
+                "created_at": date or datetime.min,  # оценка без даты — в начало ленты, как при сортировке
+            })
+    return ratings, history
+
+
+async def _load_manual_adjustments(student_ids: list[int]) -> dict[int, list]:
+    """Ручные записи истории студентов шарда: {student_id: [(change, reason, created_at), ...]}."""
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            select(EloHistory.student_id, EloHistory.change_amount, EloHistory.reason, EloHistory.created_at)
+            .where(EloHistory.student_id.in_(student_ids))
+            .where(IS_MANUAL)
+            .order_by(EloHistory.student_id, EloHistory.created_at, EloHistory.id)
+        )
+        manual: dict[int, list] = {}
+        for student_id, change, reason, created_at in res.all():
+            manual.setdefault(student_id, []).append((change or 0, reason, created_at))
+    return manual
+
+
+async def _write_shard(ratings: dict[int, int], history: list[dict]):
+    # История шарда пересоздается целиком: ручные записи уже пересчитаны в history
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(EloHistory)
+            .where(EloHistory.student_id.in_(list(ratings)))
+            .execution_options(synchronize_session=False)
+        )
+        for i in range(0, len(history), HISTORY_CHUNK):
+            await session.execute(insert(EloHistory), history[i:i + HISTORY_CHUNK])
+        await bulk_set_elo(session, ratings)
+        await session.commit()
+    students_changed(*ratings)
+
+
+async def _reset_students_without_grades(initial_rating: int) -> int:
+    """
+    Студенты без оценок: история — только ручные корректировки (записи от оценок удаляются),
+    рейтинг — стартовый плюс их сумма, prev/new ручных записей пересчитываются нарастающим итогом.
+    """
+    no_grades = ~exists().where(Grade.student_id == Student.id)
+    no_grade_ids = select(Student.id).where(no_grades)
+    manual_sum = (
+        select(func.coalesce(func.sum(EloHistory.change_amount), 0))
+        .where(EloHistory.student_id == Student.id)
+        .where(IS_MANUAL)
+        .scalar_subquery()
+    )
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            update(Student)
+            .where(no_grades)
+            .values(elo_rating=initial_rating + manual_sum)
+            .returning(Student.id, Student.elo_rating)
+            .execution_options(synchronize_session=False)
+        )
+        ratings = dict(res.all())
+        on_commit(session, student_leaderboard.on_ratings_changed, ratings)
+        if ratings:
+            await session.execute(
+                delete(EloHistory)
+                .where(EloHistory.student_id.in_(no_grade_ids))
+                .where(~IS_MANUAL)
+                .execution_options(synchronize_session=False)
+            )
+            running = (
+                select(
+                    EloHistory.id,
+                    func.sum(EloHistory.change_amount).over(
+                        partition_by=EloHistory.student_id, order_by=(EloHistory.created_at, EloHistory.id)
+                    ).label("total"),
+                )
+                .where(EloHistory.student_id.in_(no_grade_ids))
+                .subquery()
+            )
+            await session.execute(
+                update(EloHistory)
+                .where(EloHistory.id == running.c.id)
+                .values(
+                    prev_rating=initial_rating + running.c.total - EloHistory.change_amount,
+                    new_rating=initial_rating + running.c.total,
+                )
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
+    students_changed(*ratings)
+    return len(ratings)
+
+
+async def recompute_elo(
+        workers: int | None = None,
+        shard_size: int = SHARD_SIZE,
+        initial_rating: int = INITIAL_RATING,
+) -> dict:
+    """
+    Пересобирает Student.elo_rating и EloHistory из grades.
+    В памяти одновременно не больше ~2 * workers шардов.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    stats = {"grades": 0, "manual_adjustments": 0, "students": 0, "shards": 0}
+
+    def report(final: bool = False):
+        elapsed = time.perf_counter() - started
+        rate = stats["grades"] / elapsed if elapsed else 0.0
+        mark = "✅ ELO replay complete" if final else "⏳ ELO replay"
+        print(
+            f"{mark}: {stats['students']} students, {stats['grades']} grades, "
+            f"{stats['shards']} shards in {elapsed:.1f}s ({rate:,.0f} grades/s)"
+        )
+
+    in_flight: list[asyncio.Future] = []
+
+    async def submit(shard: list):
+        # Ручные корректировки студентов шарда — отдельным запросом (читающая сессия занята курсором)
+        manual = await _load_manual_adjustments([student_id for student_id, _ in shard])
+        stats["manual_adjustments"] += sum(len(rows) for rows in manual.values())
+        shard = [(student_id, grades, manual.get(student_id, [])) for student_id, grades in shard]
+        in_flight.append(loop.run_in_executor(pool, _replay_shard, shard, initial_rating))
+
+    async def drain(limit: int):
+        # Пишем результаты по мере готовности, пока очередь не станет меньше limit
+        while len(in_flight) > limit:
+            ratings, history = await in_flight.pop(0)
+            await _write_shard(ratings, history)
+            stats["students"] += len(ratings)
+            stats["shards"] += 1
+            if stats["shards"] % 10 == 0:
+                report()
+
+    stmt = (
+        select(Grade.student_id, Grade.score, Grade.is_exam, Grade.task_type, Grade.date)
+        .where(Grade.student_id.isnot(None))
+        .order_by(Grade.student_id, Grade.date, Grade.id)
+        .execution_options(yield_per=STREAM_CHUNK)
+    )
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        async with AsyncSessionLocal() as read_session:
+            result = await read_session.stream(stmt)
+
+            shard: list = []
+            current_id, current_grades = None, []
+            async for student_id, score, is_exam, task_type, date in result:
+                if student_id != current_id:
+                    if current_id is not None:
+                        shard.append((current_id, current_grades))
+                    current_id, current_grades = student_id, []
+
+                    if len(shard) >= shard_size:
+                        await submit(shard)
+                        shard = []
+                        await drain(max_in_flight)
+
+                current_grades.append((score, is_exam, task_type, date))
+                stats["grades"] += 1
+
+            if current_id is not None:
+                shard.append((current_id, current_grades))
+            if shard:
+                await submit(shard)
+
+        await drain(0)
+
+    stats["students_without_grades"] = await _reset_students_without_grades(initial_rating)
+    stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+    stats["grades_per_s"] = round(stats["grades"] / stats["elapsed_s"], 1) if stats["elapsed_s"] else 0.0
+    report(final=True)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild ELO ratings and history from grades")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--initial-rating", type=int, default=INITIAL_RATING)
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(recompute_elo(args.workers, args.shard_size, args.initial_rating))
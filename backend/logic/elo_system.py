@@ -1,11 +1,26 @@
 # backend/logic/elo_system.py
 import math
 
+import numpy as np
+
 # Базовые константы
 BASE_K_FACTOR = 30  # Стандартный коэффициент изменения (для обычных пар)
 COMPETITION_K_FACTOR = 100  # Хакатоны влияют сильнее
 BONUS_CAP = 50  # Максимум бонусов за поощрения в семестр
 
+# Тип задачи -> (K, сложность). Все, что не EXAM/TEST, считается HOMEWORK.
+TASK_PARAMS = {
+    "EXAM": (60, 1500),  # Экзамен сложен по дефолту
+    "TEST": (40, 1200),
+    "HOMEWORK": (20, 1000),
+}
+
+# Оценка -> результат (0.0 - 1.0). 5 -> Win, 2 -> Loss, прочее -> 0.0
+GRADE_TO_SCORE = {5: 1.0, 4: 0.75, 3: 0.25, 2: 0.0}
+
+COMPETITION_DIFFICULTY = 2000  # Сложность победы в хакатоне (ОЧЕНЬ высокая)
+PARTICIPATION_BONUS = 5
+
 
 def calculate_expected_score(student_rating, task_difficulty):
     """
@@ -23,19 +38,11 @@ def calculate_academic_change(current_rating, grade, task_type="EXAM"):
     """
     # 1. Определяем сложность задачи и "вес" (K)
     # Чем выше тип задачи, тем больше очков на кону
-    if task_type == "EXAM":
-        k_factor = 60
-        difficulty = 1500  # Экзамен сложен по дефолту
-    elif task_type == "TEST":
-        k_factor = 40
-        difficulty = 1200
-    else:  # HOMEWORK
-        k_factor = 20
-        difficulty = 1000
+    k_factor, difficulty = TASK_PARAMS.get(task_type, TASK_PARAMS["HOMEWORK"])
 
     # 2. Нормализуем оценку в результат (0.0 - 1.0)
     # 5 -> 1.0 (Win), 4 -> 0.75, 3 -> 0.25, 2 -> 0.0 (Loss)
-    actual_score = {5: 1.0, 4: 0.75, 3: 0.25, 2: 0.0}.get(grade, 0.0)
+    actual_score = GRADE_TO_SCORE.get(grade, 0.0)
 
     # 3. Считаем ожидание
     expected_score = calculate_expected_score(current_rating, difficulty)
@@ -58,7 +65,7 @@ def calculate_competition_change(current_rating, placement, participants_count=5
     placement: Место (1 - первое, 2 - второе...)
     """
     # Участие всегда дает маленький плюс (за смелость), даже если проиграл
-    participation_bonus = 5
+    participation_bonus = PARTICIPATION_BONUS
 
     if placement > 10:
         return participation_bonus
@@ -66,7 +73,7 @@ def calculate_competition_change(current_rating, placement, participants_count=5
     # Если в топе - серьезный буст
     # 1 место: K=100 * (1.0 - exp)
     # Сложность победы в хакатоне считаем как ОЧЕНЬ высокую (2000)
-    difficulty = 2000
+    difficulty = COMPETITION_DIFFICULTY
 
     # Чем выше место, тем ближе 'actual_score' к 1.0
     # 1 место = 1.0, 2 место = 0.9, 3 место = 0.8...
@@ -92,3 +99,146 @@ def apply_kudos(current_rating, bonus_amount):
     real_bonus = bonus_amount * multiplier
     # Ограничиваем влияние поощрений, чтобы не накрутили
     return round(min(real_bonus, 20))
+
+
+# =====================================================================
+# BATCH API (NumPy): те же формулы для целых когорт (хакатон, массовая пересдача).
+# Результаты бит-в-бит совпадают со скалярными функциями:
+# - 10 ** x считается через math.pow по уникальным показателям (рейтинги целые,
+#   уникальных значений мало), поэтому нет расхождений SIMD-реализации pow в 1 ulp;
+# - остальная арифметика — те же float64-операции в том же порядке;
+# - np.rint, как и round(), округляет половины к четному.
+# =====================================================================
+
+# Целые разности рейтингов в этом диапазоне считаем через таблицу (без сортировки)
+_POW_TABLE_MAX_SPAN = 1 << 20
+
+
+def _pow10_over_400(diffs: np.ndarray) -> np.ndarray:
+    """10 ** (diffs / 400), каждое уникальное значение — через math.pow."""
+    exponents = diffs / 400
+    if diffs.size == 0:
+        return exponents
+
+    low, high = diffs.min(), diffs.max()
+    if high - low < _POW_TABLE_MAX_SPAN and np.array_equal(diffs, np.rint(diffs)):
+        # Рейтинги целые: показатель определяется смещением от минимума
+        offsets = (diffs - low).astype(np.int64)
+        used = np.flatnonzero(np.bincount(offsets.ravel()))
+        table = np.empty(int(high - low) + 1, dtype=np.float64)
+        table[used] = [math.pow(10, (float(low) + k) / 400) for k in used.tolist()]
+        return table[offsets]
+
+    unique, inverse = np.unique(exponents, return_inverse=True)
+    powered = np.fromiter((math.pow(10, e) for e in unique.tolist()), dtype=np.float64, count=unique.size)
+    return powered[inverse].reshape(exponents.shape)
+
+
+def _round_int(values: np.ndarray) -> np.ndarray:
+    return np.rint(values).astype(np.int64)
+
+
+def calculate_expected_score_batch(student_ratings, task_difficulties) -> np.ndarray:
+    """Векторная версия calculate_expected_score (float64)."""
+    ratings = np.asarray(student_ratings, dtype=np.float64)
+    difficulties = np.asarray(task_difficulties, dtype=np.float64)
+    ratings, difficulties = np.broadcast_arrays(ratings, difficulties)
+    return 1 / (1 + _pow10_over_400(difficulties - ratings))
+
+
+def calculate_academic_change_batch(current_ratings, grades, task_types="EXAM") -> np.ndarray:
+    """
+    Векторная версия calculate_academic_change.
+    task_types: строка или массив строк ("HOMEWORK", "TEST", "EXAM");
+    быстрее всего с unicode-массивом numpy, а не с dtype=object.
+    Возвращает int64-массив дельт.
+    """
+    ratings = np.asarray(current_ratings, dtype=np.float64)
+    grades = np.asarray(grades)
+    ratings, grades = np.broadcast_arrays(ratings, grades)
+
+    task_types = np.broadcast_to(np.asarray(task_types, dtype=str), ratings.shape)
+    k_factor = np.full(ratings.shape, TASK_PARAMS["HOMEWORK"][0], dtype=np.float64)
+    difficulty = np.full(ratings.shape, TASK_PARAMS["HOMEWORK"][1], dtype=np.float64)
+    for task_type, (k, d) in TASK_PARAMS.items():
+        mask = task_types == task_type
+        k_factor[mask] = k
+        difficulty[mask] = d
+
+    # Таблица оценка -> результат; все, чего нет в GRADE_TO_SCORE, уходит в последнюю ячейку (0.0)
+    lut = np.zeros(max(GRADE_TO_SCORE) + 2, dtype=np.float64)
+    for grade, score in GRADE_TO_SCORE.items():
+        lut[grade] = score
+    known = np.isin(grades, list(GRADE_TO_SCORE))
+    actual_score = lut[np.where(known, grades, lut.size - 1).astype(np.int64)]
+
+    expected_score = calculate_expected_score_batch(ratings, difficulty)
+    return _round_int(k_factor * (actual_score - expected_score))
+
+
+def calculate_competition_change_batch(current_ratings, placements) -> np.ndarray:
+    """Векторная версия calculate_competition_change (participants_count на формулу не влияет)."""
+    ratings = np.asarray(current_ratings, dtype=np.float64)
+    placements = np.asarray(placements)
+    ratings, placements = np.broadcast_arrays(ratings, placements)
+
+    actual_score = np.maximum(0, 1.0 - (placements - 1) * 0.1)
+    expected_score = calculate_expected_score_batch(ratings, COMPETITION_DIFFICULTY)
+    delta = _round_int(COMPETITION_K_FACTOR * (actual_score - expected_score))
+
+    top = np.maximum(PARTICIPATION_BONUS, delta) + PARTICIPATION_BONUS
+    return np.where(placements > 10, PARTICIPATION_BONUS, top).astype(np.int64)
+
+
+def apply_kudos_batch(current_ratings, bonus_amounts) -> np.ndarray:
+    """Векторная версия apply_kudos."""
+    ratings = np.asarray(current_ratings, dtype=np.float64)
+    bonus = np.asarray(bonus_amounts, dtype=np.float64)
+    multiplier = 1000 / np.maximum(1000, ratings)
+    return _round_int(np.minimum(bonus * multiplier, 20))
+
+
+# Шаг последовательности с готовой дельтой вместо оценки: (delta, FIXED_DELTA).
+# Так пересчет истории (elo_replay) проигрывает ручные корректировки ELO на своих местах.
+FIXED_DELTA = "FIXED"
+
+
+def replay_academic_sequences(ratings: dict[int, int], sequences: dict[int, list[tuple[int, str]]]):
+    """
+    Прогоняет оценки через ELO: последовательно внутри студента, векторно по студентам.
+    Раунд r — r-я оценка каждого студента, у которого она есть (один batch-вызов на раунд).
+
+    ratings: {student_id: стартовый рейтинг} — обновляется на месте.
+    sequences: {student_id: [(grade, task_type), ...]} в порядке выставления;
+    шаг (delta, FIXED_DELTA) сдвигает рейтинг на delta как есть.
+    Возвращает {student_id: [(prev, new, delta), ...]} в том же порядке.
+    """
+    ids = list(sequences)
+    changes = {sid: [] for sid in ids}
+    if not ids:
+        return changes
+
+    # Студенты по убыванию длины: активные в раунде r — всегда префикс массива
+    ids.sort(key=lambda sid: len(sequences[sid]), reverse=True)
+    lengths = np.array([len(sequences[sid]) for sid in ids])
+    current = np.array([ratings[sid] for sid in ids], dtype=np.int64)
+
+    for r in range(int(lengths[0])):
+        n_active = int(np.searchsorted(-lengths, -r, side="left"))
+        active = ids[:n_active]
+        grades = np.array([sequences[sid][r][0] for sid in active])
+        task_types = np.array([sequences[sid][r][1] for sid in active], dtype=object)
+
+        prev = current[:n_active].copy()
+        delta = calculate_academic_change_batch(prev, grades, task_types)
+        fixed = task_types == FIXED_DELTA
+        if fixed.any():
+            delta = np.where(fixed, grades, delta)
+        current[:n_active] = prev + delta
+
+        for sid, p, d in zip(active, prev.tolist(), delta.tolist()):
+            changes[sid].append((p, p + d, d))
+
+    for sid, rating in zip(ids, current.tolist()):
+        ratings[sid] = rating
+    return changes
@@ -0,0 +1,84 @@
+import datetime
+
+from sqlalchemy import select, insert, update, literal, Integer, String, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Student, EloHistory
+from logic.leaderboard import student_leaderboard
+from utils.commit_hooks import on_commit
+from utils.sql import unnest_table
+
+
+async def bulk_set_elo(db: AsyncSession, ratings: dict[int, int]):
+    """Проставляет итоговые рейтинги пачке студентов одним UPDATE ... FROM unnest."""
+    if not ratings:
+        return
+    v = unnest_table("v", id=(Integer, ratings.keys()), elo=(Integer, ratings.values()))
+    await db.execute(
+        update(Student)
+        .where(Student.id == v.c.id)
+        .values(elo_rating=v.c.elo)
+        .execution_options(synchronize_session=False)
+    )
+    on_commit(db, student_leaderboard.on_ratings_changed, dict(ratings))
+
+
+def _history_from(upd, change, reason: str):
+    """INSERT INTO elo_history ... SELECT из CTE с обновленными строками."""
+    now = datetime.datetime.now()
+    return (
+        insert(EloHistory)
+        .from_select(
+            ["student_id", "prev_rating", "new_rating", "change_amount", "reason", "created_at"],
+            select(
+                upd.c.id,
+                upd.c.elo_rating - change,
+                upd.c.elo_rating,
+                change,
+                literal(reason, String),
+                literal(now, DateTime),
+            ),
+        )
+        .returning(EloHistory.student_id, EloHistory.prev_rating, EloHistory.new_rating)
+    )
+
+
+async def adjust_elo(db: AsyncSession, student_id: int, change: int, reason: str) -> tuple[int, int] | None:
+    """
+    Атомарно сдвигает рейтинг и пишет EloHistory одним запросом:
+    WITH upd AS (UPDATE ... RETURNING) INSERT INTO elo_history SELECT ... FROM upd.
+    Возвращает (old, new) или None, если студента нет. Commit — на вызывающем.
+    """
+    upd = (
+        update(Student)
+        .where(Student.id == student_id)
+        .values(elo_rating=Student.elo_rating + change)
+        .returning(Student.id, Student.elo_rating)
+        .cte("upd")
+    )
+    row = (await db.execute(_history_from(upd, literal(change, Integer), reason))).first()
+    if row is None:
+        return None
+    on_commit(db, student_leaderboard.on_ratings_changed, {student_id: row.new_rating})
+    return row.prev_rating, row.new_rating
+
+
+async def adjust_elo_bulk(db: AsyncSession, changes: dict[int, int], reason: str) -> dict[int, tuple[int, int]]:
+    """
+    То же для пачки студентов: один UPDATE ... FROM unnest + INSERT истории в одном запросе.
+    Возвращает {student_id: (old, new)} только для найденных студентов.
+    """
+    if not changes:
+        return {}
+    v = unnest_table("v", id=(Integer, changes.keys()), change=(Integer, changes.values()))
+    upd = (
+        update(Student)
+        .where(Student.id == v.c.id)
+        .values(elo_rating=Student.elo_rating + v.c.change)
+        .returning(Student.id, Student.elo_rating, v.c.change.label("change"))
+        .cte("upd")
+    )
+    res = await db.execute(_history_from(upd, upd.c.change, reason))
+    result = {r.student_id: (r.prev_rating, r.new_rating) for r in res.all()}
+    on_commit(db, student_leaderboard.on_ratings_changed, {sid: new for sid, (_, new) in result.items()})
+    return result
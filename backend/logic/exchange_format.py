@@ -0,0 +1,299 @@
+"""
+Бинарный колоночный формат обмена с C++ модулем анализа (версия 1).
+
+Все числа little-endian, секции выровнены по 8 байт, смещения — от начала файла.
+C++ сторона может просто сделать mmap и взять указатели на секции.
+
+data_in.bin (Python -> C++), magic b"SPXI":
+    header   <4sHHIQ + 4Q   magic, version, flags, n_students, n_grades,
+                            ids_off, grade_offsets_off, grades_off, attendance_off
+    ids            int32[n_students]
+    grade_offsets  int64[n_students + 1]   оценки студента i: grades[off[i]:off[i + 1]]
+    grades         int16[n_grades]         100-балльная шкала, MISSING_SCORE = нет балла
+    attendance     float32[n_students]
+
+data_out.bin (C++ -> Python), magic b"SPXO":
+    header   <4sHHIQ + 4Q   magic, version, flags, n_anomalies, details_bytes,
+                            student_ids_off, risk_scores_off, details_offsets_off, details_off
+    student_ids      int32[n_anomalies]
+    risk_scores      float64[n_anomalies]
+    details_offsets  uint32[n_anomalies + 1]   details[i] = blob[off[i]:off[i + 1]] (utf-8)
+    details          bytes[details_bytes]
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+FORMAT_VERSION = 1
+MAGIC_IN = b"SPXI"
+MAGIC_OUT = b"SPXO"
+MISSING_SCORE = -1
+
+_HEADER = struct.Struct("<4sHHIQ4Q")
+_ALIGN = 8
+
+
+class ExchangeFormatError(ValueError):
+    pass
+
+
+def _padded(size: int) -> int:
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _layout(arrays) -> list[int]:
+    """Смещения секций сразу после заголовка, каждая выровнена по 8 байт."""
+    offsets = []
+    pos = _padded(_HEADER.size)
+    for arr in arrays:
+        offsets.append(pos)
+        pos = _padded(pos + arr.nbytes)
+    return offsets
+
+
+def atomic_write(path: str, write, mode: str = "wb"):
+    """
+    Пишет во временный файл рядом и подменяет через os.replace —
+    читатель на той стороне никогда не увидит недописанный файл.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)  # mkstemp создает 0600, C++ может работать от другого пользователя
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_sections(path: str, header: bytes, arrays, offsets):
+    def write(f):
+        f.write(header)
+        for arr, offset in zip(arrays, offsets):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(memoryview(np.ascontiguousarray(arr)).cast("B"))
+
+    atomic_write(path, write)
+
+
+def _read_header(buf, magic: bytes) -> tuple:
+    if len(buf) < _HEADER.size:
+        raise ExchangeFormatError("File is shorter than the header")
+    fields = _HEADER.unpack_from(buf, 0)
+    if fields[0] != magic:
+        raise ExchangeFormatError(f"Bad magic {fields[0]!r}, expected {magic!r}")
+    if fields[1] != FORMAT_VERSION:
+        raise ExchangeFormatError(f"Unsupported exchange format version {fields[1]}")
+    return fields
+
+
+def _view(buf, dtype, offset: int, count: int) -> np.ndarray:
+    dtype = np.dtype(dtype)
+    if offset + dtype.itemsize * count > len(buf):
+        raise ExchangeFormatError("Section runs past the end of file")
+    return np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+
+
+# --- DATA_IN (Python -> C++) ---
+
+def write_students_binary(path: str, ids, grades, attendance):
+    """
+    ids: [int], grades: [[score, ...]] по студентам, attendance: [float].
+    Оценки None кодируются как MISSING_SCORE.
+    """
+    counts = np.fromiter((len(g) for g in grades), dtype=np.int64, count=len(grades))
+    grade_offsets = np.zeros(len(grades) + 1, dtype=np.int64)
+    np.cumsum(counts, out=grade_offsets[1:])
+    flat = np.fromiter(
+        (MISSING_SCORE if score is None else score for g in grades for score in g),
+        dtype=np.int16, count=int(grade_offsets[-1]),
+    )
+    arrays = [
+        np.asarray(ids, dtype="<i4"),
+        grade_offsets.astype("<i8", copy=False),
+        flat.astype("<i2", copy=False),
+        np.asarray(attendance, dtype="<f4"),
+    ]
+    offsets = _layout(arrays)
+    header = _HEADER.pack(MAGIC_IN, FORMAT_VERSION, 0, len(arrays[0]), flat.size, *offsets)
+    _write_sections(path, header, arrays, offsets)
+
+
+class MappedFile:
+    """mmap файла только для чтения; массивы-секции — представления без копирования."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.buf = memoryview(self._mm) if self._mm is not None else memoryview(b"")
+
+    def close(self):
+        # Пока снаружи живут представления numpy, буфер не закрыть — его освободит GC
+        try:
+            self.buf.release()
+            if self._mm is not None:
+                self._mm.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StudentsIn:
+    """Читатель data_in.bin (для проверки выгрузки и тестов C++ стороны)."""
+
+    def __init__(self, path: str):
+        self._file = MappedFile(path)
+        buf = self._file.buf
+        _, _, _, n, n_grades, ids_off, offsets_off, grades_off, att_off = _read_header(buf, MAGIC_IN)
+        self.ids = _view(buf, "<i4", ids_off, n)
+        self.grade_offsets = _view(buf, "<i8", offsets_off, n + 1)
+        self.grades = _view(buf, "<i2", grades_off, n_grades)
+        self.attendance = _view(buf, "<f4", att_off, n)
+
+    def __len__(self):
+        return self.ids.size
+
+    def grades_of(self, i: int) -> np.ndarray:
+        return self.grades[self.grade_offsets[i]:self.grade_offsets[i + 1]]
+
+    def close(self):
+        self.ids = self.grade_offsets = self.grades = self.attendance = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- DATA_OUT (C++ -> Python) ---
+
+class Anomalies:
+    """
+    Аномалии из data_out в колоночном виде: student_ids (int32) и risk_scores (float64).
+    Для бинарного файла массивы — представления над mmap (без парсинга и копий),
+    details декодируются лениво по индексу.
+    """
+
+    def __init__(self, student_ids, risk_scores, details_offsets=None, details_blob=None,
+                 details_list=None, mapped: MappedFile | None = None):
+        self.student_ids = student_ids
+        self.risk_scores = risk_scores
+        self._details_offsets = details_offsets
+        self._details_blob = details_blob
+        self._details_list = details_list
+        self._file = mapped
+
+    def __len__(self):
+        return self.student_ids.size
+
+    def details(self, i: int) -> str:
+        if self._details_list is not None:
+            return self._details_list[i]
+        start, end = int(self._details_offsets[i]), int(self._details_offsets[i + 1])
+        return bytes(self._details_blob[start:end]).decode("utf-8")
+
+    def details_from(self, start: int = 0) -> list[str]:
+        """Все details начиная с start одним проходом (для пакетной загрузки)."""
+        if self._details_list is not None:
+            return self._details_list[start:]
+        offsets = self._details_offsets[start:]
+        blob = bytes(self._details_blob[int(offsets[0]):int(offsets[-1])]) if offsets.size else b""
+        base = int(offsets[0]) if offsets.size else 0
+        bounds = (offsets - base).tolist()
+        if blob.isascii():
+            # Байтовые смещения совпадают с символьными — режем уже декодированную строку
+            text = blob.decode("ascii")
+            return [text[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+        return [blob[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+
+    def to_records(self) -> list[dict]:
+        """Формат JSON data_out: [{"student_id", "risk_score", "details"}]."""
+        return [
+            {"student_id": int(sid), "risk_score": float(score), "details": self.details(i)}
+            for i, (sid, score) in enumerate(zip(self.student_ids, self.risk_scores))
+        ]
+
+    def close(self):
+        self.student_ids = self.risk_scores = None
+        self._details_offsets = self._details_blob = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_anomalies_binary(path: str) -> Anomalies:
+    mapped = MappedFile(path)
+    try:
+        buf = mapped.buf
+        _, _, _, n, blob_size, ids_off, scores_off, det_off_off, det_off = _read_header(buf, MAGIC_OUT)
+        details_offsets = _view(buf, "<u4", det_off_off, n + 1)
+        if n and int(details_offsets[-1]) > blob_size:
+            raise ExchangeFormatError("Details offsets run past the details section")
+        return Anomalies(
+            _view(buf, "<i4", ids_off, n),
+            _view(buf, "<f8", scores_off, n),
+            details_offsets=details_offsets,
+            details_blob=_view(buf, np.uint8, det_off, blob_size),
+            mapped=mapped,
+        )
+    except BaseException:
+        mapped.close()
+        raise
+
+
+def read_anomalies_json(path: str) -> Anomalies:
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f).get("anomalies", [])
+    return Anomalies(
+        np.fromiter((r["student_id"] for r in records), dtype=np.int32, count=len(records)),
+        np.fromiter((r.get("risk_score", 0.0) for r in records), dtype=np.float64, count=len(records)),
+        details_list=[r.get("details", "") for r in records],
+    )
+
+
+def open_anomalies(path: str) -> Anomalies:
+    """Читатель по расширению: .bin — mmap, иначе JSON."""
+    if path.endswith(".bin"):
+        return read_anomalies_binary(path)
+    return read_anomalies_json(path)
+
+
+def write_anomalies_binary(path: str, student_ids, risk_scores, details):
+    """Запись data_out.bin — зеркало C++ писателя (для тестовых данных и бенчмарков)."""
+    encoded = [d.encode("utf-8") for d in details]
+    details_offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(d) for d in encoded], out=details_offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    arrays = [
+        np.asarray(student_ids, dtype="<i4"),
+        np.asarray(risk_scores, dtype="<f8"),
+        details_offsets,
+        blob,
+    ]
+    offsets = _layout(arrays)
+    header = _HEADER.pack(MAGIC_OUT, FORMAT_VERSION, 0, len(arrays[0]), blob.size, *offsets)
+    _write_sections(path, header, arrays, offsets)
@@ -0,0 +1,104 @@
+import datetime
+import time
+
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Student, Grade, EloHistory
+from logic.elo_system import replay_academic_sequences, TASK_PARAMS
+from logic.elo_writes import bulk_set_elo
+from logic.grade_rollups import apply_grade_rollups
+
+# Верхняя граница одной пачки (ids студентов уходят в IN, держимся ниже лимита параметров)
+MAX_BATCH_SIZE = 10_000
+
+
+# Допустимые оценки (5-балльная шкала)
+MIN_GRADE, MAX_GRADE = 2, 5
+
+
+def resolve_task_type(task_type: str | None, is_exam: bool) -> str:
+    """Тип задачи из TASK_PARAMS; без типа — по is_exam. Неизвестный тип — ValueError."""
+    if not task_type:
+        return "EXAM" if is_exam else "HOMEWORK"
+    resolved = task_type.upper()
+    if resolved not in TASK_PARAMS:
+        raise ValueError(f"Unknown task_type {task_type!r} (expected one of {', '.join(TASK_PARAMS)})")
+    return resolved
+
+
+async def ingest_grades(db: AsyncSession, items: list[dict]) -> dict:
+    """
+    Пакетное выставление оценок.
+    items: [{"student_id", "subject_name", "score" (2-5), "task_type", "date"}]
+    Порядок внутри студента — порядок в пачке (или по date, если она указана).
+
+    Один SELECT рейтингов, bulk INSERT оценок и истории, один UPDATE рейтингов, один commit.
+    Рейтинги читаются с FOR UPDATE (по порядку id): пока пачка пересчитывается, параллельные
+    modify_elo и пересекающиеся пачки ждут, а не перезаписываются абсолютными значениями.
+    """
+    started = time.perf_counter()
+    now = datetime.datetime.now()
+
+    student_ids = {item["student_id"] for item in items}
+    res = await db.execute(
+        select(Student.id, Student.elo_rating)
+        .where(Student.id.in_(student_ids))
+        .order_by(Student.id)
+        .with_for_update()
+    )
+    ratings = {sid: (elo or 1000) for sid, elo in res.all()}
+    missing = sorted(student_ids - ratings.keys())
+
+    accepted = [item for item in items if item["student_id"] in ratings]
+    accepted.sort(key=lambda item: item.get("date") or now)  # sort стабильный
+
+    sequences: dict[int, list[tuple[int, str]]] = {}
+    for item in accepted:
+        sequences.setdefault(item["student_id"], []).append((item["score"], item["task_type"]))
+
+    changes = replay_academic_sequences(ratings, sequences)
+
+    grade_rows = []
+    history_rows = []
+    cursor = {sid: 0 for sid in sequences}
+    for item in accepted:
+        sid = item["student_id"]
+        prev, new, delta = changes[sid][cursor[sid]]
+        cursor[sid] += 1
+
+        date = item.get("date") or now
+        grade_rows.append({
+            "student_id": sid,
+            "subject_name": item["subject_name"],
+            "score": item["score"] * 20,  # 100-балльная шкала
+            "is_exam": item["task_type"] == "EXAM",
+            "task_type": item["task_type"],
+            "is_debt": False,
+            "date": date,
+        })
+        history_rows.append({
+            "student_id": sid,
+            "prev_rating": prev,
+            "new_rating": new,
+            "change_amount": delta,
+            "reason": f"Grade: {item['score']} ({item['task_type']})",
+            "created_at": date,
+        })
+
+    if grade_rows:
+        await db.execute(insert(Grade), grade_rows)
+        await apply_grade_rollups(
+            db, [(r["student_id"], r["subject_name"], r["score"], r["date"]) for r in grade_rows]
+        )
+        await db.execute(insert(EloHistory), history_rows)
+        await bulk_set_elo(db, {sid: ratings[sid] for sid in sequences})
+    await db.commit()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "accepted": len(grade_rows),
+        "students": len(sequences),
+        "missing_student_ids": missing,
+        "elapsed_ms": round(elapsed * 1000, 1),
+    }
@@ -0,0 +1,222 @@
+"""
+Роллапы оценок: Student.grades_count/grades_sum/last_grade_at и StudentSubjectStats.
+
+Каждый путь записи оценок вызывает apply_grade_rollups в той же транзакции,
+поэтому читатели (профиль, at-risk, топ по GPA, скан, ачивки) не трогают grades.
+
+Обслуживание из папки backend:
+    python -m logic.grade_rollups backfill   # пересчитать всё из grades
+    python -m logic.grade_rollups check      # сверить роллапы с grades
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import select, update, delete, func, Integer, String, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import Student, Grade, StudentSubjectStats
+from utils.sql import unnest_table
+
+# Порог "отличной" оценки (100-балльная шкала) для excellent_count. Константа роллапа:
+# уже записанные счетчики от нее зависят, после смены настройки нужен backfill
+EXCELLENT_SCORE = settings.EXCELLENT_SCORE
+
+
+def _aggregate(grades):
+    """grades: [(student_id, subject_name, score, date)] -> дельты по студенту и по предмету."""
+    per_student: dict[int, list] = {}
+    per_subject: dict[tuple[int, str], list] = {}
+    for student_id, subject_name, score, date in grades:
+        s = per_student.setdefault(student_id, [0, 0, None])
+        p = per_subject.setdefault((student_id, subject_name), [0, 0, None, 0, None])
+        if score is not None:
+            s[0] += 1
+            s[1] += score
+            p[0] += 1
+            p[1] += score
+            p[2] = score if p[2] is None else max(p[2], score)
+            p[3] += score >= EXCELLENT_SCORE
+        if date is not None:
+            s[2] = date if s[2] is None else max(s[2], date)
+            p[4] = date if p[4] is None else max(p[4], date)
+    return per_student, per_subject
+
+
+async def apply_grade_rollups(db: AsyncSession, grades):
+    """
+    Инкрементально добавляет новые оценки в роллапы (два запроса на любую пачку).
+    Вызывать в той же транзакции, что и INSERT в grades; commit — на вызывающем.
+    """
+    per_student, per_subject = _aggregate(grades)
+    if not per_student:
+        return
+
+    s = unnest_table(
+        "s",
+        id=(Integer, per_student.keys()),
+        cnt=(Integer, [v[0] for v in per_student.values()]),
+        total=(Integer, [v[1] for v in per_student.values()]),
+        last=(DateTime, [v[2] for v in per_student.values()]),
+    )
+    await db.execute(
+        update(Student)
+        .where(Student.id == s.c.id)
+        .values(
+            grades_count=Student.grades_count + s.c.cnt,
+            grades_sum=Student.grades_sum + s.c.total,
+            last_grade_at=func.greatest(Student.last_grade_at, s.c.last),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    keys = list(per_subject)
+    values = list(per_subject.values())
+    p = unnest_table(
+        "p",
+        student_id=(Integer, [k[0] for k in keys]),
+        subject_name=(String, [k[1] for k in keys]),
+        cnt=(Integer, [v[0] for v in values]),
+        total=(Integer, [v[1] for v in values]),
+        max_score=(Integer, [v[2] for v in values]),
+        excellent=(Integer, [v[3] for v in values]),
+        last=(DateTime, [v[4] for v in values]),
+    )
+    stmt = pg_insert(StudentSubjectStats).from_select(
+        ["student_id", "subject_name", "grades_count", "grades_sum", "max_score", "excellent_count", "last_grade_at"],
+        select(p.c.student_id, p.c.subject_name, p.c.cnt, p.c.total, p.c.max_score, p.c.excellent, p.c.last),
+    )
+    table = StudentSubjectStats.__table__
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["student_id", "subject_name"],
+            set_={
+                "grades_count": table.c.grades_count + stmt.excluded.grades_count,
+                "grades_sum": table.c.grades_sum + stmt.excluded.grades_sum,
+                "max_score": func.greatest(table.c.max_score, stmt.excluded.max_score),
+                "excellent_count": table.c.excellent_count + stmt.excluded.excellent_count,
+                "last_grade_at": func.greatest(table.c.last_grade_at, stmt.excluded.last_grade_at),
+            },
+        )
+    )
+
+
+# --- BACKFILL / CHECK ---
+
+def _student_aggregate():
+    return (
+        select(
+            Grade.student_id,
+            func.count(Grade.score).label("cnt"),
+            func.coalesce(func.sum(Grade.score), 0).label("total"),
+            func.max(Grade.date).label("last"),
+        )
+        .where(Grade.student_id.isnot(None))
+        .group_by(Grade.student_id)
+        .subquery("a")
+    )
+
+
+def _subject_aggregate():
+    return (
+        select(
+            Grade.student_id,
+            Grade.subject_name,
+            func.count(Grade.score).label("cnt"),
+            func.coalesce(func.sum(Grade.score), 0).label("total"),
+            func.max(Grade.score).label("max_score"),
+            func.count().filter(Grade.score >= EXCELLENT_SCORE).label("excellent"),
+            func.max(Grade.date).label("last"),
+        )
+        .where(Grade.student_id.isnot(None))
+        .group_by(Grade.student_id, Grade.subject_name)
+    )
+
+
+async def backfill_rollups(db: AsyncSession):
+    """Пересчитывает все роллапы из grades (set-based, одна транзакция)."""
+    await db.execute(
+        update(Student)
+        .values(grades_count=0, grades_sum=0, last_grade_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    a = _student_aggregate()
+    await db.execute(
+        update(Student)
+        .where(Student.id == a.c.student_id)
+        .values(grades_count=a.c.cnt, grades_sum=a.c.total, last_grade_at=a.c.last)
+        .execution_options(synchronize_session=False)
+    )
+
+    await db.execute(delete(StudentSubjectStats))
+    await db.execute(
+        pg_insert(StudentSubjectStats).from_select(
+            ["student_id", "subject_name", "grades_count", "grades_sum", "max_score", "excellent_count", "last_grade_at"],
+            _subject_aggregate(),
+        )
+    )
+    await db.commit()
+
+
+async def check_rollups(db: AsyncSession, sample: int = 20) -> dict:
+    """Сверяет роллапы с grades. Возвращает число расхождений и примеры student_id."""
+    a = _student_aggregate()
+    student_mismatch = (
+        select(Student.id)
+        .outerjoin(a, a.c.student_id == Student.id)
+        .where(
+            (Student.grades_count != func.coalesce(a.c.cnt, 0))
+            | (Student.grades_sum != func.coalesce(a.c.total, 0))
+            | Student.last_grade_at.is_distinct_from(a.c.last)
+        )
+    )
+
+    b = _subject_aggregate().subquery("b")
+    st = StudentSubjectStats
+    joined = b.join(
+        st, (st.student_id == b.c.student_id) & (st.subject_name == b.c.subject_name), full=True
+    )
+    subject_mismatch = (
+        select(func.coalesce(b.c.student_id, st.student_id))
+        .select_from(joined)
+        .where(
+            st.student_id.is_(None)
+            | b.c.student_id.is_(None)
+            | (st.grades_count != b.c.cnt)
+            | (st.grades_sum != b.c.total)
+            | st.max_score.is_distinct_from(b.c.max_score)
+            | (st.excellent_count != b.c.excellent)
+            | st.last_grade_at.is_distinct_from(b.c.last)
+        )
+    )
+
+    report = {}
+    for name, stmt in (("students", student_mismatch), ("subjects", subject_mismatch)):
+        count = await db.scalar(select(func.count()).select_from(stmt.subquery()))
+        ids = (await db.execute(stmt.limit(sample))).scalars().all()
+        report[name] = {"mismatches": count, "sample_student_ids": sorted(set(ids))}
+    report["consistent"] = all(r["mismatches"] == 0 for r in report.values())
+    return report
+
+
+async def _main(command: str):
+    from database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        if command == "backfill":
+            await backfill_rollups(session)
+            print("✅ Grade rollups rebuilt")
+        report = await check_rollups(session)
+        print(("✅" if report["consistent"] else "❌") + f" Rollup check: {report}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grade rollups maintenance")
+    parser.add_argument("command", choices=["backfill", "check"])
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(_main(args.command))
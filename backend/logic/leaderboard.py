@@ -0,0 +1,274 @@
+import asyncio
+import bisect
+
+from sqlalchemy import select, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import object_session
+
+from models import Student
+from utils.commit_hooks import on_commit
+from utils.common import clean_student_name
+
+# Корзины Фенвика — по одной на целый рейтинг; за пределами диапазона рейтинг
+# прижимается к краю (ранг остается корректным, пока таких студентов нет).
+MIN_RATING = -1000
+MAX_RATING = 6000
+DEFAULT_RATING = 1000
+# Страховочная пересборка из БД (запись в обход бэкенда, replay из CLI)
+RESYNC_INTERVAL = 600.0
+
+
+class _Fenwick:
+    """Дерево Фенвика над счетчиками корзин: префиксная сумма и поиск k-го за O(log B)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self._top_bit = 1 << (size.bit_length() - 1)
+
+    def add(self, i: int, delta: int):
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        """Сумма корзин [0, i)."""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k: int) -> int:
+        """Индекс корзины, в которой лежит k-й элемент (k с 1)."""
+        pos = 0
+        step = self._top_bit
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+
+class StudentLeaderboard:
+    """
+    In-memory таблица лидеров по ELO.
+
+    Корзины упорядочены по убыванию рейтинга (индекс 0 — MAX_RATING), внутри корзины
+    студенты отсортированы по id. Ранг = число студентов в более высоких корзинах
+    + позиция в своей корзине: O(log B + log m). k-й по рангу — поиск по дереву.
+    Рейтинги по группам — отсортированные списки (группы маленькие).
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.ready = False
+        self._pending: list | None = None  # изменения во время фоновой загрузки
+        self._tree = _Fenwick(MAX_RATING - MIN_RATING + 1)
+        self._buckets: dict[int, list[int]] = {}      # индекс корзины -> отсортированные id
+        self._rating: dict[int, int] = {}             # id -> рейтинг
+        self._group_of: dict[int, int | None] = {}
+        self._names: dict[int, str] = {}
+        self._groups: dict[int, list[tuple[int, int]]] = {}  # group_id -> [(-рейтинг, id)]
+
+    def __len__(self):
+        return len(self._rating)
+
+    @staticmethod
+    def _bucket(rating: int) -> int:
+        return MAX_RATING - min(max(rating, MIN_RATING), MAX_RATING)
+
+    # --- ЗАГРУЗКА ---
+
+    async def load(self, db: AsyncSession):
+        """Полная загрузка из БД; изменения за время загрузки докатываются после подмены."""
+        self._pending = []
+        rows = (await db.execute(
+            select(Student.id, Student.elo_rating, Student.group_id, Student.full_name)
+        )).all()
+
+        fresh = await asyncio.to_thread(self._build, rows)
+        pending, self._pending = self._pending, None
+
+        self.__dict__.update(fresh.__dict__)
+        for op, args in pending:
+            getattr(self, op)(*args)
+        self.ready = True
+
+    @classmethod
+    def _build(cls, rows) -> "StudentLeaderboard":
+        fresh = cls()
+        for student_id, rating, group_id, full_name in rows:
+            fresh._add(student_id, rating, group_id, full_name)
+        return fresh
+
+    def _apply(self, op: str, *args):
+        if self._pending is not None:
+            self._pending.append((op, args))
+        elif self.ready:
+            getattr(self, op)(*args)
+
+    # --- ХУКИ ЗАПИСИ ---
+
+    def on_student_saved(self, student_id: int, rating: int | None, group_id: int | None, full_name: str):
+        self._apply("upsert", student_id, rating, group_id, full_name)
+
+    def on_student_deleted(self, student_id: int):
+        self._apply("remove", student_id)
+
+    # Хуки вызываются после commit (utils.commit_hooks): откаченная запись таблицу не меняет
+
+    def on_ratings_changed(self, ratings: dict[int, int]):
+        """Для Core UPDATE (elo_writes): только новые рейтинги, без имен и групп."""
+        self._apply("set_ratings", dict(ratings))
+
+    # --- ИЗМЕНЕНИЯ ---
+
+    def _add(self, student_id: int, rating: int | None, group_id: int | None, full_name: str | None):
+        rating = DEFAULT_RATING if rating is None else rating
+        bucket = self._bucket(rating)
+        self._tree.add(bucket, 1)
+        bisect.insort(self._buckets.setdefault(bucket, []), student_id)
+        self._rating[student_id] = rating
+        self._group_of[student_id] = group_id
+        self._names[student_id] = clean_student_name(full_name or "")
+        if group_id is not None:
+            bisect.insort(self._groups.setdefault(group_id, []), (-rating, student_id))
+
+    def remove(self, student_id: int):
+        rating = self._rating.pop(student_id, None)
+        if rating is None:
+            return
+        bucket = self._bucket(rating)
+        self._tree.add(bucket, -1)
+        ids = self._buckets[bucket]
+        del ids[bisect.bisect_left(ids, student_id)]
+        if not ids:
+            del self._buckets[bucket]
+        group_id = self._group_of.pop(student_id, None)
+        if group_id is not None:
+            members = self._groups[group_id]
+            del members[bisect.bisect_left(members, (-rating, student_id))]
+            if not members:
+                del self._groups[group_id]
+        self._names.pop(student_id, None)
+
+    def upsert(self, student_id: int, rating: int | None, group_id: int | None, full_name: str | None):
+        self.remove(student_id)
+        self._add(student_id, rating, group_id, full_name)
+
+    def set_ratings(self, ratings: dict[int, int]):
+        for student_id, rating in ratings.items():
+            if student_id in self._rating and self._rating[student_id] != rating:
+                self.upsert(student_id, rating, self._group_of[student_id], self._names[student_id])
+
+    # --- ЗАПРОСЫ ---
+
+    def _entry(self, student_id: int, rank: int) -> dict:
+        return {
+            "rank": rank,
+            "id": student_id,
+            "full_name": self._names[student_id],
+            "group_id": self._group_of[student_id],
+            "elo": self._rating[student_id],
+        }
+
+    def rank_of(self, student_id: int) -> int | None:
+        """Место студента (1 — лучший); при равном рейтинге выше меньший id."""
+        rating = self._rating.get(student_id)
+        if rating is None:
+            return None
+        bucket = self._bucket(rating)
+        return self._tree.prefix(bucket) + bisect.bisect_left(self._buckets[bucket], student_id) + 1
+
+    def at_rank(self, rank: int) -> int | None:
+        if rank < 1 or rank > len(self._rating):
+            return None
+        bucket = self._tree.find(rank)
+        return self._buckets[bucket][rank - self._tree.prefix(bucket) - 1]
+
+    def top(self, limit: int, offset: int = 0) -> list[dict]:
+        """Места offset+1 .. offset+limit: одна находка корзины, дальше проход по корзинам."""
+        start = offset + 1
+        first = self.at_rank(start)
+        if first is None or limit <= 0:
+            return []
+        result = []
+        rank = start
+        bucket = self._bucket(self._rating[first])
+        pos = bisect.bisect_left(self._buckets[bucket], first)
+        while len(result) < limit and bucket < self._tree.size:
+            ids = self._buckets.get(bucket)
+            if ids:
+                for student_id in ids[pos:pos + limit - len(result)]:
+                    result.append(self._entry(student_id, rank))
+                    rank += 1
+            bucket += 1
+            pos = 0
+        return result
+
+    def around(self, student_id: int, radius: int) -> dict | None:
+        """Место студента и соседи: radius выше и radius ниже."""
+        rank = self.rank_of(student_id)
+        if rank is None:
+            return None
+        start = max(1, rank - radius)
+        return {
+            "rank": rank,
+            "total": len(self._rating),
+            "elo": self._rating[student_id],
+            "neighbours": self.top(rank + radius - start + 1, start - 1),
+        }
+
+    def group_top(self, group_id: int, limit: int) -> list[dict]:
+        members = self._groups.get(group_id, [])
+        return [self._entry(student_id, i + 1) for i, (_, student_id) in enumerate(members[:limit])]
+
+
+student_leaderboard = StudentLeaderboard()
+
+
+async def resync_leaderboard():
+    """Фоновая задача (lifespan): загрузка при старте и периодическая сверка с БД."""
+    from database import AsyncSessionLocal
+
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await student_leaderboard.load(session)
+            print(f"🏁 Leaderboard loaded: {len(student_leaderboard)} students")
+        except Exception as e:
+            print(f"❌ Leaderboard Load Failed: {e}")
+        await asyncio.sleep(RESYNC_INTERVAL)
+
+
+# --- ORM СОБЫТИЯ (запись через session: оценки, генератор, ручные правки) ---
+# Срабатывают на flush; в таблицу изменения попадают после commit (значения — на момент flush).
+
+def _student_saved(target: Student):
+    on_commit(
+        object_session(target), student_leaderboard.on_student_saved,
+        target.id, target.elo_rating, target.group_id, target.full_name,
+    )
+
+
+@event.listens_for(Student, "after_insert")
+def _on_student_inserted(mapper, connection, target: Student):
+    _student_saved(target)
+
+
+@event.listens_for(Student, "after_update")
+def _on_student_updated(mapper, connection, target: Student):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("elo_rating", "group_id", "full_name")):
+        _student_saved(target)
+
+
+@event.listens_for(Student, "after_delete")
+def _on_student_deleted(mapper, connection, target: Student):
+    on_commit(object_session(target), student_leaderboard.on_student_deleted, target.id)
@@ -0,0 +1,228 @@
+"""
+Планировщик запросов к локальной LLM.
+
+llama.cpp тянет 1-2 генерации одновременно, поэтому бэкенд сам держит очередь:
+- не больше AI_MAX_CONCURRENCY запросов в llama.cpp, остальные ждут в очереди;
+- очередь ограничена AI_MAX_QUEUE: сверх нее — сразу SchedulerBusy (503), а не таймаут через 140 с;
+  интерактивный запрос при полной очереди вытесняет самый свежий фоновый;
+- приоритеты: интерактивный чат раньше фоновых сводок;
+- одинаковые промпты, которые уже в очереди или в работе, не дублируются (coalescing).
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from config import settings
+
+INTERACTIVE = 0
+BACKGROUND = 10
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class SchedulerBusy(Exception):
+    """Очередь к LLM переполнена или ожидание слишком долгое."""
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "future", "queued_at")
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.perf_counter()
+
+
+class _Shared:
+    """Один запрос к модели и все, кто ждет его результат."""
+    __slots__ = ("task", "waiters", "priority", "ticket")
+
+    def __init__(self, priority: int):
+        self.task: asyncio.Task | None = None
+        self.waiters = 0
+        self.priority = priority
+        self.ticket: _Ticket | None = None
+
+
+class LlmScheduler:
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._running = 0
+        self._queue: list[tuple[int, int, _Ticket]] = []  # heap (приоритет, порядок, билет)
+        self._seq = itertools.count()
+        self._inflight: dict[str, _Shared] = {}
+        # метрики
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.timed_out = 0
+        self._waits: dict[int, deque] = {p: deque(maxlen=500) for p in PRIORITY_NAMES}
+
+    # --- СЛОТЫ ---
+
+    def is_idle(self) -> bool:
+        """llama.cpp свободна: никто не генерирует и не ждет (для фоновых задач)."""
+        return self._running == 0 and not self._queue
+
+    def check_admission(self, priority: int = INTERACTIVE):
+        """Быстрый отказ до начала ответа (для стримов): очередь полна и вытеснять некого."""
+        if self._running < self.max_concurrency or len(self._queue) < self.max_queue:
+            return
+        if not any(p > priority for p, _, _ in self._queue):
+            self.rejected += 1
+            raise SchedulerBusy("LLM queue is full")
+
+    async def _acquire(self, priority: int, shared: _Shared | None = None):
+        if self._running < self.max_concurrency and not self._queue:
+            self._running += 1
+            self._record_wait(priority, 0.0)
+            return
+        if len(self._queue) >= self.max_queue and not self._evict_below(priority):
+            self.rejected += 1
+            raise SchedulerBusy("LLM queue is full")
+
+        ticket = _Ticket(priority, next(self._seq))
+        heapq.heappush(self._queue, (ticket.priority, ticket.seq, ticket))
+        if shared is not None:
+            shared.ticket = ticket
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._discard(ticket):
+                self.timed_out += 1
+                raise SchedulerBusy(f"LLM queue wait exceeded {self.queue_timeout:g}s")
+            # слот выдали в момент таймаута — пользуемся
+        except asyncio.CancelledError:
+            granted = ticket.future.done() and not ticket.future.cancelled() and ticket.future.exception() is None
+            if not self._discard(ticket) and granted:
+                self._release()  # слот уже выдан, но ждать его некому
+            raise
+        finally:
+            if shared is not None:
+                shared.ticket = None
+        ticket.future.result()  # SchedulerBusy, если билет вытеснили
+        self._record_wait(ticket.priority, time.perf_counter() - ticket.queued_at)
+
+    def _release(self):
+        self._running -= 1
+        while self._queue and self._running < self.max_concurrency:
+            _, _, ticket = heapq.heappop(self._queue)
+            if not ticket.future.done():
+                self._running += 1
+                ticket.future.set_result(None)
+
+    def _discard(self, ticket: _Ticket) -> bool:
+        """Убирает билет из очереди; False — его там уже нет (слот выдан или вытеснен)."""
+        for i, entry in enumerate(self._queue):
+            if entry[2] is ticket:
+                self._queue.pop(i)
+                heapq.heapify(self._queue)
+                ticket.future.cancel()
+                return True
+        return False
+
+    def _evict_below(self, priority: int) -> bool:
+        """Освобождает место в очереди: выкидывает самый свежий билет с приоритетом ниже."""
+        victims = [entry for entry in self._queue if entry[0] > priority]
+        if not victims:
+            return False
+        victim = max(victims, key=lambda entry: (entry[0], entry[1]))
+        self._queue.remove(victim)
+        heapq.heapify(self._queue)
+        victim[2].future.set_exception(SchedulerBusy("Evicted by a higher priority request"))
+        self.evicted += 1
+        return True
+
+    def _promote(self, shared: _Shared, priority: int):
+        """К фоновому запросу присоединился интерактивный — поднимаем его в очереди."""
+        if priority >= shared.priority:
+            return
+        shared.priority = priority
+        ticket = shared.ticket
+        if ticket is not None and not ticket.future.done():
+            ticket.priority = priority
+            self._queue = [(t.priority, t.seq, t) for _, _, t in self._queue]
+            heapq.heapify(self._queue)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE, shared: _Shared | None = None):
+        """Место в llama.cpp на время блока (стримы и одиночные вызовы)."""
+        await self._acquire(priority, shared)
+        try:
+            yield
+        finally:
+            self._release()
+
+    # --- ЗАПРОСЫ С ОБЪЕДИНЕНИЕМ ---
+
+    async def submit(self, key: str, factory, priority: int = INTERACTIVE):
+        """
+        Выполняет factory() (корутина запроса к модели) в слоте планировщика.
+        Если запрос с тем же key уже ждет или выполняется — ждем его результат.
+        Запрос отменяется, только когда ушли все ожидающие.
+        """
+        self.submitted += 1
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = _Shared(priority)
+            shared.task = asyncio.ensure_future(self._run(shared, factory))
+            self._inflight[key] = shared
+            shared.task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+            self._promote(shared, priority)
+
+        shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        except asyncio.CancelledError:
+            if shared.waiters == 1 and not shared.task.done():
+                shared.task.cancel()
+            raise
+        finally:
+            shared.waiters -= 1
+
+    async def _run(self, shared: _Shared, factory):
+        async with self.slot(shared.priority, shared):
+            return await factory()
+
+    # --- МЕТРИКИ ---
+
+    def _record_wait(self, priority: int, seconds: float):
+        self._waits.setdefault(priority, deque(maxlen=500)).append(seconds * 1000)
+
+    def summary(self) -> dict:
+        waits = {}
+        for priority, values in self._waits.items():
+            values = sorted(values)
+            name = PRIORITY_NAMES.get(priority, str(priority))
+            waits[name] = None if not values else {
+                "avg": round(sum(values) / len(values), 2),
+                "p95": round(values[min(len(values) - 1, int(0.95 * len(values)))], 2),
+                "max": round(values[-1], 2),
+            }
+        return {
+            "running": self._running,
+            "queue_depth": len(self._queue),
+            "queued_by_priority": {
+                PRIORITY_NAMES.get(p, str(p)): sum(1 for entry in self._queue if entry[0] == p)
+                for p in PRIORITY_NAMES
+            },
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "timed_out": self.timed_out,
+            "wait_ms": waits,
+        }
+
+
+llm_scheduler = LlmScheduler(settings.AI_MAX_CONCURRENCY, settings.AI_MAX_QUEUE, settings.AI_QUEUE_TIMEOUT)
@@ -0,0 +1,260 @@
+import asyncio
+import bisect
+
+from sqlalchemy import select, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import object_session
+
+from models import Student, Group
+from utils.commit_hooks import on_commit
+from utils.common import clean_student_name
+
+# Минимальная длина запроса (как и раньше в /search)
+MIN_QUERY_LENGTH = 2
+
+
+def _fold(text: str) -> str:
+    """Нормализация для поиска: регистр + ё/е."""
+    return text.casefold().replace("ё", "е")
+
+
+def _ngrams(text: str, n: int) -> set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class StudentNameIndex:
+    """
+    In-memory индекс по очищенным ФИО студентов.
+
+    Ранжирование: сначала совпадение с начала ФИО, затем с начала любого слова,
+    затем просто подстрока. Первые два уровня — бинарный поиск по отсортированным
+    суффиксам (с позиции каждого слова), поэтому топ-N берется за O(log n + N).
+    Подстроки — через пересечение posting-листов n-грамм с ранней остановкой.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.ready = False
+        self._pending: list | None = None  # изменения во время фоновой сборки
+        self._names: dict[int, str] = {}       # id -> очищенное ФИО (для ответа)
+        self._folded: dict[int, str] = {}      # id -> нормализованное ФИО (для поиска)
+        self._group_of: dict[int, int | None] = {}
+        self._group_names: dict[int, str] = {}
+        self._heads: list[tuple[str, int]] = []   # (ФИО целиком, id), отсортировано
+        self._tails: list[tuple[str, int]] = []   # (ФИО с позиции 2-го, 3-го... слова, id)
+        self._trigrams: dict[str, set[int]] = {}
+        self._bigrams: dict[str, set[int]] = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    # --- ПОСТРОЕНИЕ ---
+
+    async def load(self, db: AsyncSession):
+        """
+        Полная загрузка индекса (вызывается при старте).
+        Построение идет в отдельном потоке, чтобы не блокировать event loop;
+        изменения, пришедшие за это время, докатываются после подмены.
+        """
+        self._pending = []
+        groups = (await db.execute(select(Group.id, Group.name))).all()
+        students = (await db.execute(select(Student.id, Student.full_name, Student.group_id))).all()
+
+        fresh = await asyncio.to_thread(self._build, groups, students)
+        pending, self._pending = self._pending, None
+
+        self.__dict__.update(fresh.__dict__)
+        self.ready = True
+        for op, args in pending:
+            getattr(self, op)(*args)
+
+    @classmethod
+    def _build(cls, groups, students) -> "StudentNameIndex":
+        fresh = cls()
+        for group_id, name in groups:
+            fresh._group_names[group_id] = name
+        for student_id, full_name, group_id in students:
+            fresh._add(student_id, full_name, group_id, keep_sorted=False)
+        fresh._heads.sort()
+        fresh._tails.sort()
+        return fresh
+
+    def on_student_changed(self, student_id: int, full_name: str | None, group_id: int | None = None):
+        """Хук для ORM-событий (после commit). full_name=None означает удаление."""
+        if self._pending is not None:
+            self._pending.append(("on_student_changed", (student_id, full_name, group_id)))
+        elif not self.ready:
+            return
+        elif full_name is None:
+            self.remove(student_id)
+        else:
+            self.upsert(student_id, full_name, group_id)
+
+    @staticmethod
+    def _tail_positions(folded: str):
+        return [i + 1 for i, ch in enumerate(folded) if ch == " " and i + 1 < len(folded)]
+
+    def _add(self, student_id: int, full_name: str, group_id: int | None, keep_sorted: bool):
+        clean = clean_student_name(full_name or "")
+        folded = " ".join(_fold(clean).split())
+        self._names[student_id] = clean
+        self._folded[student_id] = folded
+        self._group_of[student_id] = group_id
+
+        entries = [(folded[pos:], student_id) for pos in self._tail_positions(folded)]
+        if keep_sorted:
+            bisect.insort(self._heads, (folded, student_id))
+            for entry in entries:
+                bisect.insort(self._tails, entry)
+        else:
+            self._heads.append((folded, student_id))
+            self._tails.extend(entries)
+
+        for n, table in ((3, self._trigrams), (2, self._bigrams)):
+            for gram in _ngrams(folded, n):
+                ids = table.get(gram)
+                if ids is None:
+                    table[gram] = {student_id}
+                else:
+                    ids.add(student_id)
+
+    def upsert(self, student_id: int, full_name: str, group_id: int | None):
+        self.remove(student_id)
+        self._add(student_id, full_name, group_id, keep_sorted=True)
+
+    @staticmethod
+    def _discard_sorted(items: list, entry):
+        pos = bisect.bisect_left(items, entry)
+        if pos < len(items) and items[pos] == entry:
+            del items[pos]
+
+    def remove(self, student_id: int):
+        folded = self._folded.pop(student_id, None)
+        if folded is None:
+            return
+        self._names.pop(student_id, None)
+        self._group_of.pop(student_id, None)
+
+        self._discard_sorted(self._heads, (folded, student_id))
+        for pos in self._tail_positions(folded):
+            self._discard_sorted(self._tails, (folded[pos:], student_id))
+
+        for n, table in ((3, self._trigrams), (2, self._bigrams)):
+            for gram in _ngrams(folded, n):
+                ids = table.get(gram)
+                if ids is not None:
+                    ids.discard(student_id)
+                    if not ids:
+                        del table[gram]
+
+    def set_group_name(self, group_id: int, name: str | None):
+        if self._pending is not None:
+            self._pending.append(("set_group_name", (group_id, name)))
+            return
+        if name is None:
+            self._group_names.pop(group_id, None)
+        else:
+            self._group_names[group_id] = name
+
+    # --- ПОИСК ---
+
+    @staticmethod
+    def _prefix_range(items: list, query: str):
+        lo = bisect.bisect_left(items, (query,))
+        for i in range(lo, len(items)):
+            text, student_id = items[i]
+            if not text.startswith(query):
+                break
+            yield student_id
+
+    def _substring_matches(self, query: str):
+        if len(query) >= 3:
+            table, grams = self._trigrams, _ngrams(query, 3)
+        else:
+            table, grams = self._bigrams, {query}
+
+        postings = []
+        for gram in grams:
+            ids = table.get(gram)
+            if not ids:
+                return
+            postings.append(ids)
+        postings.sort(key=len)
+        # Одна n-грамма — идем по posting-листу лениво, иначе пересечение на C
+        candidates = postings[0] if len(postings) == 1 else postings[0].intersection(*postings[1:])
+
+        for student_id in candidates:
+            if query in self._folded[student_id]:
+                yield student_id
+
+    def search(self, q: str, limit: int = 10) -> list[dict]:
+        query = " ".join(_fold(q).split())
+        if len(query) < MIN_QUERY_LENGTH or limit <= 0:
+            return []
+
+        found: dict[int, None] = {}  # упорядоченное множество
+        tiers = (
+            self._prefix_range(self._heads, query),
+            self._prefix_range(self._tails, query),
+            self._substring_matches(query),
+        )
+        for tier in tiers:
+            for student_id in tier:
+                found.setdefault(student_id)
+                if len(found) >= limit:
+                    return [self._item(sid) for sid in found]
+        return [self._item(sid) for sid in found]
+
+    def _item(self, student_id: int) -> dict:
+        group_id = self._group_of.get(student_id)
+        return {
+            "id": student_id,
+            "full_name": self._names[student_id],
+            "group_name": self._group_names.get(group_id, f"Group {group_id}"),
+        }
+
+
+student_name_index = StudentNameIndex()
+
+
+# --- ИНКРЕМЕНТАЛЬНОЕ ОБНОВЛЕНИЕ ---
+# ORM-события срабатывают на flush любого сессионного изменения студента/группы;
+# в индекс изменения попадают после commit (utils.commit_hooks), откат их выбрасывает.
+
+def _student_changed(target: Student, full_name: str | None):
+    on_commit(object_session(target), student_name_index.on_student_changed, target.id, full_name, target.group_id)
+
+
+def _group_changed(target: Group, name: str | None):
+    on_commit(object_session(target), student_name_index.set_group_name, target.id, name)
+
+
+@event.listens_for(Student, "after_insert")
+def _on_student_inserted(mapper, connection, target: Student):
+    _student_changed(target, target.full_name)
+
+
+@event.listens_for(Student, "after_update")
+def _on_student_updated(mapper, connection, target: Student):
+    # ELO/статы меняются постоянно — переиндексируем только при смене имени или группы
+    state = inspect(target)
+    if state.attrs.full_name.history.has_changes() or state.attrs.group_id.history.has_changes():
+        _student_changed(target, target.full_name)
+
+
+@event.listens_for(Student, "after_delete")
+def _on_student_deleted(mapper, connection, target: Student):
+    _student_changed(target, None)
+
+
+@event.listens_for(Group, "after_insert")
+@event.listens_for(Group, "after_update")
+def _on_group_saved(mapper, connection, target: Group):
+    _group_changed(target, target.name)
+
+
+@event.listens_for(Group, "after_delete")
+def _on_group_deleted(mapper, connection, target: Group):
+    _group_changed(target, None)
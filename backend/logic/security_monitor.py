@@ -1,78 +1,288 @@
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from models import Student, Grade, StudentAchievement, SecurityAlert, ActivityLog
+"""
+Скан безопасности и достижений.
+
+Студенты обрабатываются пачками по SCAN_CHUNK_SIZE (keyset по id). На пачку — три запроса:
+студенты с роллапом оценок (GPA без чтения grades), их статистика по предметам,
+студенты с алертом монитора. Правила ачивок (achievements_logic) считаются по пачке
+векторно; новые ачивки (ON CONFLICT DO NOTHING) и алерты вставляются пачкой.
+Запускается фоновой задачей из lifespan: сервер принимает запросы сразу,
+прогресс и скорость — в scan_progress (GET /api/admin/security-scan).
+
+Инкрементальный режим: сканируются только студенты, у которых Student.updated_at или
+updated_at их оценок не старше сохраненного watermark (таблица scan_watermarks).
+updated_at ставит база, поэтому и watermark берется из часов базы (scan_clock), а не приложения.
+Полный проход — при первом запуске и раз в SECURITY_FULL_SWEEP_INTERVAL (страховка
+от записей в обход ORM/Core, которые не трогают updated_at).
+"""
+import asyncio
+import time
 from datetime import datetime
 
-# Конфиг ачивок (дублируем или импортируем, если есть общий файл)
-ACHIEVEMENTS_RULES = {
-    "HIGH_PERFORMER": {"min_gpa": 90},  # 90 из 100
-    "SOCIAL_HUB": {"min_social": 80},
-    "IRON_WILL": {"min_stamina": 90}
-}
+from sqlalchemy import select, insert, func, union, table, column, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Student, Grade, SecurityAlert, ScanWatermark
+from logic.achievements_logic import (
+    ACHIEVEMENT_RULES, METRIC_COLUMNS, student_frame, add_subject_metrics, evaluate, grant_achievements,
+)
+from logic.cache_invalidation import students_changed, alerts_written
+
+SCAN_CHUNK_SIZE = 5000
+ALERT_SOURCE = "AI_MONITOR"
+CRITICAL_RISK = 80
+
+WATERMARK_NAME = "security_scan"
+
+_pg_stat_activity = table("pg_stat_activity", column("datname"), column("xact_start"))
+
+
+class ScanProgress:
+    def __init__(self):
+        self.status = "IDLE"  # IDLE / RUNNING / DONE / FAILED
+        self.mode: str | None = None  # FULL / INCREMENTAL
+        self.since: datetime | None = None  # watermark инкрементального прохода
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+        self.total = 0
+        self.processed = 0
+        self.chunks = 0
+        self.achievements = 0
+        self.alerts = 0
+        self.error: str | None = None
+        self._started = 0.0
+        self._elapsed = 0.0
+
+    def start(self, total: int, mode: str, since: datetime | None = None):
+        self.__init__()
+        self.status = "RUNNING"
+        self.mode = mode
+        self.since = since
+        self.started_at = datetime.utcnow()
+        self.total = total
+        self._started = time.perf_counter()
+
+    def finish(self, error: str | None = None):
+        self._elapsed = time.perf_counter() - self._started
+        self.status = "FAILED" if error else "DONE"
+        self.error = error
+        self.finished_at = datetime.utcnow()
+
+    @property
+    def running(self) -> bool:
+        return self.status == "RUNNING"
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started if self.running else self._elapsed
+
+    def as_dict(self) -> dict:
+        elapsed = self.elapsed()
+        return {
+            "status": self.status,
+            "mode": self.mode,
+            "since": self.since.isoformat() if self.since else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "total": self.total,
+            "processed": self.processed,
+            "percent": round(self.processed / self.total * 100, 1) if self.total else None,
+            "chunks": self.chunks,
+            "achievements_awarded": self.achievements,
+            "alerts_created": self.alerts,
+            "elapsed_s": round(elapsed, 2),
+            "students_per_s": round(self.processed / elapsed) if elapsed > 0 else None,
+            "error": self.error,
+        }
+
+
+scan_progress = ScanProgress()
+
+
+async def _scan_chunk(session: AsyncSession, where, now: datetime) -> tuple[list, list, list]:
+    """Одна пачка студентов (по условию where): (id студентов пачки, новые ачивки, новые алерты)."""
+    rows = (await session.execute(
+        select(*METRIC_COLUMNS, Student.full_name, Student.student_ticket)
+        .where(where)
+        .order_by(Student.id)
+        .limit(SCAN_CHUNK_SIZE)
+    )).all()
+    if not rows:
+        return [], [], []
+    ids = [r.id for r in rows]
+
+    # Все правила ачивок по пачке сразу; уже выданные отсечет уникальный индекс
+    frame = await add_subject_metrics(session, student_frame(rows), ACHIEVEMENT_RULES)
+    achievements = await grant_achievements(session, evaluate(frame, ACHIEVEMENT_RULES), now)
+
+    # Уже поднятые алерты студентов пачки
+    alerted = set((await session.execute(
+        select(SecurityAlert.student_id)
+        .where(SecurityAlert.source == ALERT_SOURCE)
+        .where(SecurityAlert.student_id.in_(ids))
+        .distinct()
+    )).scalars().all())
+
+    alerts = [
+        {
+            "student_id": r.id,
+            "level": "CRITICAL",
+            "message": f"High risk detected for student {r.full_name} ({r.student_ticket})",
+            "source": ALERT_SOURCE,
+            "is_resolved": False,
+            "created_at": now,
+        }
+        for r in rows
+        if (r.risk_score or 0) > CRITICAL_RISK and r.id not in alerted
+    ]
+    if alerts:
+        await session.execute(insert(SecurityAlert), alerts)
+    await session.commit()
+    return ids, achievements, alerts
 
 
-async def run_security_scan(session: AsyncSession):
+# --- WATERMARK ---
+
+async def load_watermark(session: AsyncSession) -> ScanWatermark | None:
+    return await session.get(ScanWatermark, WATERMARK_NAME)
+
+
+async def save_watermark(session: AsyncSession, watermark: datetime, last_full_sweep_at: datetime | None):
+    stmt = pg_insert(ScanWatermark).values(
+        name=WATERMARK_NAME, watermark=watermark, last_full_sweep_at=last_full_sweep_at
+    )
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[ScanWatermark.name],
+        set_={
+            # watermark только растет
+            "watermark": func.greatest(ScanWatermark.watermark, stmt.excluded.watermark),
+            "last_full_sweep_at": stmt.excluded.last_full_sweep_at,
+        },
+    ))
+    await session.commit()
+
+
+async def scan_clock(session: AsyncSession) -> tuple[datetime, datetime]:
+    """
+    Часы скана по базе (UTC): (начало скана, watermark для следующего прохода).
+    updated_at = now() пишущей транзакции, то есть время ее начала. Транзакция, открытая
+    до скана, закоммитит строки с updated_at из прошлого — поэтому watermark — начало самой
+    старой открытой транзакции базы (pg_stat_activity), а не "сейчас минус запас".
+    """
+    oldest = (
+        select(func.min(_pg_stat_activity.c.xact_start))
+        .where(_pg_stat_activity.c.datname == func.current_database())
+        .scalar_subquery()
+    )
+    row = (await session.execute(select(
+        func.timezone("utc", func.now(), type_=DateTime),
+        # least() пропускает NULL: xact_start чужих ролей может быть не виден
+        func.timezone("utc", func.least(func.now(), oldest), type_=DateTime),
+    ))).one()
+    return row[0], row[1]
+
+
+async def changed_student_ids(session: AsyncSession, since: datetime) -> list[int]:
+    """Студенты, измененные начиная с since: сами строки students или их оценки (по индексам updated_at)."""
+    # >=: строки самой старой открытой транзакции имеют updated_at ровно в watermark
+    changed = union(
+        select(Student.id.label("id")).where(Student.updated_at >= since),
+        select(Grade.student_id.label("id")).where(Grade.updated_at >= since, Grade.student_id.is_not(None)),
+    ).subquery()
+    return (await session.execute(select(changed.c.id).order_by(changed.c.id))).scalars().all()
+
+
+def _full_sweep_due(mark: ScanWatermark | None, now: datetime) -> bool:
+    return (
+        mark is None
+        or mark.last_full_sweep_at is None
+        or (now - mark.last_full_sweep_at).total_seconds() >= settings.SECURITY_FULL_SWEEP_INTERVAL
+    )
+
+
+# --- СКАН ---
+
+async def run_security_scan(full: bool = False):
     """
     Сканирует студентов на предмет угроз и выдает достижения.
-    Запускается при старте сервера.
+    full=False — только измененные с прошлого скана (полный проход, если пора по расписанию).
+    Пачка — своя транзакция: прерванный скан не теряет сделанное, повторный не дублирует.
     """
-    print("🛡 SYSTEM SECURITY & ACHIEVEMENT SCAN INITIATED...")
-
-    # Получаем всех студентов
-    result = await session.execute(select(Student))
-    students = result.scalars().all()
-
-    for student in students:
-        try:
-            # 1. Проверка на достижения
-            # Получаем уже выданные ачивки
-            res_ach = await session.execute(
-                select(StudentAchievement).where(StudentAchievement.student_id == student.id))
-            existing_achievements = {a.achievement_code for a in res_ach.scalars().all()}
-
-            # Проверяем GPA
-            if "HIGH_PERFORMER" not in existing_achievements:
-                res_grades = await session.execute(select(Grade).where(Grade.student_id == student.id))
-                grades = res_grades.scalars().all()
-                if grades:
-                    avg = sum(g.score for g in grades) / len(grades)
-                    if avg >= ACHIEVEMENTS_RULES["HIGH_PERFORMER"]["min_gpa"]:
-                        session.add(StudentAchievement(
-                            student_id=student.id,
-                            achievement_code="HIGH_PERFORMER",
-                            earned_at=datetime.now()
-                        ))
-                        print(f"🏆 Awarded HIGH_PERFORMER to {student.full_name}")
-
-            # Проверяем Социалку
-            if "SOCIAL_HUB" not in existing_achievements:
-                if student.stat_soc >= ACHIEVEMENTS_RULES["SOCIAL_HUB"]["min_social"]:
-                    session.add(StudentAchievement(
-                        student_id=student.id,
-                        achievement_code="SOCIAL_HUB",
-                        earned_at=datetime.now()
-                    ))
-
-            # 2. Проверка на угрозы (Security)
-            if student.risk_score > 80:
-                # Проверяем, нет ли уже алерта
-                # ВАЖНО: В модели SecurityAlert нет student_id, поэтому пишем имя в текст
-                alert_msg = f"High risk detected for student {student.full_name} ({student.student_ticket})"
-
-                # Ищем похожий алерт
-                res_alert = await session.execute(select(SecurityAlert).where(SecurityAlert.message == alert_msg))
-                if not res_alert.scalar_one_or_none():
-                    session.add(SecurityAlert(
-                        level="CRITICAL",
-                        message=alert_msg,
-                        source="AI_MONITOR",
-                        is_resolved=False
-                    ))
-                    print(f"🚨 SECURITY ALERT: {student.full_name}")
-
-        except Exception as e:
-            print(f"SCAN ERROR for student #{student.id}: {e}")
-            continue
+    if scan_progress.running:
+        return scan_progress
+    scan_progress.start(0, "FULL" if full else "INCREMENTAL")
 
-    await session.commit()
-    print("✅ Security Scan Complete")
+    try:
+        async with AsyncSessionLocal() as session:
+            scan_started, next_watermark = await scan_clock(session)
+            mark = await load_watermark(session)
+            full = full or _full_sweep_due(mark, scan_started)
+            if full:
+                changed_ids = []
+                scan_progress.total = await session.scalar(select(func.count(Student.id))) or 0
+            else:
+                changed_ids = await changed_student_ids(session, mark.watermark)
+                scan_progress.total = len(changed_ids)
+        scan_progress.mode = "FULL" if full else "INCREMENTAL"
+        scan_progress.since = None if full else mark.watermark
+        print(f"🛡 SYSTEM SECURITY & ACHIEVEMENT SCAN INITIATED ({scan_progress.mode}, {scan_progress.total} students)...")
+
+        # Полный проход — keyset по id, инкрементальный — пачки из списка измененных
+        after_id, offset = 0, 0
+        while True:
+            if full:
+                where = Student.id > after_id
+            elif offset < len(changed_ids):
+                where = Student.id.in_(changed_ids[offset:offset + SCAN_CHUNK_SIZE])
+                offset += SCAN_CHUNK_SIZE
+            else:
+                break
+            now = datetime.utcnow()
+            async with AsyncSessionLocal() as session:
+                ids, achievements, alerts = await _scan_chunk(session, where, now)
+            if not ids:
+                if full:
+                    break
+                continue  # студентов пачки успели удалить
+            after_id = ids[-1]
+            scan_progress.chunks += 1
+            scan_progress.processed += len(ids)
+            scan_progress.achievements += len(achievements)
+            scan_progress.alerts += len(alerts)
+
+            if achievements:
+                students_changed(*{student_id for student_id, _ in achievements})
+            if alerts:
+                alerts_written()
+            # Отдаем event loop обработке запросов между пачками
+            await asyncio.sleep(0)
+
+        async with AsyncSessionLocal() as session:
+            await save_watermark(
+                session,
+                next_watermark,
+                scan_started if full else (mark.last_full_sweep_at if mark else None),
+            )
+    except asyncio.CancelledError:
+        scan_progress.finish("cancelled")
+        raise
+    except Exception as e:
+        scan_progress.finish(str(e))
+        print(f"❌ Security Scan Failed: {e}")
+        return scan_progress
+
+    scan_progress.finish()
+    p = scan_progress.as_dict()
+    print(
+        f"✅ Security Scan Complete: {p['processed']} students in {p['elapsed_s']}s "
+        f"({p['students_per_s']}/s), {p['achievements_awarded']} achievements, {p['alerts_created']} alerts"
+    )
+    return scan_progress
+
+
+async def security_scan_loop():
+    """Фоновая задача (lifespan): скан при старте и затем раз в SECURITY_SCAN_INTERVAL."""
+    while True:
+        await run_security_scan()
+        await asyncio.sleep(settings.SECURITY_SCAN_INTERVAL)
@@ -0,0 +1,399 @@
+"""
+Социальный граф студентов.
+
+Связи двух видов:
+  group   — одногруппники (матрица инцидентности студент × группа, G @ G.T);
+  similar — похожие профили успеваемости: косинус между векторами средних баллов
+            по предметам (из роллапа student_subject_stats), k ближайших соседей.
+
+Вектора центрируются по предмету (ноль = "как все" / нет оценок) и нормируются,
+так что косинус — просто скалярное произведение. kNN считается блоками
+(для больших когорт — внутри кластеров k-means), без матрицы n × n.
+Смежность хранится разреженной (scipy.sparse), пересобирается целиком при изменении
+состава студентов/групп и частично — для студентов с новыми оценками.
+"""
+import asyncio
+import time
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Student, Group, StudentSubjectStats
+from utils.common import clean_student_name
+
+SIMILAR_NEIGHBOURS = 5     # k в kNN по успеваемости
+MIN_SIMILARITY = 0.6       # слабее — не связь
+GROUP_LINKS_LIMIT = 8      # связей у супер-узла группы
+LOD_NODE_THRESHOLD = 2000  # lod=auto: больше узлов — показываем группы
+EXACT_KNN_LIMIT = 20_000   # больше узлов — приближенный kNN через кластеры
+CLUSTER_SIZE = 256
+KMEANS_ITERATIONS = 5
+KNN_BLOCK = 1024
+# Полная пересборка, даже если изменения были только инкрементальные (kNN соседей дрейфует)
+FULL_REBUILD_INTERVAL = 900.0
+
+
+class _GraphData:
+    """Неизменяемый снимок графа; подменяется целиком после пересборки."""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)  # по возрастанию, позиция = индекс узла
+        self.names: list[str] = []
+        self.group_ids = np.empty(0, dtype=np.int64)  # -1 = без группы
+        self.group_names: dict[int, str] = {}
+        self.subjects: dict[str, int] = {}
+        self.vectors = np.empty((0, 0), dtype=np.float32)  # нормированные центрированные профили
+        self.subject_means = np.empty(0, dtype=np.float32)
+        self.nbr_idx = np.empty((0, SIMILAR_NEIGHBOURS), dtype=np.int64)
+        self.nbr_sim = np.empty((0, SIMILAR_NEIGHBOURS), dtype=np.float32)
+        self.similar: sparse.csr_matrix = sparse.csr_matrix((0, 0))
+        self.membership: sparse.csr_matrix = sparse.csr_matrix((0, 0))  # студент × группа
+        self.group_order = np.empty(0, dtype=np.int64)  # столбец membership -> group_id
+        self.built_at = 0.0
+
+    def __len__(self):
+        return self.ids.size
+
+    def index_of(self, student_ids) -> np.ndarray:
+        """Индексы узлов для id (только существующие)."""
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        pos = np.searchsorted(self.ids, student_ids)
+        pos = np.clip(pos, 0, max(self.ids.size - 1, 0))
+        return pos[self.ids[pos] == student_ids] if self.ids.size else pos[:0]
+
+
+def _normalize(centered: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(centered, axis=1, keepdims=True)
+    return np.divide(centered, norms, out=np.zeros_like(centered), where=norms > 0)
+
+
+def _top_similar(sims: np.ndarray, candidates: np.ndarray, rows: np.ndarray):
+    """Из матрицы сходств (строки × кандидаты) — до k лучших выше порога, без самих себя."""
+    sims = np.where(candidates[None, :] == rows[:, None], -np.inf, sims)
+    k = min(SIMILAR_NEIGHBOURS, candidates.size)
+    idx = np.full((rows.size, SIMILAR_NEIGHBOURS), -1, dtype=np.int64)
+    sim = np.zeros((rows.size, SIMILAR_NEIGHBOURS), dtype=np.float32)
+    if k == 0:
+        return idx, sim
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k] if candidates.size > k else np.tile(np.arange(k), (rows.size, 1))
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1)
+    top, top_sims = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+    keep = top_sims >= MIN_SIMILARITY
+    idx[:, :k] = np.where(keep, candidates[top], -1)
+    sim[:, :k] = np.where(keep, top_sims, 0.0)
+    return idx, sim
+
+
+def _knn_exact(vectors: np.ndarray, rows: np.ndarray):
+    """Точный kNN для rows против всех узлов: блоками, матрица n × n не строится."""
+    idx = np.full((rows.size, SIMILAR_NEIGHBOURS), -1, dtype=np.int64)
+    sim = np.zeros((rows.size, SIMILAR_NEIGHBOURS), dtype=np.float32)
+    candidates = np.arange(len(vectors))
+    for start in range(0, rows.size, KNN_BLOCK):
+        block = rows[start:start + KNN_BLOCK]
+        idx[start:start + KNN_BLOCK], sim[start:start + KNN_BLOCK] = _top_similar(
+            vectors[block] @ vectors.T, candidates, block
+        )
+    return idx, sim
+
+
+def _knn_clustered(vectors: np.ndarray, seed: int = 0):
+    """
+    Приближенный kNN для больших когорт: сферический k-means на ~n/CLUSTER_SIZE кластеров,
+    точный поиск внутри кластера. O(n · CLUSTER_SIZE · d) вместо O(n² · d).
+    """
+    n = len(vectors)
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(n, size=max(1, n // CLUSTER_SIZE), replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        labels = np.empty(n, dtype=np.int64)
+        for start in range(0, n, KNN_BLOCK * 8):
+            labels[start:start + KNN_BLOCK * 8] = np.argmax(vectors[start:start + KNN_BLOCK * 8] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        centroids = _normalize(sums)
+
+    # Кандидаты кластера — точки, для которых он первый или второй по близости (multi-probe):
+    # соседи у границы кластеров не теряются
+    second = np.empty(n, dtype=np.int64)
+    for start in range(0, n, KNN_BLOCK * 8):
+        scores = vectors[start:start + KNN_BLOCK * 8] @ centroids.T
+        scores[np.arange(scores.shape[0]), labels[start:start + KNN_BLOCK * 8]] = -np.inf
+        second[start:start + KNN_BLOCK * 8] = np.argmax(scores, axis=1) if centroids.shape[0] > 1 else labels[start:start + KNN_BLOCK * 8]
+    probe_labels = np.concatenate([labels, second])
+    probe_points = np.concatenate([np.arange(n), np.arange(n)])
+    probe_order = np.argsort(probe_labels, kind="stable")
+    probe_bounds = np.searchsorted(probe_labels[probe_order], np.arange(centroids.shape[0] + 1))
+
+    idx = np.full((n, SIMILAR_NEIGHBOURS), -1, dtype=np.int64)
+    sim = np.zeros((n, SIMILAR_NEIGHBOURS), dtype=np.float32)
+    order = np.argsort(labels, kind="stable")
+    bounds = np.searchsorted(labels[order], np.arange(centroids.shape[0] + 1))
+    for c in range(centroids.shape[0]):
+        members = order[bounds[c]:bounds[c + 1]]
+        candidates = np.unique(probe_points[probe_order[probe_bounds[c]:probe_bounds[c + 1]]])
+        for start in range(0, members.size, KNN_BLOCK):
+            block = members[start:start + KNN_BLOCK]
+            idx[block], sim[block] = _top_similar(vectors[block] @ vectors[candidates].T, candidates, block)
+    return idx, sim
+
+
+def _knn(vectors: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """k ближайших по косинусу для rows. Нулевые вектора (нет данных) ни с кем не связаны."""
+    if rows.size == 0 or vectors.shape[1] == 0:
+        return (np.full((rows.size, SIMILAR_NEIGHBOURS), -1, dtype=np.int64),
+                np.zeros((rows.size, SIMILAR_NEIGHBOURS), dtype=np.float32))
+    if rows.size == len(vectors) and rows.size > EXACT_KNN_LIMIT:
+        return _knn_clustered(vectors)
+    return _knn_exact(vectors, rows)
+
+
+def _similar_matrix(nbr_idx: np.ndarray, nbr_sim: np.ndarray, n: int) -> sparse.csr_matrix:
+    """kNN-списки -> симметричная разреженная матрица (связь есть, если хоть один выбрал другого)."""
+    rows = np.repeat(np.arange(n), nbr_idx.shape[1])
+    cols = nbr_idx.ravel()
+    mask = cols >= 0
+    m = sparse.csr_matrix((nbr_sim.ravel()[mask], (rows[mask], cols[mask])), shape=(n, n))
+    return m.maximum(m.T).tocsr()
+
+
+def _build(students, groups, stats) -> _GraphData:
+    g = _GraphData()
+    students = sorted(students)
+    g.ids = np.array([s[0] for s in students], dtype=np.int64)
+    g.names = [clean_student_name(s[1] or "") for s in students]
+    g.group_ids = np.array([s[2] if s[2] is not None else -1 for s in students], dtype=np.int64)
+    g.group_names = {gid: name for gid, name in groups}
+    n = g.ids.size
+
+    # Инцидентность студент × группа
+    g.group_order = np.unique(g.group_ids[g.group_ids >= 0])
+    has_group = np.flatnonzero(g.group_ids >= 0)
+    g.membership = sparse.csr_matrix(
+        (np.ones(has_group.size, dtype=np.float32),
+         (has_group, np.searchsorted(g.group_order, g.group_ids[has_group]))),
+        shape=(n, g.group_order.size),
+    )
+
+    # Профили успеваемости: средний балл по предмету, центрированный по предмету
+    g.subjects = {name: i for i, name in enumerate(sorted({s[1] for s in stats}))}
+    raw = np.zeros((n, len(g.subjects)), dtype=np.float32)
+    seen = np.zeros_like(raw, dtype=bool)
+    if stats:
+        rows = g.index_of([s[0] for s in stats])
+        keep = np.isin(np.array([s[0] for s in stats], dtype=np.int64), g.ids)
+        cols = np.array([g.subjects[s[1]] for s in stats])[keep]
+        raw[rows, cols] = np.array([s[2] for s in stats], dtype=np.float32)[keep]
+        seen[rows, cols] = True
+    counts = seen.sum(axis=0)
+    g.subject_means = np.divide(raw.sum(axis=0), counts, out=np.zeros(raw.shape[1], dtype=np.float32),
+                                where=counts > 0)
+    g.vectors = _normalize(np.where(seen, raw - g.subject_means, 0.0).astype(np.float32))
+
+    g.nbr_idx, g.nbr_sim = _knn(g.vectors, np.arange(n))
+    g.similar = _similar_matrix(g.nbr_idx, g.nbr_sim, n)
+    g.built_at = time.time()
+    return g
+
+
+def _update(old: _GraphData, stats) -> _GraphData:
+    """
+    Инкрементально: пересчитать профили студентов с новыми оценками и их kNN.
+    Чужие списки соседей не трогаем (до плановой полной пересборки).
+    """
+    g = _GraphData()
+    g.__dict__.update(old.__dict__)
+    changed_ids = sorted({s[0] for s in stats})
+    rows = g.index_of(changed_ids)
+    if rows.size == 0:
+        return g
+    if any(s[1] not in g.subjects for s in stats):
+        return None  # новый предмет — размерность меняется, нужна полная пересборка
+
+    raw = np.zeros((rows.size, len(g.subjects)), dtype=np.float32)
+    seen = np.zeros_like(raw, dtype=bool)
+    local = {int(g.ids[r]): i for i, r in enumerate(rows)}
+    for student_id, subject, avg in stats:
+        if student_id in local:
+            raw[local[student_id], g.subjects[subject]] = avg
+            seen[local[student_id], g.subjects[subject]] = True
+    g.vectors = g.vectors.copy()
+    g.vectors[rows] = _normalize(np.where(seen, raw - g.subject_means, 0.0).astype(np.float32))
+
+    g.nbr_idx, g.nbr_sim = g.nbr_idx.copy(), g.nbr_sim.copy()
+    g.nbr_idx[rows], g.nbr_sim[rows] = _knn(g.vectors, rows)
+    # У остальных убираем связи на пересчитанных, если те им больше не подходят
+    stale = np.isin(g.nbr_idx, rows)
+    if stale.any():
+        r, c = np.nonzero(stale)
+        cos = np.einsum("ij,ij->i", g.vectors[r], g.vectors[g.nbr_idx[r, c]])
+        drop = cos < MIN_SIMILARITY
+        g.nbr_idx[r[drop], c[drop]] = -1
+        g.nbr_sim[r[drop], c[drop]] = 0.0
+        g.nbr_sim[r[~drop], c[~drop]] = cos[~drop]
+    g.similar = _similar_matrix(g.nbr_idx, g.nbr_sim, len(g))
+    return g  # built_at не сдвигаем: отсчет до полной пересборки идет от последней полной
+
+
+class SocialGraph:
+    def __init__(self):
+        self._data: _GraphData | None = None
+        self._lock = asyncio.Lock()
+        self._full_rebuild = True
+        self._dirty_students: set[int] = set()
+
+    # --- ИНВАЛИДАЦИЯ ---
+
+    def students_changed(self):
+        """Состав студентов или групп изменился — нужна полная пересборка."""
+        self._full_rebuild = True
+
+    def grades_changed(self, *student_ids: int):
+        self._dirty_students.update(student_ids)
+
+    # --- ПОСТРОЕНИЕ ---
+
+    async def get(self, db: AsyncSession) -> _GraphData:
+        """Актуальный снимок графа (single-flight: параллельные запросы ждут одну пересборку)."""
+        if self._is_fresh():
+            return self._data
+        async with self._lock:
+            if not self._is_fresh():
+                await self._refresh(db)
+        return self._data
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._data is not None
+            and not self._full_rebuild
+            and not self._dirty_students
+            and time.time() - self._data.built_at < FULL_REBUILD_INTERVAL
+        )
+
+    async def _refresh(self, db: AsyncSession):
+        # Забираем отметки сразу: изменения во время пересборки копятся в новых.
+        # Пересборка упала — возвращаем забранное, иначе эти обновления потеряются.
+        dirty, self._dirty_students = self._dirty_students, set()
+        full_rebuild, self._full_rebuild = self._full_rebuild, False
+        try:
+            await self._rebuild(db, dirty, full_rebuild)
+        except BaseException:
+            self._dirty_students |= dirty
+            self._full_rebuild = self._full_rebuild or full_rebuild
+            raise
+
+    async def _rebuild(self, db: AsyncSession, dirty: set[int], full_rebuild: bool):
+        started = time.perf_counter()
+        full = full_rebuild or self._data is None or time.time() - self._data.built_at >= FULL_REBUILD_INTERVAL
+
+        if not full:
+            stats = (await db.execute(_stats_statement().where(StudentSubjectStats.student_id.in_(dirty)))).all()
+            updated = await asyncio.to_thread(_update, self._data, stats)
+            if updated is not None:
+                self._data = updated
+                print(f"🕸 Social graph updated: {len(dirty)} students in {(time.perf_counter() - started) * 1000:.0f} ms")
+                return
+
+        students = (await db.execute(select(Student.id, Student.full_name, Student.group_id))).all()
+        groups = (await db.execute(select(Group.id, Group.name))).all()
+        stats = (await db.execute(_stats_statement())).all()
+        self._data = await asyncio.to_thread(_build, students, groups, stats)
+        print(
+            f"🕸 Social graph built: {len(self._data)} nodes, {self._data.similar.nnz // 2} similarity edges "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    # --- ВЫДАЧА ---
+
+    @staticmethod
+    def nodes_page(g: _GraphData, offset: int, limit: int) -> list[dict]:
+        """Узлы [offset, offset + limit) по возрастанию id; связи могут вести за пределы страницы."""
+        page = np.arange(offset, min(offset + limit, len(g)))
+        if page.size == 0:
+            return []
+        # Одногруппники: строки G @ G.T для страницы
+        peers = (g.membership[page] @ g.membership.T).tocsr()
+        similar = g.similar[page]
+
+        result = []
+        for i, node in enumerate(page):
+            links = {}
+            for j in peers.indices[peers.indptr[i]:peers.indptr[i + 1]]:
+                if j != node:
+                    links[int(j)] = {"id": int(g.ids[j]), "weight": 1.0, "kind": "group"}
+            start, end = similar.indptr[i], similar.indptr[i + 1]
+            for j, w in zip(similar.indices[start:end], similar.data[start:end]):
+                if int(j) not in links:
+                    links[int(j)] = {"id": int(g.ids[j]), "weight": round(float(w), 3), "kind": "similar"}
+            group_id = int(g.group_ids[node])
+            result.append({
+                "id": int(g.ids[node]),
+                "full_name": g.names[node],
+                "group_id": group_id if group_id >= 0 else None,
+                "group_name": g.group_names.get(group_id, f"Group {group_id}") if group_id >= 0 else None,
+                "links": list(links.values()),
+            })
+        return result
+
+    @staticmethod
+    def group_nodes(g: _GraphData, offset: int, limit: int) -> list[dict]:
+        """Level of detail: группа = супер-узел, вес связи = сумма сходств между их студентами."""
+        between = (g.membership.T @ g.similar @ g.membership).tocsr()
+        sizes = np.asarray(g.membership.sum(axis=0)).ravel()
+        result = []
+        for col in range(offset, min(offset + limit, g.group_order.size)):
+            start, end = between.indptr[col], between.indptr[col + 1]
+            others = [(w, j) for j, w in zip(between.indices[start:end], between.data[start:end]) if j != col]
+            others.sort(reverse=True)
+            group_id = int(g.group_order[col])
+            name = g.group_names.get(group_id, f"Group {group_id}")
+            result.append({
+                "id": group_id,
+                "full_name": name,
+                "group_id": group_id,
+                "group_name": name,
+                "is_group": True,
+                "size": int(sizes[col]),
+                "links": [
+                    {"id": int(g.group_order[j]), "weight": round(float(w), 3), "kind": "similar"}
+                    for w, j in others[:GROUP_LINKS_LIMIT]
+                ],
+            })
+        return result
+
+
+def _stats_statement():
+    return select(
+        StudentSubjectStats.student_id,
+        StudentSubjectStats.subject_name,
+        StudentSubjectStats.grades_sum * 1.0 / StudentSubjectStats.grades_count,
+    ).where(StudentSubjectStats.grades_count > 0)
+
+
+social_graph = SocialGraph()
+
+
+# --- ORM СОБЫТИЯ: состав графа ---
+
+@event.listens_for(Student, "after_insert")
+@event.listens_for(Student, "after_delete")
+@event.listens_for(Group, "after_insert")
+@event.listens_for(Group, "after_delete")
+def _on_membership_changed(mapper, connection, target):
+    social_graph.students_changed()
+
+
+@event.listens_for(Student, "after_update")
+def _on_student_updated(mapper, connection, target: Student):
+    state = inspect(target)
+    if state.attrs.group_id.history.has_changes() or state.attrs.full_name.history.has_changes():
+        social_graph.students_changed()
+
+
+@event.listens_for(Group, "after_update")
+def _on_group_updated(mapper, connection, target: Group):
+    if inspect(target).attrs.name.history.has_changes():
+        social_graph.students_changed()
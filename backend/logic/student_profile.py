@@ -0,0 +1,147 @@
+import json
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select, func, literal, JSON, String
+from sqlalchemy.dialects.postgresql import aggregate_order_by, ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Student, Group, Title as TitleModel, StudentTitle, StudentAchievement
+from utils.common import clean_student_name
+
+# --- КЭШ ПРОФИЛЕЙ ---
+# Профиль открывается на каждый клик в поиске, поэтому держим готовые DTO в памяти.
+# TTL — страховка на случай записи в обход роутеров (генератор данных, ручной SQL).
+PROFILE_CACHE_TTL = 60.0
+PROFILE_CACHE_MAX_SIZE = 10_000
+
+_profile_cache: "OrderedDict[int, tuple[float, object]]" = OrderedDict()
+# Поколение на студента: если профиль инвалидировали, пока мы его грузили,
+# устаревший результат в кэш не попадет.
+_profile_generation: dict[int, int] = {}
+
+
+def profile_generation(student_id: int) -> int:
+    return _profile_generation.get(student_id, 0)
+
+
+def get_cached_profile(student_id: int):
+    entry = _profile_cache.get(student_id)
+    if entry is None:
+        return None
+    stored_at, profile = entry
+    if time.monotonic() - stored_at > PROFILE_CACHE_TTL:
+        _profile_cache.pop(student_id, None)
+        return None
+    _profile_cache.move_to_end(student_id)
+    return profile
+
+
+def store_profile(student_id: int, profile, generation: int):
+    if profile_generation(student_id) != generation:
+        return
+    _profile_cache[student_id] = (time.monotonic(), profile)
+    _profile_cache.move_to_end(student_id)
+    while len(_profile_cache) > PROFILE_CACHE_MAX_SIZE:
+        _profile_cache.popitem(last=False)
+
+
+def invalidate_profile(*student_ids: int):
+    """Сбрасывает закэшированные профили (вызывать после commit)."""
+    for student_id in student_ids:
+        _profile_generation[student_id] = profile_generation(student_id) + 1
+        _profile_cache.pop(student_id, None)
+
+
+# --- ЗАГРУЗКА ПРОФИЛЯ ---
+
+def _profile_statement(student_id: int):
+    """
+    Один SELECT: студент (с роллапом оценок) + группа + титулы + коды ачивок.
+    Всё, что раньше было четырьмя запросами, теперь коррелированные подзапросы.
+    """
+    titles = (
+        select(
+            func.coalesce(
+                func.json_agg(
+                    func.json_build_object(
+                        "id", TitleModel.id,
+                        "name", TitleModel.name,
+                        "color", TitleModel.color,
+                        "rarity", TitleModel.rarity,
+                    )
+                ),
+                literal("[]").cast(JSON),
+                type_=JSON,
+            )
+        )
+        .select_from(StudentTitle)
+        .join(TitleModel, TitleModel.id == StudentTitle.title_id)
+        .where(StudentTitle.student_id == Student.id)
+        .scalar_subquery()
+    )
+
+    achievement_codes = (
+        select(
+            func.array_agg(
+                aggregate_order_by(StudentAchievement.achievement_code, StudentAchievement.id),
+                type_=ARRAY(String),
+            )
+        )
+        .where(StudentAchievement.student_id == Student.id)
+        .scalar_subquery()
+    )
+
+    return (
+        select(
+            Student.id,
+            Student.full_name,
+            Student.group_id,
+            Student.status,
+            Student.risk_score,
+            Student.elo_rating,
+            Student.stat_int,
+            Student.stat_sta,
+            Student.stat_soc,
+            Student.grades_count,
+            Student.grades_sum,
+            Group.name.label("group_name"),
+            titles.label("titles"),
+            achievement_codes.label("achievement_codes"),
+        )
+        .outerjoin(Group, Group.id == Student.group_id)
+        .where(Student.id == student_id)
+    )
+
+
+async def load_student_profile(db: AsyncSession, student_id: int) -> dict | None:
+    """
+    Собирает сырые данные профиля за один round-trip.
+    Возвращает dict или None, если студента нет.
+    """
+    row = (await db.execute(_profile_statement(student_id))).first()
+    if row is None:
+        return None
+
+    titles = row.titles or []
+    if isinstance(titles, str):
+        titles = json.loads(titles)
+
+    gpa = 0.0
+    if row.grades_count:
+        gpa = round(row.grades_sum / row.grades_count / 20, 2)
+
+    return {
+        "id": row.id,
+        "full_name": clean_student_name(row.full_name),
+        "group_name": row.group_name or f"Group {row.group_id}",
+        "status": row.status,
+        "risk_score": row.risk_score,
+        "gpa": gpa,
+        "elo_rating": row.elo_rating or 1000,
+        "stat_int": row.stat_int,
+        "stat_sta": row.stat_sta,
+        "stat_soc": row.stat_soc,
+        "titles": titles,
+        "achievement_codes": [c for c in (row.achievement_codes or []) if c],
+    }
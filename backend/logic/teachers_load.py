@@ -0,0 +1,198 @@
+"""
+Нагрузка преподавателей (Teacher -> Group -> Student) одним агрегатом.
+
+По умолчанию агрегат считается на каждый запрос (teachers ⟕ groups ⟕ students).
+С TEACHERS_LOAD_MATVIEW=True тот же SELECT хранится в материализованном представлении
+teachers_load_mv: фоновая задача обновляет его раз в TEACHERS_LOAD_REFRESH_INTERVAL
+секунд или вскоре после изменения групп/студентов (ORM события).
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from sqlalchemy import select, func, event, inspect, text, table, column, Integer, String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Teacher, Group, Student
+
+NODE_CAPACITY = 80
+VIEW_NAME = "teachers_load_mv"
+# Как часто фоновая задача проверяет, не пора ли обновить представление
+DIRTY_CHECK_INTERVAL = 5.0
+
+_view = table(
+    VIEW_NAME,
+    column("teacher_id", Integer),
+    column("name", String),
+    column("groups", Integer),
+    column("students", Integer),
+)
+
+
+class _ViewState:
+    def __init__(self):
+        self.ready = False
+        self.dirty = False
+        self.refreshed_at: datetime | None = None
+        self.refresh_ms: float | None = None
+
+
+view_state = _ViewState()
+
+
+def teachers_load_statement():
+    """Один SELECT: каждый преподаватель + число курируемых групп и студентов в них."""
+    return (
+        select(
+            Teacher.id.label("teacher_id"),
+            Teacher.full_name.label("name"),
+            func.count(func.distinct(Group.id)).label("groups"),
+            func.count(Student.id).label("students"),
+        )
+        .outerjoin(Group, Group.curator_id == Teacher.id)
+        .outerjoin(Student, Student.group_id == Group.id)
+        .group_by(Teacher.id, Teacher.full_name)
+    )
+
+
+def classify(teacher_id: int, name: str, s_cnt: int, g_cnt: int) -> dict:
+    load_val = round((s_cnt / NODE_CAPACITY) * 100) if NODE_CAPACITY else 0
+
+    if load_val > 110:
+        status = "OVERLOAD"
+    elif load_val > 85:
+        status = "HIGH"
+    elif load_val < 30:
+        status = "IDLE"
+    else:
+        status = "OPTIMAL"
+
+    return {
+        "id": teacher_id,
+        "name": name,
+        "students": s_cnt,
+        "groups": g_cnt,
+        "load": load_val,
+        "status": status
+    }
+
+
+async def get_teachers_load(db: AsyncSession) -> tuple[list[dict], dict]:
+    """
+    Возвращает (строки для фронта, метаданные источника):
+    source — "matview" или "live", refreshed_at и refresh_ms — когда и сколько считался агрегат.
+    """
+    started = time.perf_counter()
+    if view_state.ready:
+        stmt = select(_view.c.teacher_id, _view.c.name, _view.c.groups, _view.c.students)
+        source = "matview"
+    else:
+        stmt = teachers_load_statement()
+        source = "live"
+    rows = (await db.execute(stmt.order_by(column("teacher_id")))).all()
+
+    result = [classify(r.teacher_id, r.name, r.students, r.groups) for r in rows]
+    result.sort(key=lambda x: x['load'], reverse=True)
+
+    if source == "matview":
+        meta = {"source": source, "refreshed_at": view_state.refreshed_at, "refresh_ms": view_state.refresh_ms}
+    else:
+        meta = {
+            "source": source,
+            "refreshed_at": datetime.utcnow(),
+            "refresh_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    return result, meta
+
+
+# --- МАТЕРИАЛИЗОВАННОЕ ПРЕДСТАВЛЕНИЕ ---
+
+def _view_ddl() -> str:
+    query = teachers_load_statement().compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    return f"CREATE MATERIALIZED VIEW IF NOT EXISTS {VIEW_NAME} AS {query}"
+
+
+async def ensure_view(db: AsyncSession):
+    """Создает представление (если нет) и уникальный индекс для REFRESH ... CONCURRENTLY."""
+    await db.execute(text(_view_ddl()))
+    await db.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{VIEW_NAME}_teacher ON {VIEW_NAME} (teacher_id)"))
+    await db.commit()
+
+
+async def refresh_view(db: AsyncSession):
+    """CONCURRENTLY — читатели не блокируются на время пересчета."""
+    started = time.perf_counter()
+    view_state.dirty = False
+    await db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {VIEW_NAME}"))
+    await db.commit()
+    view_state.refresh_ms = round((time.perf_counter() - started) * 1000, 1)
+    view_state.refreshed_at = datetime.utcnow()
+    view_state.ready = True
+
+
+async def drop_view(db: AsyncSession):
+    view_state.ready = False
+    await db.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {VIEW_NAME}"))
+    await db.commit()
+
+
+async def teachers_load_refresher():
+    """Фоновая задача (lifespan): обновляет представление по расписанию и после изменений."""
+    try:
+        async with AsyncSessionLocal() as session:
+            await ensure_view(session)
+            await refresh_view(session)
+        print(f"📐 Teachers load view ready ({view_state.refresh_ms} ms)")
+    except Exception as e:
+        print(f"❌ Teachers Load View Failed: {e}")
+        return
+
+    while True:
+        await asyncio.sleep(DIRTY_CHECK_INTERVAL)
+        age = (datetime.utcnow() - view_state.refreshed_at).total_seconds()
+        if not view_state.dirty and age < settings.TEACHERS_LOAD_REFRESH_INTERVAL:
+            continue
+        try:
+            async with AsyncSessionLocal() as session:
+                await refresh_view(session)
+        except Exception as e:
+            view_state.dirty = True
+            print(f"⚠ Teachers Load Refresh Error: {e}")
+
+
+# --- ORM СОБЫТИЯ: ПОМЕЧАЕМ ПРЕДСТАВЛЕНИЕ УСТАРЕВШИМ ---
+
+def _mark_dirty(*_):
+    view_state.dirty = True
+
+
+event.listen(Teacher, "after_insert", _mark_dirty)
+event.listen(Teacher, "after_delete", _mark_dirty)
+event.listen(Group, "after_insert", _mark_dirty)
+event.listen(Group, "after_delete", _mark_dirty)
+event.listen(Student, "after_insert", _mark_dirty)
+event.listen(Student, "after_delete", _mark_dirty)
+
+
+@event.listens_for(Teacher, "after_update")
+def _on_teacher_updated(mapper, connection, target: Teacher):
+    if inspect(target).attrs.full_name.history.has_changes():
+        view_state.dirty = True
+
+
+@event.listens_for(Group, "after_update")
+def _on_group_updated(mapper, connection, target: Group):
+    if inspect(target).attrs.curator_id.history.has_changes():
+        view_state.dirty = True
+
+
+@event.listens_for(Student, "after_update")
+def _on_student_updated(mapper, connection, target: Student):
+    # ELO/статы меняются постоянно — нагрузку меняет только смена группы
+    if inspect(target).attrs.group_id.history.has_changes():
+        view_state.dirty = True
@@ -15,10 +15,19 @@ from security_logger import log_security_event
 
 from contextlib import asynccontextmanager
 from logic.activity_generator import generate_fake_activity
-from logic.security_monitor import run_security_scan
+from logic.security_monitor import security_scan_loop
+from logic.ai_service import start_ai_client, close_ai_client
+from logic.llm_scheduler import SchedulerBusy
+from logic.ai_summaries import summary_worker
+from logic.name_index import student_name_index
+from logic.cpp_bridge import exchange_writer
+from logic.anomaly_ingest import watch_anomalies
+from logic.teachers_load import teachers_load_refresher
+from logic.leaderboard import resync_leaderboard
 
 from config import settings
 from database import AsyncSessionLocal
+from connection_manager import manager
 from routers import students, real_time, admin
 import analytics
 
@@ -63,31 +72,6 @@ class AuditMiddleware(BaseHTTPMiddleware):
         return response
 
 
-# --- WEBSOCKET MANAGER ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception:
-                # Если соединение мёртвое, можно его удалить или игнорировать ошибку
-                pass
-
-
-manager = ConnectionManager()
-
-
 # --- ФОНОВАЯ ЗАДАЧА ---
 async def background_task():
     import random
@@ -111,26 +95,55 @@ async def background_task():
                 print(f"Activity Gen Error: {e}")
 
 
+async def build_name_index():
+    async with AsyncSessionLocal() as session:
+        try:
+            await student_name_index.load(session)
+            print(f"🔎 Name index built: {len(student_name_index)} students")
+        except Exception as e:
+            print(f"❌ Name Index Build Failed: {e}")
+
+
 # --- LIFESPAN ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Backend Starting...")
     log_security_event("SYSTEM_STARTUP", "SYSTEM", "Backend initialized secure mode")
 
+    # HTTP клиент к локальной LLM: пул keep-alive соединений на все время жизни
+    await start_ai_client()
+
     # Запускаем фон
     task = asyncio.create_task(background_task())
-
-    # Сканирование безопасности при старте
-    async with AsyncSessionLocal() as session:
-        try:
-            await run_security_scan(session)
-        except Exception as e:
-            print(f"❌ Security Scan Failed: {e}")
+    # Индекс поиска по ФИО строится в фоне, до готовности /search работает через ILIKE
+    index_task = asyncio.create_task(build_name_index())
+    # Ответы C++ модуля (exchange/data_out) подхватываются автоматически
+    anomaly_task = asyncio.create_task(watch_anomalies())
+    # Таблица лидеров ELO в памяти: загрузка в фоне + периодическая сверка с БД
+    leaderboard_task = asyncio.create_task(resync_leaderboard())
+    # Нагрузка преподавателей из матпредставления (опционально, см. config)
+    load_view_task = asyncio.create_task(teachers_load_refresher()) if settings.TEACHERS_LOAD_MATVIEW else None
+    # Сводки LLM по когорте риска, пока модель простаивает (низкий приоритет)
+    summaries_task = asyncio.create_task(summary_worker.run_forever()) if settings.AI_SUMMARIES_ENABLED else None
+
+    # Сканирование безопасности при старте и периодически (инкрементально) — в фоне,
+    # прогресс в GET /api/admin/security-scan
+    scan_task = asyncio.create_task(security_scan_loop())
 
     print("✅ Startup Complete & DB Connected")
     yield
     # Завершение работы
     task.cancel()
+    index_task.cancel()
+    anomaly_task.cancel()
+    leaderboard_task.cancel()
+    if load_view_task:
+        load_view_task.cancel()
+    if summaries_task:
+        summaries_task.cancel()
+    scan_task.cancel()
+    await exchange_writer.flush()
+    await close_ai_client()
     print("🛑 Backend Shutting Down...")
     log_security_event("SYSTEM_SHUTDOWN", "SYSTEM", "Backend shutting down")
 
@@ -147,6 +160,12 @@ app = FastAPI(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+
+# Очередь к локальной LLM переполнена — отказываем сразу, клиент повторит позже
+@app.exception_handler(SchedulerBusy)
+async def llm_busy_handler(request: Request, exc: SchedulerBusy):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
 # --- 2. ВАЖНО: CORS должен быть добавлен ПОСЛЕДНИМ вызовом add_middleware,
 # чтобы он выполнялся ПЕРВЫМ при входящем запросе.
 # Мы убрали if settings... чтобы точно разрешить доступ.
@@ -156,6 +175,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # пагинация/прореживание и метаданные ответов в заголовках
+    expose_headers=["X-Next-Cursor", "X-Total-Points", "X-Load-Source", "X-Load-Refreshed-At", "X-Load-Refresh-Ms",
+                    "X-Graph-Lod", "X-Total-Nodes", "X-Next-Offset"],
 )
 
 # --- 3. Потом кастомные мидлвари (выполняются после CORS проверки)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Date, Text, Numeric, DateTime, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Date, Text, Numeric, DateTime, JSON, Index, UniqueConstraint, and_
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -61,11 +61,30 @@ class Student(Base):
     elo_rating = Column(Integer, nullable=False, default=1000)
     status = Column(String(20), default='STUDYING')
 
+    # --- GRADE ROLLUPS (поддерживаются logic/grade_rollups.py) ---
+    grades_count = Column(Integer, nullable=False, default=0, server_default="0")
+    grades_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    last_grade_at = Column(DateTime, nullable=True)
+
+    # --- CHANGE TRACKING (инкрементальный скан, logic/security_monitor.py) ---
+    # onupdate срабатывает и для Core UPDATE (роллапы, ELO батчем, ingest аномалий).
+    # Значение — SQL-выражение, а не Python: UPDATE внутри CTE (adjust_elo, ingest) Python-дефолты не получает
+    updated_at = Column(DateTime, nullable=False, onupdate=func.timezone("utc", func.now()),
+                        server_default=func.timezone("utc", func.now()), index=True)
+
     group = relationship("Group", back_populates="students")
     grades = relationship("Grade", back_populates="student")
     achievements = relationship("StudentAchievement", back_populates="student")
     user_account = relationship("User", back_populates="profile", uselist=False)
     titles = relationship("StudentTitle", back_populates="student")
+    subject_stats = relationship("StudentSubjectStats", back_populates="student")
+
+    @property
+    def gpa(self) -> float:
+        """Средний балл по 5-балльной шкале (из роллапов, без чтения grades)."""
+        if not self.grades_count:
+            return 0.0
+        return round(self.grades_sum / self.grades_count / 20, 2)
 
 
 # 5. Users (Авторизация)
@@ -89,23 +108,47 @@ class EloHistory(Base):
     new_rating = Column(Integer)
     change_amount = Column(Integer)
     reason = Column(String)
-    created_at = Column(DateTime, default=datetime.now)
+    # NOT NULL: ключ keyset-пагинации и ось X графика (NULL ломал бы курсор и прореживание)
+    created_at = Column(DateTime, nullable=False, default=datetime.now, server_default=func.localtimestamp())
+
+    # Таймлайн студента: keyset-пагинация по (created_at, id)
+    __table_args__ = (
+        Index("ix_elo_history_student_created", "student_id", "created_at", "id"),
+    )
 
 
 # 6. Grades (Оценки)
 class Grade(Base):
     __tablename__ = "grades"
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("students.id"))
+    student_id = Column(Integer, ForeignKey("students.id"), index=True)
     subject_name = Column(String(100), nullable=False)
     score = Column(Integer)
     is_exam = Column(Boolean, default=True)
+    # EXAM / TEST / HOMEWORK (elo_system.TASK_PARAMS); NULL у старых записей — тип по is_exam
+    task_type = Column(String(20), nullable=True)
     is_debt = Column(Boolean, default=False)
     date = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, onupdate=func.timezone("utc", func.now()),
+                        server_default=func.timezone("utc", func.now()), index=True)
 
     student = relationship("Student", back_populates="grades")
 
 
+# 6.1 Агрегаты оценок по предметам (роллап, поддерживается logic/grade_rollups.py)
+class StudentSubjectStats(Base):
+    __tablename__ = "student_subject_stats"
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    subject_name = Column(String(100), primary_key=True)
+    grades_count = Column(Integer, nullable=False, default=0)
+    grades_sum = Column(Integer, nullable=False, default=0)
+    max_score = Column(Integer, nullable=True)
+    excellent_count = Column(Integer, nullable=False, default=0)  # оценок >= EXCELLENT_SCORE
+    last_grade_at = Column(DateTime, nullable=True)
+
+    student = relationship("Student", back_populates="subject_stats")
+
+
 # 7. Achievements (Справочник)
 class Achievement(Base):
     __tablename__ = "achievements"
@@ -126,6 +169,11 @@ class StudentAchievement(Base):
 
     student = relationship("Student", back_populates="achievements")
 
+    __table_args__ = (
+        # Ачивка выдается один раз: выдача пачкой — INSERT ... ON CONFLICT DO NOTHING
+        UniqueConstraint("student_id", "achievement_code", name="uq_student_achievements_student_code"),
+    )
+
 
 # 9. Titles (Справочник Титулов)
 class Title(Base):
@@ -163,8 +211,45 @@ class ActivityLog(Base):
 class SecurityAlert(Base):
     __tablename__ = "security_alerts"
     id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), nullable=True)
     level = Column(String(20), default='WARNING')
     message = Column(Text)
     source = Column(String)
     is_resolved = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Лента нерешенных алертов: keyset по (created_at, id), решенные в индекс не попадают
+        Index(
+            "ix_security_alerts_unresolved_created", "created_at", "id",
+            postgresql_where=(is_resolved == False),
+        ),
+        # Дедупликация скана и алерты студента
+        Index("ix_security_alerts_student_source", "student_id", "source"),
+        # Один открытый алерт C++ анализатора на студента (anomaly_ingest: ON CONFLICT по этому индексу)
+        Index(
+            "uq_security_alerts_open_cpp_student", "student_id", unique=True,
+            postgresql_where=and_(is_resolved == False, source == "CPP_ANALYZER"),
+        ),
+    )
+
+
+# 13. AI Summaries (фоновые сводки LLM по студентам группы риска)
+class AiSummary(Base):
+    __tablename__ = "ai_summaries"
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), primary_key=True)
+    # Отпечаток промпта (ai_service.prompt_fingerprint): изменился контекст — сводка устарела
+    fingerprint = Column(String(64), nullable=False)
+    summary = Column(Text, nullable=False)
+    model = Column(String(100))
+    generated_at = Column(DateTime, default=datetime.utcnow)
+    generation_ms = Column(Integer)
+
+
+# 14. Scan Watermarks (докуда обработаны изменения фоновыми сканами)
+class ScanWatermark(Base):
+    __tablename__ = "scan_watermarks"
+    name = Column(String(50), primary_key=True)
+    # Изменения с updated_at >= watermark еще не сканировались (часы базы, UTC)
+    watermark = Column(DateTime, nullable=False)
+    last_full_sweep_at = Column(DateTime, nullable=True)
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from typing import List, Optional
@@ -6,6 +8,8 @@ from datetime import datetime
 
 from database import get_db
 from models import ActivityLog, Student
+from logic.security_monitor import run_security_scan, scan_progress
+from logic.elo_replay import recompute_elo
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -73,3 +77,57 @@ async def get_department_stats(db: AsyncSession = Depends(get_db)):
         "department_health": "Stable" if avg_risk < 30 else "Warning",  # Риск у нас 0-100
         "last_update": datetime.now().isoformat()
     }
+
+
+_scan_task: asyncio.Task | None = None  # ссылка, чтобы задачу не собрал GC
+
+
+@router.get("/security-scan")
+async def get_security_scan_status():
+    """Прогресс скана безопасности и достижений: обработано, скорость, выдано ачивок/алертов."""
+    return scan_progress.as_dict()
+
+
+@router.post("/security-scan", status_code=202)
+async def start_security_scan(full: bool = False):
+    """Запустить скан заново (в фоне): по умолчанию только измененные студенты, full=true — все."""
+    if scan_progress.running:
+        raise HTTPException(status_code=409, detail="Security scan is already running")
+    global _scan_task
+    _scan_task = asyncio.create_task(run_security_scan(full))
+    await asyncio.sleep(0)  # чтобы статус уже был RUNNING
+    return scan_progress.as_dict()
+
+
+# --- ПЕРЕСЧЕТ ELO ---
+# В процессе сервера: кэши профилей/ответов LLM и таблица лидеров сбрасываются по шардам
+_replay_task: asyncio.Task | None = None
+_replay_state: dict = {"status": "IDLE", "started_at": None, "finished_at": None, "stats": None, "error": None}
+
+
+async def _run_elo_replay(workers: Optional[int]):
+    _replay_state.update(status="RUNNING", started_at=datetime.utcnow(), finished_at=None, stats=None, error=None)
+    try:
+        stats = await recompute_elo(workers)
+        _replay_state.update(status="DONE", stats=stats)
+    except Exception as e:
+        _replay_state.update(status="FAILED", error=str(e))
+        print(f"❌ ELO Replay Failed: {e}")
+    finally:
+        _replay_state["finished_at"] = datetime.utcnow()
+
+
+@router.get("/elo-replay")
+async def get_elo_replay_status():
+    return _replay_state
+
+
+@router.post("/elo-replay", status_code=202)
+async def start_elo_replay(workers: Optional[int] = None):
+    """Полный пересчет ELO из grades (в фоне). Оценки, выставленные во время пересчета, будут перезаписаны."""
+    global _replay_task
+    if _replay_task is not None and not _replay_task.done():
+        raise HTTPException(status_code=409, detail="ELO replay is already running")
+    _replay_task = asyncio.create_task(_run_elo_replay(workers))
+    await asyncio.sleep(0)  # чтобы статус уже был RUNNING
+    return _replay_state
@@ -1,16 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, func, or_, tuple_
 from typing import List, Optional
 import datetime
 
-from database import get_db
+from database import get_db, AsyncSessionLocal
 
 # Импортируем модели (Добавил EloHistory)
-from models import Student, Grade, Title as TitleModel, StudentTitle, EloHistory
+from models import Student, Grade, Group, Title as TitleModel, StudentTitle, EloHistory
 from models import Achievement, StudentAchievement
 from logic.elo_system import calculate_academic_change
-from pydantic import BaseModel
+from logic.elo_writes import adjust_elo, adjust_elo_bulk
+from logic.grade_rollups import apply_grade_rollups
+from logic.grade_ingest import ingest_grades, resolve_task_type, MAX_BATCH_SIZE, MIN_GRADE, MAX_GRADE
+from logic.name_index import student_name_index
+from logic.student_profile import (
+    load_student_profile, get_cached_profile, store_profile, profile_generation
+)
+from logic.cache_invalidation import students_changed, grades_written
+from logic.achievements_logic import check_achievements, publish_unlocks, GRADES, ELO, XP
+from logic.ai_service import load_student_context, prompt_fingerprint
+from logic.ai_summaries import SUMMARY_PROMPT, load_summaries, generate_summary, summary_worker
+from pydantic import BaseModel, Field
+from utils.common import clean_student_name
+from utils.downsample import lttb_indices, minmax_last_indices
+from utils.pagination import encode_cursor, decode_cursor
 
 router = APIRouter()
 
@@ -48,6 +62,14 @@ class StudentSearchItem(BaseModel):
         from_attributes = True
 
 
+class AiSummaryOut(BaseModel):
+    student_id: int
+    summary: Optional[str] = None
+    fresh: bool  # False — сводки нет или контекст студента изменился с момента генерации
+    generated_at: Optional[datetime.datetime] = None
+    generation_ms: Optional[int] = None
+
+
 class StudentProfileFull(BaseModel):
     id: int
     full_name: str
@@ -61,6 +83,7 @@ class StudentProfileFull(BaseModel):
     stat_soc: int
     titles: List[TitleSchema] = []
     achievements: List[AchievementSchema] = []
+    ai_summary: Optional[AiSummaryOut] = None  # сохраненная сводка LLM, без генерации
 
     class Config:
         from_attributes = True
@@ -77,34 +100,53 @@ class XPGrant(BaseModel):
 class GradeCreate(BaseModel):
     student_id: int
     subject_name: str
-    score: int  # 2, 3, 4, 5
+    score: int = Field(ge=MIN_GRADE, le=MAX_GRADE)  # 2, 3, 4, 5
     is_exam: bool = False
 
 
+class GradeBatchItem(GradeCreate):
+    task_type: Optional[str] = None  # EXAM, TEST, HOMEWORK (по умолчанию из is_exam)
+    date: Optional[datetime.datetime] = None
+
+
+class GradeBatchCreate(BaseModel):
+    grades: List[GradeBatchItem]
+
+
 # --- ЭНДПОИНТЫ ---
 
 @router.get("/search", response_model=List[StudentSearchItem])
-async def search_students(q: str, db: AsyncSession = Depends(get_db)):
+async def search_students(q: str, limit: int = 10, db: AsyncSession = Depends(get_db)):
     if len(q) < 2:
         return []
 
-    query = select(Student).where(Student.full_name.ilike(f"%{q}%")).limit(10)
-    result = await db.execute(query)
-    students = result.scalars().all()
+    limit = max(1, min(limit, 50))
+    if student_name_index.ready:
+        return student_name_index.search(q, limit=limit)
+
+    # Индекс еще не построен (старт не завершен) — старый путь через ILIKE
+    query = (
+        select(Student.id, Student.full_name, Student.group_id, Group.name.label("group_name"))
+        .outerjoin(Group, Group.id == Student.group_id)
+        .where(Student.full_name.ilike(f"%{q}%"))
+        .limit(limit)
+    )
+    rows = (await db.execute(query)).all()
 
     return [
         StudentSearchItem(
-            id=s.id,
-            full_name=s.full_name.replace("тов. ", "").replace("г-н ", ""),
-            group_name=f"Group {s.group_id}",
+            id=r.id,
+            full_name=clean_student_name(r.full_name),
+            group_name=r.group_name or f"Group {r.group_id}",
         )
-        for s in students
+        for r in rows
     ]
 
 
 @router.post("/grade")
 async def add_grade(grade_data: GradeCreate, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Student).where(Student.id == grade_data.student_id))
+    # FOR UPDATE: новый рейтинг пишется абсолютным значением — параллельные записи ELO ждут
+    res = await db.execute(select(Student).where(Student.id == grade_data.student_id).with_for_update())
     student = res.scalar_one_or_none()
 
     if not student:
@@ -113,18 +155,21 @@ async def add_grade(grade_data: GradeCreate, db: AsyncSession = Depends(get_db))
     # Сохраняем оценку (100-балльная шкала)
     score_100 = grade_data.score * 20
 
+    task_type = resolve_task_type(None, grade_data.is_exam)
+
     new_grade = Grade(
         student_id=student.id,
         subject_name=grade_data.subject_name,
         score=score_100,
         date=datetime.datetime.now(),
-        is_exam=grade_data.is_exam
+        is_exam=grade_data.is_exam,
+        task_type=task_type,
     )
     db.add(new_grade)
+    await apply_grade_rollups(db, [(student.id, new_grade.subject_name, score_100, new_grade.date)])
 
     # РАСЧЕТ ELO
     current_elo = student.elo_rating if student.elo_rating else 1000
-    task_type = "EXAM" if grade_data.is_exam else "HOMEWORK"
     delta = calculate_academic_change(current_elo, grade_data.score, task_type=task_type)
 
     new_elo = current_elo + delta
@@ -140,80 +185,209 @@ async def add_grade(grade_data: GradeCreate, db: AsyncSession = Depends(get_db))
     )
     db.add(history_entry)
 
+    unlocked = await check_achievements(db, [student.id], GRADES, ELO)
     await db.commit()
+    grades_written(student.id)
+    publish_unlocks(unlocked)
 
     return {
         "status": "success",
         "new_elo": new_elo,
         "delta": delta,
+        "achievements_unlocked": [code for _, code in unlocked],
         "message": f"Оценка добавлена. Рейтинг изменен на {delta:+d}"
     }
 
 
-@router.get("/{student_id}/elo-history")
-async def get_elo_history(student_id: int, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(
-        select(EloHistory)
+@router.post("/grades/batch")
+async def add_grades_batch(batch: GradeBatchCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Пакетное выставление оценок (конец сессии): до MAX_BATCH_SIZE оценок за запрос.
+    """
+    if not batch.grades:
+        return {"status": "success", "accepted": 0, "students": 0, "missing_student_ids": [], "achievements_unlocked": []}
+    if len(batch.grades) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} grades)")
+
+    try:
+        items = [
+            {
+                "student_id": g.student_id,
+                "subject_name": g.subject_name,
+                "score": g.score,
+                "task_type": resolve_task_type(g.task_type, g.is_exam),
+                "date": g.date,
+            }
+            for g in batch.grades
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    result = await ingest_grades(db, items)
+    student_ids = {item["student_id"] for item in items}
+
+    # Роллапы уже закоммичены ingest_grades — проверка отдельной короткой транзакцией
+    unlocked = await check_achievements(db, student_ids, GRADES, ELO)
+    await db.commit()
+    grades_written(*student_ids)
+    publish_unlocks(unlocked)
+    return {
+        "status": "success", **result,
+        # Как у /grade, но студентов много — с id
+        "achievements_unlocked": [{"student_id": sid, "code": code} for sid, code in unlocked],
+    }
+
+
+ELO_HISTORY_COLUMNS = (
+    EloHistory.id,
+    EloHistory.student_id,
+    EloHistory.prev_rating,
+    EloHistory.new_rating,
+    EloHistory.change_amount,
+    EloHistory.reason,
+    EloHistory.created_at,
+)
+
+
+def _elo_history_candidates(student_id: int, buckets: int):
+    """
+    Предварительное прореживание в базе: история режется на buckets корзин по номеру точки,
+    из каждой уходят первая, последняя, min и max — в Python приходит не больше 4 * buckets строк.
+    """
+    numbered = (
+        select(
+            *ELO_HISTORY_COLUMNS,
+            func.row_number().over(order_by=(EloHistory.created_at, EloHistory.id)).label("rn"),
+            func.count().over().label("total"),
+        )
         .where(EloHistory.student_id == student_id)
-        .order_by(EloHistory.created_at.asc())
+        .subquery()
+    )
+    bucket = (numbered.c.rn - 1) * buckets // numbered.c.total
+    ranked = select(
+        numbered,
+        func.row_number().over(partition_by=bucket, order_by=numbered.c.rn).label("first_in_bucket"),
+        func.row_number().over(partition_by=bucket, order_by=numbered.c.rn.desc()).label("last_in_bucket"),
+        func.row_number().over(partition_by=bucket, order_by=(numbered.c.new_rating, numbered.c.rn)).label("min_in_bucket"),
+        func.row_number().over(
+            partition_by=bucket, order_by=(numbered.c.new_rating.desc(), numbered.c.rn)
+        ).label("max_in_bucket"),
+    ).subquery()
+    return (
+        select(*(ranked.c[c.key] for c in ELO_HISTORY_COLUMNS), ranked.c.total)
+        .where(or_(
+            ranked.c.first_in_bucket == 1, ranked.c.last_in_bucket == 1,
+            ranked.c.min_in_bucket == 1, ranked.c.max_in_bucket == 1,
+        ))
+        .order_by(ranked.c.rn)
     )
-    history = res.scalars().all()
-    return history
+
+
+@router.get("/{student_id}/elo-history")
+async def get_elo_history(
+        student_id: int,
+        response: Response,
+        limit: int = Query(500, ge=1, le=5000),
+        cursor: Optional[str] = None,
+        max_points: Optional[int] = Query(None, ge=10, le=5000),
+        mode: str = Query("lttb", pattern="^(lttb|minmax)$"),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    История ELO по возрастанию времени.
+    - Обычный режим: последние limit точек; X-Next-Cursor — страница более старых точек.
+    - max_points: вся история, прореженная до max_points точек (lttb или minmax);
+      базу покидают только кандидаты (_elo_history_candidates), а не вся история.
+    """
+    if max_points is not None:
+        rows = (await db.execute(_elo_history_candidates(student_id, max_points))).all()
+        response.headers["X-Total-Points"] = str(rows[0].total if rows else 0)
+        if len(rows) > max_points:
+            x = [r.created_at.timestamp() for r in rows]
+            y = [r.new_rating for r in rows]
+            pick = lttb_indices if mode == "lttb" else minmax_last_indices
+            rows = [rows[i] for i in pick(x, y, max_points)]
+        return [{c.key: r._mapping[c.key] for c in ELO_HISTORY_COLUMNS} for r in rows]
+
+    # Страница с конца (новые точки): клиенты без пагинации получают свежую историю
+    query = select(*ELO_HISTORY_COLUMNS).where(EloHistory.student_id == student_id)
+    if cursor:
+        before_at, before_id = decode_cursor(cursor)
+        query = query.where(tuple_(EloHistory.created_at, EloHistory.id) < tuple_(before_at, before_id))
+    res = await db.execute(query.order_by(EloHistory.created_at.desc(), EloHistory.id.desc()).limit(limit + 1))
+    rows = res.all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [r._asdict() for r in reversed(rows)]
 
 
 @router.get("/{student_id}", response_model=StudentProfileFull)
 async def get_student_profile(student_id: int, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Student).where(Student.id == student_id))
-    student = res.scalar_one_or_none()
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
+    cached = get_cached_profile(student_id)
+    if cached is not None:
+        return cached
 
-    res_g = await db.execute(select(Grade).where(Grade.student_id == student_id))
-    grades = res_g.scalars().all()
-    gpa = 0.0
-    if grades:
-        gpa = round(sum(g.score for g in grades) / len(grades) / 20, 2)
+    generation = profile_generation(student_id)
+    data = await load_student_profile(db, student_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Student not found")
 
-    clean_name = student.full_name.replace("тов. ", "").replace("г-н ", "")
+    earned_achievements = [
+        AchievementSchema(id=idx, code=code, title=code, xp_reward=0)
+        for idx, code in enumerate(data.pop("achievement_codes"))
+    ]
 
-    stmt_titles = (
-        select(TitleModel)
-        .join(StudentTitle, TitleModel.id == StudentTitle.title_id)
-        .where(StudentTitle.student_id == student_id)
+    # Сводку не генерируем: отдаем сохраненную, устаревшую — в очередь фоновой задачи
+    ai_summary = await _stored_summary(db, student_id, await load_student_context(db, student_id))
+    if not ai_summary.fresh:
+        summary_worker.request(student_id)
+
+    profile = StudentProfileFull(**data, achievements=earned_achievements, ai_summary=ai_summary)
+    store_profile(student_id, profile, generation)
+    return profile
+
+
+async def _stored_summary(db: AsyncSession, student_id: int, context: dict) -> AiSummaryOut:
+    """Сохраненная сводка студента; fresh — отпечаток совпадает с текущим контекстом."""
+    stored = (await load_summaries(db, [student_id])).get(student_id)
+    if stored is None:
+        return AiSummaryOut(student_id=student_id, fresh=False)
+    return AiSummaryOut(
+        student_id=student_id, summary=stored.summary,
+        fresh=stored.fingerprint == prompt_fingerprint(SUMMARY_PROMPT, context),
+        generated_at=stored.generated_at, generation_ms=stored.generation_ms,
     )
-    res_titles = await db.execute(stmt_titles)
-    db_titles = res_titles.scalars().all()
 
-    res_codes = await db.execute(
-        select(StudentAchievement.achievement_code)
-        .where(StudentAchievement.student_id == student_id)
-    )
 
-    earned_achievements = []
-    for idx, (code,) in enumerate(res_codes.all()):
-        if code:
-            earned_achievements.append(
-                AchievementSchema(
-                    id=idx,
-                    code=code,
-                    title=code,
-                    xp_reward=0
-                )
-            )
-
-    return StudentProfileFull(
-        id=student.id,
-        full_name=clean_name,
-        group_name=f"Group {student.group_id}",
-        status=student.status,
-        risk_score=student.risk_score,
-        gpa=gpa,
-        elo_rating=student.elo_rating or 1000,
-        stat_int=student.stat_int,
-        stat_sta=student.stat_sta,
-        stat_soc=student.stat_soc,
-        titles=db_titles,
-        achievements=earned_achievements
+@router.get("/{student_id}/ai-summary", response_model=AiSummaryOut)
+async def get_student_ai_summary(student_id: int, wait: bool = True, db: AsyncSession = Depends(get_db)):
+    """
+    Сводка LLM по студенту. Актуальная (отпечаток контекста совпадает) отдается сразу.
+    Устаревшая: wait=true — перегенерировать сейчас (интерактивный приоритет),
+    wait=false — вернуть что есть и поставить студента в очередь фоновой задачи.
+    """
+    context = await load_student_context(db, student_id)
+    if context is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    stored = await _stored_summary(db, student_id, context)
+    if stored.fresh:
+        return stored
+    if not wait:
+        summary_worker.request(student_id)
+        return stored
+
+    # Пока модель думает (до минуты-двух), соединение из пула не держим:
+    # запрос отпускает сессию, запись — в своей, как у SummaryWorker
+    await db.close()
+    async with AsyncSessionLocal() as session:
+        result = await generate_summary(session, student_id, context)
+    if result is None:
+        raise HTTPException(status_code=503, detail="AI service unavailable")
+    return AiSummaryOut(
+        student_id=student_id, summary=result["summary"], fresh=True,
+        generated_at=result["generated_at"], generation_ms=result["generation_ms"],
     )
 
 
@@ -246,6 +420,7 @@ async def grant_title(
     )
     db.add(new_student_title)
     await db.commit()
+    students_changed(student_id)
     return {"status": "success", "message": f"Title '{title_obj.name}' granted"}
 
 
@@ -254,6 +429,7 @@ async def revoke_titles(student_id: int, db: AsyncSession = Depends(get_db)):
     stmt = delete(StudentTitle).where(StudentTitle.student_id == student_id)
     await db.execute(stmt)
     await db.commit()
+    students_changed(student_id)
     return {"status": "success", "message": "All titles revoked"}
 
 
@@ -268,7 +444,10 @@ async def modify_xp(
     if student:
         points_to_add = xp_data.amount // 100
         student.stat_int = min(100, student.stat_int + points_to_add)
+        unlocked = await check_achievements(db, [student_id], XP)
         await db.commit()
+        students_changed(student_id)
+        publish_unlocks(unlocked)
         return {
             "status": "success",
             "message": f"XP applied. Intelligence increased by {points_to_add}",
@@ -280,6 +459,43 @@ class EloModifyRequest(BaseModel):
     change: int  # Может быть +10, -5, и т.д.
     reason: str = "Manual adjustment by admin"
 
+
+class EloBulkItem(BaseModel):
+    student_id: int
+    change: int
+
+
+class EloBulkModifyRequest(BaseModel):
+    changes: List[EloBulkItem]
+    reason: str = "Bulk adjustment by admin"
+
+
+@router.post("/modify-elo/bulk")
+async def modify_elo_bulk(data: EloBulkModifyRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Массовое изменение ELO: один UPDATE + запись истории одним запросом.
+    """
+    changes: dict[int, int] = {}
+    for item in data.changes:
+        changes[item.student_id] = changes.get(item.student_id, 0) + item.change
+
+    updated = await adjust_elo_bulk(db, changes, data.reason)
+    unlocked = await check_achievements(db, updated, ELO)
+    await db.commit()
+    students_changed(*updated)
+    publish_unlocks(unlocked)
+
+    return {
+        "status": "success",
+        "updated": len(updated),
+        "missing_student_ids": sorted(changes.keys() - updated.keys()),
+        "results": [
+            {"student_id": sid, "old_elo": old, "new_elo": new}
+            for sid, (old, new) in updated.items()
+        ],
+    }
+
+
 @router.post("/{student_id}/modify-elo")
 async def modify_elo(
         student_id: int,
@@ -288,27 +504,21 @@ async def modify_elo(
 ):
     """
     Ручное изменение ELO рейтинга студента (для админ-панели).
+    Атомарно: UPDATE ... RETURNING и запись EloHistory в одном запросе.
     """
-    # 1. Найти студента
-    stmt = select(Student).where(Student.id == student_id)
-    res = await db.execute(stmt)
-    student = res.scalar_one_or_none()
-
-    if not student:
+    result = await adjust_elo(db, student_id, data.change, data.reason)
+    if result is None:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    # 2. Изменить ELO
-    old_elo = student.elo_rating
-    student.elo_rating += data.change
-
-    # 3. Логировать изменение (опционально, если у тебя есть таблица истории)
-    # Если нет — можешь закомментировать или создать модель EloHistory
-
+    unlocked = await check_achievements(db, [student_id], ELO)
     await db.commit()
+    students_changed(student_id)
+    publish_unlocks(unlocked)
 
+    old_elo, new_elo = result
     return {
         "status": "success",
-        "message": f"ELO изменен: {old_elo} → {student.elo_rating} ({data.change:+d})",
+        "message": f"ELO изменен: {old_elo} → {new_elo} ({data.change:+d})",
         "old_elo": old_elo,
-        "new_elo": student.elo_rating
+        "new_elo": new_elo
     }
@@ -0,0 +1,32 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# Отложенные до commit обновления in-memory индексов (таблица лидеров, поиск по ФИО).
+# ORM-события и Core UPDATE срабатывают на flush, а транзакция еще может откатиться:
+# колбэки копятся в session.info и выполняются после commit, при откате выбрасываются.
+_KEY = "after_commit_callbacks"
+
+
+def on_commit(session: Session | AsyncSession, fn, *args):
+    """Вызвать fn(*args) после commit текущей транзакции сессии (при откате — не вызывать)."""
+    if isinstance(session, AsyncSession):
+        session = session.sync_session
+    session.info.setdefault(_KEY, []).append((fn, args))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_callbacks(session: Session):
+    for fn, args in session.info.pop(_KEY, ()):
+        try:
+            fn(*args)
+        except Exception as e:
+            # Данные уже в базе: ошибку индекса не превращаем в ошибку запроса, догонит ресинк
+            print(f"⚠ After-commit hook {getattr(fn, '__qualname__', fn)} failed: {e}")
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_callbacks(session: Session, transaction):
+    # Корневая транзакция закончилась без commit (rollback, close) — изменений в базе нет
+    if transaction.parent is None:
+        session.info.pop(_KEY, None)
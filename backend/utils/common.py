@@ -13,3 +13,7 @@ def format_risk_score(score: float) -> str:
     elif score > 0.4:
         return f"Warning ({percent}%)"
     return f"Normal ({percent}%)"
+
+def clean_student_name(full_name: str) -> str:
+    """Убирает служебные обращения ('тов. ', 'г-н ') из ФИО"""
+    return full_name.replace("тов. ", "").replace("г-н ", "")
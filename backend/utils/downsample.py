@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: индексы n_out точек, сохраняющих форму графика.
+    x должен быть отсортирован по возрастанию. Первая и последняя точки всегда в выборке.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.size
+    if n <= n_out:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:max(n_out, 0)], dtype=np.int64)
+
+    # Внутренние точки делим на n_out - 2 корзины
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Следующая корзина (для последней — последняя точка) дает опорную среднюю точку
+        if i + 2 < len(edges):
+            nxt = slice(edges[i + 1], edges[i + 2])
+        else:
+            nxt = slice(n - 1, n)
+        avg_x, avg_y = x[nxt].mean(), y[nxt].mean()
+
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[prev] - avg_x) * (by - y[prev]) - (x[prev] - bx) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+
+    return selected
+
+
+def minmax_last_indices(x, y, n_out: int) -> np.ndarray:
+    """
+    Временные корзины: из каждой берем min, max и последнюю точку (n_out // 3 корзин).
+    Дешевле LTTB и не теряет выбросы.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.size
+    if n <= n_out:
+        return np.arange(n)
+
+    n_buckets = max(1, n_out // 3)
+    bucket = np.minimum(((x - x[0]) / max(x[-1] - x[0], 1e-9) * n_buckets).astype(np.int64), n_buckets - 1)
+    bounds = np.flatnonzero(np.diff(bucket)) + 1
+    picked = set()
+    for chunk in np.split(np.arange(n), bounds):
+        values = y[chunk]
+        picked.update((int(chunk[np.argmin(values)]), int(chunk[np.argmax(values)]), int(chunk[-1])))
+    return np.array(sorted(picked), dtype=np.int64)
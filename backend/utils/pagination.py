@@ -0,0 +1,18 @@
+import base64
+import datetime
+
+from fastapi import HTTPException
+
+
+def encode_cursor(created_at: datetime.datetime, row_id: int) -> str:
+    """Курсор keyset-пагинации по (created_at, id) — непрозрачная строка для клиента."""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
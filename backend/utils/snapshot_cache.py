@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+
+class SnapshotCache:
+    """
+    Один закэшированный снимок с TTL и single-flight обновлением:
+    сколько бы запросов ни пришло за протухшим снимком, loader выполнится один раз.
+    invalidate() помечает снимок устаревшим; результат загрузки, начатой
+    до инвалидации, отдается ожидающим, но в кэш не попадает.
+    """
+
+    def __init__(self, loader, ttl: float):
+        self._loader = loader  # async () -> value, открывает свою сессию
+        self.ttl = ttl
+        self._value = None
+        self._stored_at: float | None = None
+        self._generation = 0
+        self._inflight: asyncio.Future | None = None
+        self.hits = 0
+        self.loads = 0
+
+    def age(self) -> float | None:
+        if self._stored_at is None:
+            return None
+        return time.monotonic() - self._stored_at
+
+    async def get(self):
+        age = self.age()
+        if age is not None and age < self.ttl:
+            self.hits += 1
+            return self._value
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        # shield: отмена одного клиента не отменяет общую загрузку
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self):
+        generation = self._generation
+        try:
+            value = await self._loader()
+            self.loads += 1
+        finally:
+            self._inflight = None
+        if generation == self._generation:
+            self._value, self._stored_at = value, time.monotonic()
+        return value
+
+    def invalidate(self):
+        self._generation += 1
+        self._stored_at = None
@@ -0,0 +1,16 @@
+from sqlalchemy import func, bindparam, column
+from sqlalchemy.dialects.postgresql import ARRAY
+
+
+def unnest_table(name: str, **columns: tuple[type, list]):
+    """
+    Табличное выражение unnest(:a::T[], :b::T[]) AS name(a, b).
+    Любое число строк уходит двумя-тремя параметрами-массивами,
+    так что set-based UPDATE не упирается в лимит bind-параметров.
+    """
+    arrays = [
+        bindparam(f"{name}_{col}", value=list(values), type_=ARRAY(col_type))
+        for col, (col_type, values) in columns.items()
+    ]
+    cols = [column(col, col_type) for col, (col_type, _) in columns.items()]
+    return func.unnest(*arrays).table_valued(*cols).render_derived(name=name)
@@ -89,7 +89,7 @@ function StudentProfilePage() {
             .then(data => {
                 setStudent(data);
                 // 2. Загрузка истории (или фейк, если пусто)
-                fetch(`http://localhost:8000/api/students/${id}/elo-history`)
+                fetch(`http://localhost:8000/api/students/${id}/elo-history?max_points=300`)
                     .then(res => res.json())
                     .then(hist => {
                         if (Array.isArray(hist) && hist.length > 0) {
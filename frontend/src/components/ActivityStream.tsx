@@ -1,9 +1,9 @@
 import { useState, useEffect } from 'react';
-import { Radio, Activity, Database, Shield, FileCode } from 'lucide-react';
+import { Radio, Activity, Database, Shield, FileCode, Trophy } from 'lucide-react';
 
 // Тип события
 interface LogEvent {
-    id: number;
+    id: number | string;
     type: string;
     message: string;
     severity: string;
@@ -24,6 +24,19 @@ export function ActivityStream() {
             if (data.type === "new_activity") {
                 setLogs(prev => [data.payload, ...prev].slice(0, 10)); // Храним только последние 10
             }
+
+            // Студент получил ачивку (оценка, ELO или XP)
+            if (data.type === "achievement_unlocked") {
+                const { student_id, code, message, time } = data.payload;
+                const unlock: LogEvent = {
+                    id: `ach-${student_id}-${code}`,
+                    type: 'ACHIEVEMENT',
+                    message,
+                    severity: 'SUCCESS',
+                    time,
+                };
+                setLogs(prev => [unlock, ...prev].slice(0, 10));
+            }
         };
 
         return () => socket.close();
@@ -36,6 +49,7 @@ export function ActivityStream() {
             case 'SUBMISSION': return <FileCode size={14} />;
             case 'ACCESS': return <Shield size={14} />;
             case 'SYSTEM': return <Database size={14} />;
+            case 'ACHIEVEMENT': return <Trophy size={14} />;
             default: return <Radio size={14} />;
         }
     }
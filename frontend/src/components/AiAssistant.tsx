@@ -1,4 +1,4 @@
-import { useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { Send, Cpu, BrainCircuit } from 'lucide-react';
 import { motion } from 'framer-motion';
 
@@ -13,6 +13,18 @@ export function AiAssistant() {
     ]);
     const [input, setInput] = useState('');
     const [isLoading, setIsLoading] = useState(false);
+    // Ответ уже печатается: спиннер скрыт, но ввод заблокирован до конца стрима
+    const [isStreaming, setIsStreaming] = useState(false);
+
+    // Текущий стрим: прерываем при размонтировании, чтобы бэкенд остановил генерацию
+    const abortRef = useRef<AbortController | null>(null);
+    useEffect(() => () => abortRef.current?.abort(), []);
+
+    const appendToLast = (chunk: string) =>
+        setMessages(prev => {
+            const last = prev[prev.length - 1];
+            return [...prev.slice(0, -1), { ...last, text: last.text + chunk }];
+        });
 
     const handleSend = async () => {
         if (!input.trim() || isLoading) return;
@@ -24,9 +36,13 @@ export function AiAssistant() {
         setMessages(prev => [...prev, { from: 'user', text: userText }]);
         setIsLoading(true);
 
+        const controller = new AbortController();
+        abortRef.current = controller;
+        let started = false;
+
         try {
-            // ВАЖНО: эндпоинт совпадает с /api/analytics/ask-ai из backend/analytics.py
-            const res = await fetch('http://localhost:8000/api/analytics/ask-ai', {
+            // Стриминг: /api/analytics/ask-ai/stream отдает SSE (event: token / done / error)
+            const res = await fetch('http://localhost:8000/api/analytics/ask-ai/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -34,20 +50,53 @@ export function AiAssistant() {
                 body: JSON.stringify({
                     message: userText,
                     student_id: null   // можешь передавать ID студента, если нужно
-                })
+                }),
+                signal: controller.signal
             });
 
-            if (!res.ok) {
+            if (!res.ok || !res.body) {
                 throw new Error(`HTTP ${res.status}`);
             }
 
-            const data = await res.json();
-            const aiText: string =
-                data.response ||
-                'Аномалия в канале: ядро вернуло пустой вектор ответа.';
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // SSE-события разделены пустой строкой
+                let sep;
+                while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                    const raw = buffer.slice(0, sep);
+                    buffer = buffer.slice(sep + 2);
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = raw.match(/^data: (.*)$/m)?.[1];
+                    if (!event || !data) continue;
 
-            setMessages(prev => [...prev, { from: 'ai', text: aiText }]);
+                    const payload = JSON.parse(data);
+                    if (event === 'token' || event === 'error') {
+                        if (!started) {
+                            // Первый токен: вместо спиннера — сообщение, которое дальше дописываем
+                            started = true;
+                            setIsStreaming(true);
+                            setMessages(prev => [...prev, { from: 'ai', text: '' }]);
+                        }
+                        appendToLast(payload.text);
+                    }
+                }
+            }
+
+            if (!started) {
+                setMessages(prev => [
+                    ...prev,
+                    { from: 'ai', text: 'Аномалия в канале: ядро вернуло пустой вектор ответа.' }
+                ]);
+            }
         } catch (e) {
+            if (controller.signal.aborted) return;
             console.error(e);
             setMessages(prev => [
                 ...prev,
@@ -58,6 +107,8 @@ export function AiAssistant() {
                 }
             ]);
         } finally {
+            if (abortRef.current === controller) abortRef.current = null;
+            setIsStreaming(false);
             setIsLoading(false);
         }
     };
@@ -104,7 +155,7 @@ export function AiAssistant() {
                         </div>
                     </motion.div>
                 ))}
-                {isLoading && (
+                {isLoading && !isStreaming && (
                     <motion.div
                         className="flex items-start gap-3 text-xs"
                         initial={{ opacity: 0 }}
@@ -14,7 +14,7 @@ export function EloTimeline({ studentId }: { studentId: number }) {
     const [history, setHistory] = useState<EloHistoryItem[]>([]);
 
     useEffect(() => {
-        fetch(`http://localhost:8000/api/students/${studentId}/elo-history`)
+        fetch(`http://localhost:8000/api/students/${studentId}/elo-history?max_points=300`)
             .then(res => res.json())
             .then(setHistory)
             .catch(console.error);
@@ -1,5 +1,11 @@
 import { useEffect, useRef, useState } from 'react';
 
+interface GraphLink {
+  id: number;
+  weight: number;
+  kind: 'group' | 'similar';
+}
+
 interface GraphNode {
   id: number;
   x: number;
@@ -10,6 +16,7 @@ interface GraphNode {
   size: number;
   full_name: string;
   group_name: string;
+  links: GraphLink[];
 }
 
 export function SocialGraph() {
@@ -69,14 +76,16 @@ export function SocialGraph() {
           vx: (Math.random() - 0.5) * 0.8,
           vy: (Math.random() - 0.5) * 0.8,
           group: groupIndex,
-          size: 3,
+          size: s.is_group ? 3 + Math.sqrt(s.size || 1) : 3,
           full_name: s.full_name,
           group_name: s.group_name,
+          links: s.links || [],
         });
       });
     }
 
     const colors = groups.map(g => g.color);
+    const nodesById = new Map(nodesRef.current.map(n => [n.id, n]));
     let animationId: number;
 
     const animate = () => {
@@ -92,27 +101,34 @@ export function SocialGraph() {
             if (node.y <= 5 || node.y >= canvas.height - 5) node.vy *= -1;
         });
 
-        // 2. Рисуем связи (линии)
+        // 2. Рисуем связи (линии) из графа, посчитанного на бэкенде
         ctx.lineWidth = 0.5;
-        for (let i = 0; i < nodesRef.current.length; i++) {
-            for (let j = i + 1; j < nodesRef.current.length; j++) {
-                const nodeA = nodesRef.current[i];
-                const nodeB = nodesRef.current[j];
+        nodesRef.current.forEach(nodeA => {
+            nodeA.links.forEach(link => {
+                // Каждую связь рисуем один раз; концы за пределами страницы пропускаем
+                if (link.id <= nodeA.id) return;
+                const nodeB = nodesById.get(link.id);
+                if (!nodeB) return;
                 const dx = nodeA.x - nodeB.x;
                 const dy = nodeA.y - nodeB.y;
                 const dist = Math.sqrt(dx*dx + dy*dy);
 
-                // Рисуем линию, если точки рядом и из одной группы (или можно убрать проверку группы для красоты)
-                if (dist < 100 && nodeA.group === nodeB.group) {
+                if (link.kind === 'group') {
+                    // Одногруппники: только ближние, иначе клика группы закроет весь холст
+                    if (dist >= 100) return;
                     ctx.strokeStyle = colors[nodeA.group];
                     ctx.globalAlpha = 1 - dist / 100; // Чем дальше, тем прозрачнее
-                    ctx.beginPath();
-                    ctx.moveTo(nodeA.x, nodeA.y);
-                    ctx.lineTo(nodeB.x, nodeB.y);
-                    ctx.stroke();
+                } else {
+                    // Похожая успеваемость: всегда, яркость по силе сходства
+                    ctx.strokeStyle = '#ffffff';
+                    ctx.globalAlpha = Math.min(1, 0.15 + 0.5 * link.weight);
                 }
-            }
-        }
+                ctx.beginPath();
+                ctx.moveTo(nodeA.x, nodeA.y);
+                ctx.lineTo(nodeB.x, nodeB.y);
+                ctx.stroke();
+            });
+        });
         ctx.globalAlpha = 1;
 
         // 3. Рисуем узлы (точки)